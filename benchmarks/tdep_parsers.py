@@ -0,0 +1,387 @@
+"""Benchmarks of the `tdep_utils` readers on synthetic TDEP outputs.
+
+Generates `extract_forceconstants` logs, `infile.ssposcar`,
+`outfile.dispersion_relations`, `outfile.thermal_conductivity` files
+and trees of action directories at several scales (up to 1 GiB logs
+and 1e4 directories), then measures every reader on them: the
+`grep`/`awk` pipelines of `tdep_utils` as a baseline, the in-process
+`tdep_reports` parsers and the cached `numpy` readers.
+
+    python -m benchmarks.tdep_parsers --scale tiny --scale small
+    python -m benchmarks.tdep_parsers --scale large --only "log"
+    python -m benchmarks.tdep_parsers --compare 0.1.0
+
+Each reader runs in a forked process (Linux) after a warm-up call, so
+the page cache is hot and the sidecar caches are built: the median
+latency, the throughput, the peak of the memory traced by tracemalloc
+and the peak RSS of the child commands are measured in isolation.
+The results are appended to `results.jsonl` next to this script, with
+the version, commit and environment, for comparisons across versions.
+Generated inputs are kept in the `--workdir` for later runs.
+"""
+
+import itertools
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from plumbum import cli, local
+
+from teff_py import tdep_reports, tdep_utils
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# sizes of the synthetic inputs: log bytes, fcc supercell repetitions,
+# q-points of the dispersions, temperatures, action directories
+SCALES = {
+    "tiny": dict(log=64 << 10, cells=2, qpoints=100, temperatures=10,
+                 dirs=10),
+    "small": dict(log=16 << 20, cells=4, qpoints=10**4, temperatures=100,
+                  dirs=100),
+    "medium": dict(log=256 << 20, cells=8, qpoints=10**5, temperatures=1000,
+                   dirs=1000),
+    "large": dict(log=1 << 30, cells=12, qpoints=10**6, temperatures=10**4,
+                  dirs=10**4),
+}
+
+REPORT = """\
+REPORT GRADE OF OVERDETERMINATION (1 is exactly determined)
+   Number of forceconstants up 2. order:     12    equations:   1200   ratio:   100.000
+   Number of forceconstants up 3. order:     40    equations:   1200   ratio:    30.000
+ Interactions:
+   firstorder forceconstant:  0  0
+   secondorder forceconstant:  5  12
+   thirdorder forceconstant:  4  28
+   fourthorder forceconstant:  0  0
+ R^2 of the fit:
+   second order:   0.99876
+   third order:    0.87654
+ elastic constants (GPa):
+  110.0  60.0  60.0   0.0   0.0   0.0
+   60.0 110.0  60.0   0.0   0.0   0.0
+   60.0  60.0 110.0   0.0   0.0   0.0
+    0.0   0.0   0.0  30.0   0.0   0.0
+    0.0   0.0   0.0   0.0  30.0   0.0
+    0.0   0.0   0.0   0.0   0.0  30.0
+"""
+
+
+# ## synthetic inputs
+
+def write_fc_log(fname, size):
+    """`extract_forceconstants` log of about `size` bytes: solver
+    progress lines, then the final report."""
+    rng = np.random.default_rng(0)
+    lines = [" iteration %8d  residual %.8E  step %.6E  ... %s\n" % (
+                 i, r, s, "symmetry reduced" if i % 7 else "rebuilding")
+             for i, (r, s) in enumerate(rng.random((10000, 2)))]
+    block = "".join(lines)
+    header = " ... reading unitcell, supercell and force-displacements\n"
+    with open(fname, "w") as f:
+        f.write(header)
+        remaining = size - len(header) - len(REPORT)
+        while remaining >= len(block):
+            f.write(block)
+            remaining -= len(block)
+        # the rest line by line, all of it for logs smaller than a block
+        for line in lines:
+            if len(line) > remaining:
+                break
+            f.write(line)
+            remaining -= len(line)
+        f.write(REPORT)
+
+
+def write_ssposcar(fname, cells, alat=4.05):
+    "Cubic fcc supercell of `cells`^3 unit cells, 4 * `cells`^3 atoms."
+    basis = [(0, 0, 0), (0, .5, .5), (.5, 0, .5), (.5, .5, 0)]
+    coords = [((i + b[0]) / cells, (j + b[1]) / cells, (k + b[2]) / cells)
+              for i, j, k in itertools.product(range(cells), repeat=3)
+              for b in basis]
+    with open(fname, "w") as f:
+        f.write("fcc Al supercell\n%.8f\n" % alat)
+        for row in np.eye(3) * cells:
+            f.write("%.8f %.8f %.8f\n" % tuple(row))
+        f.write("Al\n%d\nDirect coordinates\n" % len(coords))
+        for c in coords:
+            f.write("%.10f %.10f %.10f Al\n" % c)
+
+
+def write_table(fname, rows, columns, header):
+    "Table of `rows` x `columns` random floats with a comment `header`."
+    rng = np.random.default_rng(0)
+    with open(fname, "w") as f:
+        f.write("# %s\n" % header)
+        for i in range(0, rows, 10000):
+            chunk = rng.random((min(10000, rows - i), columns)) * 10
+            np.savetxt(f, chunk, fmt="%16.8E")
+
+
+def write_dispersion_relations(fname, qpoints, branches=12):
+    write_table(fname, qpoints, 1 + branches, "q-path, frequencies")
+
+
+def write_thermal_conductivity(fname, temperatures):
+    write_table(fname, temperatures, 10, "T kxx kxy kxz kyx kyy kyz kzx kzy kzz")
+
+
+def write_action_dirs(root, dirs):
+    "`dirs` action directories with a short log and a conductivity table."
+    os.makedirs(root, exist_ok=True)
+    for n in range(dirs):
+        path = os.path.join(root, "forceconstants_%05d" % n)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "out.log"), "w") as f:
+            f.write(" ... solving for forceconstants\n" + REPORT)
+        with open(os.path.join(path, "outfile.thermal_conductivity"),
+                  "w") as f:
+            f.write("# T kxx kyy\n300.0 236.5 236.5\n")
+
+
+def generate(workdir, scale):
+    """Inputs of `scale` in `workdir`/`scale`, made once.
+
+    Result: {input kind: path}"""
+    sizes = SCALES[scale]
+    base = os.path.join(workdir, scale)
+    os.makedirs(base, exist_ok=True)
+    inputs = {
+        "log": (os.path.join(base, "out.log"),
+                lambda f: write_fc_log(f, sizes["log"])),
+        "ssposcar": (os.path.join(base, "infile.ssposcar"),
+                     lambda f: write_ssposcar(f, sizes["cells"])),
+        "dispersion": (os.path.join(base, "outfile.dispersion_relations"),
+                       lambda f: write_dispersion_relations(
+                           f, sizes["qpoints"])),
+        "conductivity": (os.path.join(base, "outfile.thermal_conductivity"),
+                         lambda f: write_thermal_conductivity(
+                             f, sizes["temperatures"])),
+        "dirs": (os.path.join(base, "actions"),
+                 lambda f: write_action_dirs(f, sizes["dirs"])),
+    }
+    paths = {}
+    for kind, (path, write) in inputs.items():
+        done = os.path.join(base, ".%s.done" % kind)
+        if not os.path.exists(done):    # else complete from a former run
+            write(path)
+            open(done, "w").close()
+        paths[kind] = path
+    return paths
+
+
+# ## readers
+
+def read_log_reports(fname):
+    "All the reports of a log with the in-process parsers."
+    lines = tdep_reports._read_lines(fname)
+    return (tdep_reports.parse_overdetermination_report(lines),
+            tdep_reports.parse_r_squared(lines),
+            tdep_reports.parse_interactions(lines),
+            tdep_reports.parse_elastic_constants(lines))
+
+
+def read_all(read):
+    "`read` with the data read through, memory maps included."
+    return lambda fname: float(np.sum(read(fname)))
+
+
+# input kind -> [(reader name, reader)]
+READERS = {
+    "log": [
+        ("get_overdetermination_report",
+         tdep_utils.get_overdetermination_report),
+        ("get_r_squared", tdep_utils.get_r_squared),
+        ("get_interactions", tdep_utils.get_interactions),
+        ("get_elastic_constants", tdep_utils.get_elastic_constants),
+        ("tdep_reports.parse_*", read_log_reports),
+    ],
+    "ssposcar": [
+        ("get_rcmax", tdep_utils.get_rcmax),
+        ("read_ssposcar", tdep_utils.read_ssposcar),
+        ("get_shell_radii", tdep_utils.get_shell_radii),
+    ],
+    "dispersion": [
+        ("read_dispersion_relations(cache=False)", read_all(
+            lambda f: tdep_utils.read_dispersion_relations(f, cache=False))),
+        ("read_dispersion_relations", read_all(
+            tdep_utils.read_dispersion_relations)),
+    ],
+    "conductivity": [
+        ("read_thermal_conductivity(cache=False)", read_all(
+            lambda f: tdep_utils.read_thermal_conductivity(f, cache=False))),
+        ("read_thermal_conductivity", read_all(
+            tdep_utils.read_thermal_conductivity)),
+        ("tdep_reports.parse_table", lambda f: tdep_reports.parse_table(
+            tdep_reports._read_lines(f))),
+    ],
+    "dirs": [
+        ("collect_reports(max_workers=1)", lambda root: tdep_utils
+         .collect_reports(os.path.join(root, "*"), max_workers=1)),
+        ("collect_reports", lambda root: tdep_utils.collect_reports(
+            os.path.join(root, "*"))),
+    ],
+}
+
+
+def input_size(path):
+    "Bytes and number of files of the input `path`."
+    if os.path.isfile(path):
+        return os.path.getsize(path), 1
+    size = files = 0
+    for dirpath, _, fnames in os.walk(path):
+        for fname in fnames:
+            if not fname.startswith("."):   # sidecar caches
+                size += os.path.getsize(os.path.join(dirpath, fname))
+                files += 1
+    return size, files
+
+
+def _measure(read, path, repeat):
+    read(path)              # warm-up: page cache, imports, sidecars
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read(path)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    read(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"median": statistics.median(times), "min": min(times),
+            "peak_memory": peak, "children_max_rss": children * 1024}
+
+
+def measure(read, path, repeat=3):
+    "Timings and memory of `read(path)`, in a forked process."
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:                # child
+        os.close(r)
+        try:
+            result = _measure(read, path, repeat)
+        except Exception as e:
+            result = {"error": "%s: %s" % (type(e).__name__, e)}
+        with os.fdopen(w, "w") as f:
+            json.dump(result, f)
+        os._exit(0)
+
+    os.close(w)
+    with os.fdopen(r) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data) if data else {"error": "benchmark process died"}
+
+
+# ## results
+
+def environment():
+    "Version, commit and platform of the benchmarked tree."
+    try:
+        from importlib.metadata import version
+        teff_version = version("teff-py")
+    except Exception:
+        teff_version = None
+    with local.cwd(HERE):
+        status, commit, _ = local["git"]["describe", "--always",
+                                         "--dirty"].run(retcode=None)
+    return {"version": teff_version,
+            "commit": commit.strip() if status == 0 else None,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "host": platform.node()}
+
+
+def load_results(fname):
+    if not os.path.exists(fname):
+        return []
+    with open(fname) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(records, baseline, current):
+    """Text table of the `current` records against the latest ones of
+    `baseline` (a version or commit) among `records`."""
+    reference = {}
+    for rec in records:
+        if baseline in (rec.get("version"), rec.get("commit")) and \
+           "median" in rec:
+            reference[rec["reader"], rec["scale"]] = rec
+    lines = ["%-40s %-7s %10s %10s %7s" % ("reader", "scale", "baseline",
+                                          "current", "ratio")]
+    for rec in current:
+        ref = reference.get((rec["reader"], rec["scale"]))
+        if ref is None or "median" not in rec:
+            continue
+        lines.append("%-40s %-7s %9.4fs %9.4fs %6.2fx" % (
+            rec["reader"], rec["scale"], ref["median"], rec["median"],
+            rec["median"] / ref["median"]))
+    return "\n".join(lines)
+
+
+class Benchmarks(cli.Application):
+    "Benchmarks of the `tdep_utils` readers on synthetic TDEP outputs."
+
+    scales = cli.SwitchAttr("--scale", cli.Set(*SCALES), list=True,
+                            help="Input scales, tiny and small by default")
+    only = cli.SwitchAttr("--only", str, default=None,
+                          help="Regex of the input kinds and readers to run")
+    repeat = cli.SwitchAttr("--repeat", int, default=3,
+                            help="Timed calls per reader")
+    workdir = cli.SwitchAttr(
+        "--workdir", str,
+        default=os.path.join(tempfile.gettempdir(), "teff-benchmarks"),
+        help="Directory of the generated inputs")
+    output = cli.SwitchAttr("--output", str,
+                            default=os.path.join(HERE, "results.jsonl"),
+                            help="JSON-lines file the results are added to")
+    baseline = cli.SwitchAttr("--compare", str, default=None,
+                              help="Version or commit to compare with")
+
+    def main(self):
+        env = dict(environment(), time=time.time())
+        records = []
+        print("%-40s %-7s %10s %10s %12s %12s" % (
+            "reader", "scale", "median", "MB/s", "peak memory", "child RSS"))
+        for scale in self.scales or ["tiny", "small"]:
+            inputs = generate(self.workdir, scale)
+            for kind, readers in READERS.items():
+                size, files = input_size(inputs[kind])
+                for name, read in readers:
+                    if self.only and not re.search(self.only,
+                                                   kind + " " + name):
+                        continue
+                    result = measure(read, inputs[kind], self.repeat)
+                    rec = dict(env, input=kind, reader=name, scale=scale,
+                               bytes=size, files=files, **result)
+                    if "error" in result:
+                        print("%-40s %-7s %s" % (name, scale, result["error"]))
+                    else:
+                        rec["throughput"] = size / result["median"]
+                        print("%-40s %-7s %9.4fs %10.1f %11.1fM %11.1fM" % (
+                            name, scale, result["median"],
+                            rec["throughput"] / 1e6,
+                            result["peak_memory"] / 1e6,
+                            result["children_max_rss"] / 1e6))
+                    records.append(rec)
+
+        past = load_results(self.output)
+        with open(self.output, "a") as f:
+            for rec in records:
+                f.write(json.dumps(rec) + "\n")
+
+        if self.baseline is not None:
+            print(compare(past, self.baseline, records))
+
+
+if __name__ == "__main__":
+    Benchmarks.run()
@@ -155,6 +155,8 @@ class FCs(Action):
 class TC(Action):
     command = local["thermal_conductivity"]  # this executable should be visible in $PATH
     num_mpi_procs = 16
+    # files of the parent action `prepare` links to
+    parent_files = ["infile.ucposcar", "outfile.forceconstant*"]
 
     def make_args_list(self):
         # We expect to receive a source collection like: {"qg": 16}
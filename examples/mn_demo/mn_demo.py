@@ -9,48 +9,21 @@ from plumbum.machines.paramiko_machine import ParamikoMachine
 from plumbum.path.utils import copy
 from plumbum import local, cli
 
-from ase import Atoms
-from ase.io import read
-from numpy import sort, unique
-
-from teff_py.actions import Action, State, ShellCommandRunner
-from teff_py.async_actions import SlurmScheduledAction
+from teff_py.accounting import AccountingLog
+from teff_py.actions import Action, State, ShellCommandRunner, add_listener
+from teff_py.async_actions import SlurmScheduledAction, upload_scripts
+from teff_py.metrics import Metrics
+from teff_py.monitor import ProgressMonitor
+from teff_py.planning import plan
+from teff_py.profiling import Profiler
 from teff_py.plumbum_wrappers import hpc_wrapper
-from teff_py.tdep_utils import get_rcmax, get_overdetermination_report, get_r_squared
-
-import numpy as np
-from numpy import sort, unique
-
-
-def find_max_rc2(distances):
-    thr = 1e-3                      # threshold to add to the cutoff
-    half_distance = distances[-1] * 0.5 + thr
-    i_rc2 = 1
-    while distances[i_rc2] < half_distance:
-        i_rc2 += 1
-
-    return i_rc2
+from teff_py.remote_utils import push
+from teff_py.runtime_model import RuntimeHistory
+from teff_py.slurm_queue import SlurmQueue
+from teff_py.systems_runner import SystemsRunner
+from teff_py.tdep_utils import (get_shell_radii, get_max_mic_distance,
+                                find_max_rc2, find_rc3_list)
 
-def find_rc3_list(distances, i_rc2=None, dist_thr=None):
-    # FIXME: width of the window:
-    i_rc2 = i_rc2 or find_max_rc2(distances)
-    dist_thr = dist_thr or distances[i_rc2] / i_rc2 * 1.0  # <- coeff!
-
-    i_rc3_list = []
-    beg = 1
-    end = 1
-
-    while (end < i_rc2):
-        if abs(distances[end] - distances[beg] <= dist_thr):
-            end += 1
-        else:
-            # i_rc3_list.append(beg)
-            i_rc3_list.append(end-1)
-            beg = end
-    # i_rc3_list.append(beg)
-    i_rc3_list.append(end-1)
-
-    return i_rc3_list
 
 # # ## workflow Action stage specifications
 class FCsToSubmit(SlurmScheduledAction):
@@ -62,8 +35,10 @@ class FCsToSubmit(SlurmScheduledAction):
         self.command = self.rem["sbatch"]
         super().__init__(args_source, parent)
 
+    script_name = "sub_fcs.sh"
+
     def make_args_list(self):
-        return ["sub_fcs.sh"]   # essentially pass
+        return [self.script_name]   # essentially pass
 
     def make_prefix(self):
         return "sub_fcs_%s_%s" % (self.args_source["rc2"],
@@ -71,20 +46,12 @@ class FCsToSubmit(SlurmScheduledAction):
 
     @Action.change_state_on_prepare
     def prepare(self):
+        # input links in one remote command; `sub_fcs.sh` is rendered
+        # locally from `script_template`, see `upload_scripts`
         files = ["forces", "meta", "positions", "ssposcar", "stat", "ucposcar"]
-        for fname in files:
-            self.rem["ln"]("-s",
-                           self.path+"/../infile."+fname,
-                           self.path+"/infile."+fname)
-
-        self.rem["cp"](self.path+"/../sub_fcs.sh",
-                       self.path+"/sub_fcs.sh")
-        self.rem["sed"]("-i",
-                        "s/LABEL_RC2/%s/g" % self.args_source["rc2"],
-                        self.path+"/sub_fcs.sh")
-        self.rem["sed"]("-i",
-                        "s/LABEL_RC3/%s/g" % self.args_source["rc3"],
-                        self.path+"/sub_fcs.sh")
+        self.rem["sh"]("-c", "cd %s && %s" % (self.path, " && ".join(
+            "ln -s ../infile.%s infile.%s" % (fname, fname)
+            for fname in files)))
 
 
 class WfApp(cli.Application):
@@ -93,6 +60,10 @@ class WfApp(cli.Application):
     conf_file = cli.SwitchAttr("--conf-file", str, default="./conf.toml",
                                help="Configuration .toml file")
     verbose_output = cli.Flag("-v", default=False)
+    dry_run = cli.Flag("--dry-run", default=False,
+                       help="Report the planned actions without running them")
+    profile = cli.Flag("--profile", default=False,
+                       help="Report the driver overhead per Action class")
 
     def logging_setup(self):
         "Setup logging handlers for the application"
@@ -101,7 +72,8 @@ class WfApp(cli.Application):
             format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
             datefmt='%d-%m-%Y %H:%M',
             filename=self.conf["local_base_path"] + '/wf.log',
-            filemode='w',)
+            # a dry run keeps the log of the last real run
+            filemode='a' if self.dry_run else 'w',)
 
         # define a Handler which writes INFO messages or higher to the
         # sys.stderr
@@ -130,7 +102,30 @@ class WfApp(cli.Application):
             # print(self.conf["local_base_path"])
 
         self.logging_setup()
-        self.remote_machine_setup()
+        if self.dry_run:
+            # no connection: remote paths are only reported
+            self.rem = local
+        else:
+            self.remote_machine_setup()
+
+        # runtimes of past jobs: longest jobs first, `--time` from predictions
+        history = RuntimeHistory(self.conf["local_base_path"] + "/runtimes.jsonl")
+        if not self.dry_run:
+            add_listener(history)
+        FCsToSubmit.runtime_model = history
+        if self.profile:
+            profiler = Profiler().start()
+        # `sacct` records of the finished jobs, with the wasted core-hours
+        accounting = AccountingLog(self.conf["local_base_path"] + "/accounting.jsonl")
+        add_listener(accounting)
+        # status line of the sweep: state counts, rate, cores in use, ETA
+        monitor = ProgressMonitor(model=history)
+        add_listener(monitor)
+        # Prometheus metrics, if a port and/or a textfile are configured
+        metrics = Metrics(port=self.conf.get("metrics_port"),
+                          textfile=self.conf.get("metrics_textfile"))
+        if not self.dry_run:
+            metrics.start()
         # print(self.rem["uname"]("-a"))
 
         inp_repo_dir = local.path(self.conf["inputs_repository"])
@@ -138,6 +133,27 @@ class WfApp(cli.Application):
             # inp_systems = local["ls"]().split()
             inp_systems = ["216.02.AlAs"]
 
+        # stage inputs of all systems on remote in one compressed transfer
+        rem_base_path = self.rem.path(self.conf["remote_base_path"])
+        if not self.dry_run:
+            push(self.rem, [inp_repo_dir / inp_sys for inp_sys in inp_systems],
+                 rem_base_path)
+
+        # systems run concurrently, under limits shared by all of them
+        runner = SystemsRunner(cores=self.conf.get("max_cores"),
+                               channels=self.conf.get("max_ssh_channels"))
+        # jobs kept within the user limits of the cluster, retried
+        # when rejected and tracked with one `squeue` for all systems
+        queue = SlurmQueue(self.rem,
+                           max_jobs=self.conf.get("max_slurm_jobs", 100),
+                           channel=runner.channel)
+
+        def system_workflow(calc_list):
+            async def workflow(system):
+                await asyncio.gather(*(system.execute(calc)
+                                       for calc in history.order(calc_list)))
+            return workflow
+
         for inp_sys in inp_systems:
             # paths preparation
             inp_path = inp_repo_dir / inp_sys
@@ -145,36 +161,27 @@ class WfApp(cli.Application):
             loc_base_path = local.path(self.conf["local_base_path"])
             loc_path = loc_base_path / inp_sys
 
-            rem_base_path = self.rem.path(self.conf["remote_base_path"])
             rem_path = rem_base_path / inp_sys
 
-            # setup calc_system paths, if needed
-            try:
-                copy(inp_path, loc_path)
-            except FileExistsError:
-                pass
-
-            try:
-                copy(inp_path, rem_path)
-            except FileExistsError:
-                pass
-
-            local.cwd.chdir(loc_path)
-            self.rem.cwd.chdir(rem_path)
+            if self.dry_run:
+                # nothing is created: inputs are read from the repository
+                loc_path = inp_path
+            else:
+                # setup calc_system paths, if needed
+                try:
+                    copy(inp_path, loc_path)
+                except FileExistsError:
+                    pass
 
-            # build input parameters
-            atoms = read(loc_path / "infile.ssposcar", format="vasp")
-
-            mic = True                      # Minimal Image Convention
-            kw = {"mic": mic, "vector": False}
-            distances_all = atoms.get_all_distances(**kw)
-
-            thr = 1e-3                      # threshold to add to the cutoff
-            distances_all = (distances_all + thr).round(decimals=5)
-            distances_all = unique(sort(distances_all.flatten()))
+            # build input parameters:
+            # neighbour shells up to `rcmax` of the supercell
+            distances_all = get_shell_radii(loc_path / "infile.ssposcar")
 
             # print(distances_all)
-            i_rc2 = find_max_rc2(distances_all)
+            # rc2 up to half of the largest minimum-image distance
+            max_distance = get_max_mic_distance(loc_path / "infile.ssposcar")
+            i_rc2 = find_max_rc2(distances_all,
+                                 rc_limit=0.5 * max_distance + 1e-3)
             # print(i_rc2)
             i_rc3_list = find_rc3_list(distances_all, i_rc2)
             # print(i_rc3_list)
@@ -183,23 +190,46 @@ class WfApp(cli.Application):
             for i_rc3 in i_rc3_list:
                 args_source = {"rc2": distances_all[i_rc2],
                                "rc3": distances_all[i_rc3]}
-                calc_list.append(FCsToSubmit(args_source, machine=self.rem))
-
+                calc = FCsToSubmit(args_source, machine=self.rem)
+                # no `cwd` changes: systems are processed concurrently
+                calc.path = rem_path / calc.make_prefix()
+                calc.queue = queue
+                calc_list.append(calc)
+
+            if self.dry_run:
+                print(inp_sys)
+                print(plan(calc_list, model=history).summary())
+                continue
+
+            # submission scripts with LABEL_RC2/LABEL_RC3 substituted,
+            # written for the whole sweep in one transfer
+            template = (loc_path / FCsToSubmit.script_name).read()
             for calc in calc_list:
-                # task.prepare()
-                calc.state = State.PREPARED
-                
-            loop = asyncio.new_event_loop()
-
-            async def group():
-                tasks = [calc.run() for calc in calc_list]
-                await asyncio.gather(*tasks)
-
-            queue = loop.create_task(group())
-            loop.run_until_complete(queue)
+                calc.script_template = template
+                calc.prepare()
+            upload_scripts([calc for calc in calc_list
+                            if calc.state == State.PREPARED])
+
+            runner.add(inp_sys, system_workflow(calc_list))
+
+        for inp_sys, result in asyncio.run(runner.run()).items():
+            if isinstance(result, Exception):
+                print("%s failed: %s" % (inp_sys, result))
+        runner.shutdown()
+        monitor.render(final=True)
+        if not self.dry_run:
+            metrics.close()
+        if self.profile:
+            profiler.stop()
+            print(profiler.report())
+
+        if not self.dry_run:
+            accounting.ingest(self.rem)
+            print(accounting.report())
 
         # Shutdown
-        self.rem.close()
+        if not self.dry_run:
+            self.rem.close()
 
 
 if __name__ == "__main__":
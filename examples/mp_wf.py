@@ -3,15 +3,17 @@
 
 # system-related imports:
 import logging
-import os.path as op
 import pprint
 # imports from `plumbum` for shell commands
 # and cli-application wrapper:
 from plumbum import local, cli
-from plumbum.cmd import cp, ln, mkdir, cat, pwd, head, tail, awk, echo, grep
+from plumbum.cmd import ln
 
 # my workflow engine actions:
 from teff_py.actions import Action, State
+from teff_py.coalescing import coalesce
+from teff_py.siesta_utils import siesta_to_tdep, read_canonical_temperatures
+from teff_py.tdep_utils import temperature_range_args
 
 # Materials Project API
 from mp_api.client import MPRester
@@ -49,6 +51,7 @@ class GenStruct(Action):
     "Supercell generation stage from incoming structure."
     command = local["generate_structure"]
     num_mpi_procs = 2
+    expected_outputs = ["outfile.ssposcar"]     # see `discovery`
 
     def make_args_list(self):
         structure = self.args_source["structure"]
@@ -88,8 +91,13 @@ class CanConf(Action):
 
 class SpSiesta(Action):
     "Single-point configuration processing with SIESTA."
-    command = ["siesta"]
+    command = local["siesta"]  # scratch and logs work on its `.machine`
     num_mpi_procs = 16
+    log_compression = "gzip"  # large logs, read back through `logstore`
+    # run in node-local scratch, keep only what `FCs` reads
+    scratch = "$TMPDIR"
+    scratch_outputs = ["*.STRUCT_OUT", "*.FA"]
+    expected_outputs = ["*.FA"]
 
     def make_prefix(self):
         return "".join([
@@ -98,7 +106,8 @@ class SpSiesta(Action):
         ])
 
     def make_args_list(self):
-        return [self.path+"/siesta_conf"+("%04d" % self.args_source["nc"])]
+        # relative: the copy staged in scratch is read
+        return ["siesta_conf"+("%04d" % self.args_source["nc"])]
 
     @Action.change_state_on_prepare
     def prepare(self):
@@ -116,6 +125,7 @@ class FCs(Action):
     "Extract forceconstants from SIESTA calculations with TDEP."
     command = ["extract_forceconstants"]
     num_mpi_procs = 2
+    expected_outputs = ["outfile.forceconstant"]
 
     def make_args_list(self):
         # we expect to receive a source collection like:
@@ -128,62 +138,45 @@ class FCs(Action):
         list(map(lambda fname: ln(self.parent.path+"/"+fname, self.path+"/"+fname),
                  ["infile.ssposcar", "infile.ucposcar"]))
 
-        for nc in range(1, self.args_source["nconfs"]+1):
-            pipe = cat[self.parent.path+"/spsiesta."+str(nc)+"/siesta_conf"+("%04d" % nc)+".STRUCT_OUT"] | \
-                tail[-self.args_source["na_supercell"]] | awk['{ print $3, $4, $5 }']
-            cmd = pipe >> self.path + "/infile.positions"
-            cmd()
-
-        for nc in range(1, self.args_source["nconfs"]+1):
-            pipe = cat[self.parent.path+"/spsiesta."+str(nc)+"/siesta_conf"+("%04d" % nc)+".FA"] | \
-                tail[-self.args_source["na_supercell"]] | awk['{ print $2, $3, $4 }']
-            cmd = pipe >> self.path + "/infile.forces"
-            cmd()
-
-        # infile.meta
-        (echo[self.args_source["na_supercell"]] >> self.path+"/infile.meta")()
-        (echo[self.args_source["nconfs"]] >> self.path+"/infile.meta")()
-        (echo[1.0] >> self.path+"/infile.meta")()  # timestep?
-        (echo[300] >> self.path+"/infile.meta")()  # temperature?
-
-        # infile.stat
-        for nc in range(1, self.args_source["nconfs"]+1):
-            i = nc
-            t = float(nc-1)
-
-            pipe = grep["Etot ", self.parent.path+"/spsiesta."+str(nc)+"/out.log"] | tail[-1] | awk['{ print $4 }']
-            Etot = float(pipe().strip())
-
-            pipe = grep["Ekin ", self.parent.path+"/spsiesta."+str(nc)+"/out.log"] | tail[-1] | awk['{ print $4 }']
-            Ekin = float(pipe().strip())
-            
-            Epot = Etot - Ekin
-            
-            # tail -2 out.log | head -1 | tail -1 | awk '{ print $4 }'
-            pipe = tail[-self.args_source["nconfs"], self.parent.path+"/out.log"] | \
-                head[-nc] | tail[-1] | awk['{ print $4 }']
-            T = float(pipe().strip())  # temperature?
-            pipe = grep["-i", "-A4", "pres", self.parent.path+"/spsiesta."+str(nc)+"/out.log"] | tail[-1] | awk['{ print $2 }']
-            P = float(pipe().strip()) * 0.1
-            
-            pipe = grep["-i", "-A3", "Stress ", self.parent.path+"/spsiesta."+str(nc)+"/out.log"] | tail[-3] | awk['{ print $2, $3, $4 }']
-            stres_line = " ".join(pipe().strip().split("\n"))
+        # infile.positions, infile.forces, infile.stat and infile.meta
+        nconfs = self.args_source["nconfs"]
+        conf_files = []
+        for nc in range(1, nconfs+1):
+            label = self.parent.path+"/spsiesta."+str(nc)+"/siesta_conf"+("%04d" % nc)
+            conf_files.append((label+".STRUCT_OUT", label+".FA",
+                               self.parent.path+"/spsiesta."+str(nc)+"/out.log"))
+
+        temperatures = read_canonical_temperatures(self.parent.path+"/out.log", nconfs)
+        siesta_to_tdep(self.path, conf_files, self.args_source["na_supercell"],
+                       temperatures,
+                       timestep=1.0,     # timestep?
+                       temperature=300)  # temperature?
 
-            line = f"{i} {nc} {Etot} {Epot} {Ekin} {T} {P} {stres_line}"
-            (echo[line] >> self.path+"/infile.stat")()  
-            
 
 class TC(Action):
     command = local["thermal_conductivity"]  # this executable should be visible in $PATH
     num_mpi_procs = 16
+    parent_files = ["infile.ucposcar", "outfile.forceconstant*"]
+    expected_outputs = ["outfile.thermal_conductivity"]
+    # a temperature scan runs once, see `coalescing`
+    coalesce_axis = "temperature"
+    coalesced_tables = ["outfile.thermal_conductivity"]
+
+    def make_prefix(self):
+        return "tc.%d" % self.args_source["temperature"]
 
     def make_args_list(self):
         # qg = self.args_source["qg"]
         return [
             "-qg", 20, 20, 20,
-            "--temperature", str(300)
+            "--temperature", str(self.args_source["temperature"])
         ]
 
+    def make_coalesced_args_list(self, values):
+        temperatures = temperature_range_args(values)
+        if temperatures is not None:
+            return ["-qg", 20, 20, 20] + temperatures
+
     @Action.change_state_on_prepare  # this decorator is required
     def prepare(self):
         # link ucposcar from the parent calculation
@@ -219,9 +212,8 @@ class WfApp(cli.Application):
         gen_struct.run()
 
         # Line 7 of the outfile.ssposcar contains resulting number of atoms:
-        pipe = head["-7", gen_struct.path+"/outfile.ssposcar"] | tail["-1"]
-        # na_supercell = int(pipe().strip())
-        na_supercell = sum(list(map(int, pipe().strip().split())))
+        ssposcar = (gen_struct.path / "outfile.ssposcar").read().split("\n")
+        na_supercell = sum(list(map(int, ssposcar[6].split())))
 
         # 3. Iteration over canonical configurations.
         results = {}
@@ -246,11 +238,14 @@ class WfApp(cli.Application):
             fcs.prepare()
             fcs.run()
         
-            tc = TC([], parent=fcs)
-            tc.prepare()
-            tc.run()
-
-            tc_line = cat(op.join(tc.path, "outfile.thermal_conductivity"))
+            tc_scan = [TC({"temperature": t}, parent=fcs)
+                       for t in range(100, 600, 100)]
+            for action in coalesce(tc_scan):
+                action.prepare()
+                action.run()
+
+            tc = tc_scan[2]     # 300 K
+            tc_line = (tc.path / "outfile.thermal_conductivity").read()
             tc_res = float(tc_line.strip().split()[1])
             results[iiter] = tc_res
             print(iiter, tc_res)
@@ -69,6 +69,7 @@ class ForceConstants(Action):
 class PhDispRel(Action):
     command = local["phonon_dispersion_relations"]
     num_mpi_procs = 16
+    parent_files = ["infile.ucposcar", "outfile.forceconstant"]
 
     def make_args_list(self):
         return ["--temperature", self.args_source["temperature"]]
@@ -3,6 +3,7 @@ from plumbum.machines.paramiko_machine import ParamikoMachine
 from plumbum.path.utils import copy
 
 from teff_py.actions import Action, State
+from teff_py.remote_utils import push
 from teff_py.tdep_utils import get_rcmax
 
 # logging.basicConfig(
@@ -47,7 +48,7 @@ rem_base_path = rem.path("~/Projects/workflows/10-remote-test")
 rem_path = rem_base_path / inp_sys
 
 #NOTE copy(inp_path, loc_path)        # works
-copy(inp_path, rem_path)        # works
+push(rem, [inp_path], rem_base_path)  # only changed files, one archive
 
 # env enhancer for remote HPC command invocations to actually work
 renv = rem["env"]["LD_LIBRARY_PATH=%s" % rem.env.get("LD_LIBRARY_PATH")]
@@ -37,6 +37,8 @@ class ForceConstants(Action):
 class PhDispRel(Action):
     command = local["phonon_dispersion_relations"]
     num_mpi_procs = 16
+    parent_files = ["infile.ucposcar", "outfile.forceconstant"]
+    expected_outputs = ["outfile.dispersion_relations"]
 
     def make_args_list(self):
         return []
@@ -55,6 +57,8 @@ class PhDispRel(Action):
 class ThermalConductivity(Action):
     command = local["thermal_conductivity"]  
     num_mpi_procs = 16
+    parent_files = ["infile.ucposcar", "outfile.forceconstant*"]
+    expected_outputs = ["outfile.thermal_conductivity"]
 
     def make_args_list(self):
         return [ "--temperature", str(300) ] #NOTE: T is hard pinned to 300K
@@ -0,0 +1,205 @@
+"""Slurm accounting of finished scheduled actions.
+
+`sacct` records of finished jobs are fetched in bulk and attached to
+their actions as `action.accounting`: elapsed time, CPU time, cores,
+peak memory, final state and the derived CPU efficiency and wasted
+core-hours. Actions only known to have left the queue (FINISHED)
+become SUCCEEDED or FAILED according to the final state. An
+`AccountingLog` keeps them in a JSON-lines file and reports the waste
+per Action class:
+
+    accounting = AccountingLog("accounting.jsonl")
+    add_listener(accounting)    # collect actions leaving the queue
+    ...
+    accounting.ingest(rem)      # one `sacct` call per 500 jobs
+    print(accounting.report())
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from teff_py.actions import State, notify
+
+logger = logging.getLogger(__name__)
+
+SACCT_FIELDS = ["JobIDRaw", "State", "ExitCode", "ElapsedRaw", "TotalCPU",
+                "NCPUS", "MaxRSS", "ReqMem", "TimelimitRaw"]
+
+# job states with no more accounting updates to come
+FINAL_STATES = {"COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY",
+                "NODE_FAIL", "PREEMPTED", "BOOT_FAIL", "DEADLINE"}
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_duration(text):
+    "Seconds of a Slurm duration `[days-][hours:]minutes:seconds[.ms]`."
+    if not text:
+        return 0.0
+    days, _, clock = text.rpartition("-")
+    seconds = 0.0
+    for part in clock.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds + 86400 * int(days or 0)
+
+
+def parse_memory(text):
+    "Bytes of a Slurm memory size, e.g. `1234K` or `4000Mn`, 0 if empty."
+    match = re.match(r"([\d.]+)([KMGT]?)", text)
+    if match is None:
+        return 0
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def parse_sacct(output):
+    """Job records from `sacct -P -n --format=<SACCT_FIELDS>` `output`,
+    the job steps folded into their jobs.
+
+    Result: {job id: record}"""
+    jobs, steps = {}, defaultdict(list)
+    for line in output.splitlines():
+        values = line.split("|")
+        if len(values) != len(SACCT_FIELDS):
+            continue
+        row = dict(zip(SACCT_FIELDS, values))
+        job_id, _, step = row["JobIDRaw"].partition(".")
+        if step:                # e.g. <id>.batch, <id>.0
+            steps[job_id].append(row)
+        else:
+            jobs[job_id] = row
+
+    records = {}
+    for job_id, row in jobs.items():
+        elapsed = float(row["ElapsedRaw"] or 0)
+        ncpus = int(row["NCPUS"] or 0)
+        cpu_time = parse_duration(row["TotalCPU"])
+        core_seconds = elapsed * ncpus
+        records[job_id] = {
+            "job_id": job_id,
+            # e.g. "CANCELLED by 1234"
+            "state": row["State"].split()[0] if row["State"] else "",
+            "exit_code": row["ExitCode"],
+            "elapsed": elapsed,
+            "cpu_time": cpu_time,
+            "ncpus": ncpus,
+            "max_rss": max([parse_memory(r["MaxRSS"])
+                            for r in [row] + steps[job_id]]),
+            "req_mem": parse_memory(row["ReqMem"]),
+            "time_limit": 60 * float(row["TimelimitRaw"] or 0),
+            "cpu_efficiency": cpu_time / core_seconds if core_seconds else None,
+            "core_hours": core_seconds / 3600,
+            "wasted_core_hours": max(0.0, core_seconds - cpu_time) / 3600,
+        }
+    return records
+
+
+def fetch_accounting(machine, job_ids, batch=500):
+    "Accounting records of the jobs `job_ids` on `machine`, in bulk."
+    job_ids = [str(j) for j in job_ids]
+    records = {}
+    for i in range(0, len(job_ids), batch):
+        output = machine["sacct"](
+            "-P", "-n", "--format=" + ",".join(SACCT_FIELDS),
+            "-j", ",".join(job_ids[i:i + batch]))
+        notify("helper", machine, command="sacct")
+        records.update(parse_sacct(output))
+    return records
+
+
+class AccountingLog():
+    """Accounting records of scheduled actions in the JSON-lines file
+    `fname`. Also an `actions` listener collecting the actions whose
+    jobs left the queue, to be ingested in bulk."""
+
+    def __init__(self, fname):
+        self.fname = os.fspath(fname)
+        self.records = []
+        self.pending = []       # finished actions not yet ingested
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.fname):
+            with open(self.fname) as f:
+                self.records = [json.loads(line) for line in f
+                                if line.strip()]
+
+    def __call__(self, event, action, phase=None, **info):
+        if phase == "scheduled" and event == "end" and \
+           getattr(action, "id", None):
+            with self._lock:
+                self.pending.append(action)
+
+    def ingest(self, machine, actions=None):
+        """Fetch the records of `actions` (the pending ones by default),
+        attach them as `action.accounting` and store them. Jobs without
+        final records yet stay pending, as do all of them if `sacct`
+        fails. Returns the new records."""
+        with self._lock:
+            if actions is None:
+                actions, self.pending = self.pending, []
+        if not actions:
+            return []
+
+        try:
+            fetched = fetch_accounting(machine, [a.id for a in actions])
+        except Exception:
+            with self._lock:
+                self.pending.extend(actions)
+            raise
+        new, later = [], []
+        for action in actions:
+            rec = fetched.get(str(action.id))
+            if rec is None or rec["state"] not in FINAL_STATES:
+                later.append(action)
+                continue
+            action.accounting = rec
+            if action.state == State.FINISHED:
+                action.state = State.SUCCEEDED \
+                    if rec["state"] == "COMPLETED" else State.FAILED
+            notify("accounting", action, record=rec)
+            new.append(dict(rec, **{"class": type(action).__name__,
+                                    "action": action.make_prefix(),
+                                    "path": str(action.path),
+                                    "time": time.time()}))
+
+        with self._lock:
+            self.pending.extend(later)
+            self.records.extend(new)
+            with open(self.fname, "a") as f:
+                for rec in new:
+                    f.write(json.dumps(rec) + "\n")
+        return new
+
+    def summary(self):
+        "Totals per Action class: jobs, core-hours, wasted core-hours etc."
+        result = {}
+        for rec in self.records:
+            s = result.setdefault(rec["class"], {
+                "jobs": 0, "failed": 0, "core_hours": 0.0,
+                "wasted_core_hours": 0.0, "max_rss": 0})
+            s["jobs"] += 1
+            s["failed"] += rec["state"] != "COMPLETED"
+            s["core_hours"] += rec["core_hours"]
+            s["wasted_core_hours"] += rec["wasted_core_hours"]
+            s["max_rss"] = max(s["max_rss"], rec["max_rss"])
+        return result
+
+    def report(self):
+        "Text table of `summary`, the most wasteful classes first."
+        lines = ["%-24s %6s %6s %12s %12s %8s %10s" % (
+            "class", "jobs", "failed", "core-hours", "wasted", "wasted%",
+            "max RSS")]
+        summary = sorted(self.summary().items(),
+                         key=lambda item: -item[1]["wasted_core_hours"])
+        for name, s in summary:
+            lines.append("%-24s %6d %6d %12.1f %12.1f %7.0f%% %9.1fG" % (
+                name, s["jobs"], s["failed"], s["core_hours"],
+                s["wasted_core_hours"],
+                100 * s["wasted_core_hours"] / s["core_hours"]
+                if s["core_hours"] else 0.0,
+                s["max_rss"] / _UNITS["G"]))
+        return "\n".join(lines)
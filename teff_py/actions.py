@@ -2,10 +2,14 @@
 
 import copy
 import logging
+import time
 from enum import Enum, auto
 from plumbum.commands.processes import ProcessExecutionError
 from plumbum.path import LocalPath
 
+from teff_py.logstore import SUFFIXES, check_compression, write_log
+from teff_py.scratch import working_dir
+
 
 class State(Enum):
     NEW = auto()
@@ -18,6 +22,34 @@ class State(Enum):
     IGNORED = auto()
 
 
+# Observers of the actions execution (tracing, monitoring etc.).
+# Each listener is called as `listener(event, action, **info)`, with
+# `event` one of "begin" and "end" of a `phase` of action processing,
+# or "state" on state changes, with the `old` and `new` states.
+# Other events have other subjects than actions: "command" for each
+# action command executed by a `ShellCommandRunner`, with its `elapsed`
+# time, "helper" for the other commands teff_py runs on a machine (e.g.
+# file staging, logs writing, job ids lookup) with the `command` name,
+# and "poll" for Slurm queue listings, see `metrics`. "accounting"
+# comes with the `sacct` `record` of a finished Slurm job.
+_listeners = []
+
+
+def add_listener(listener):
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def notify(event, action, **info):
+    for listener in _listeners:
+        listener(event, action, **info)
+
+
 class ShellCommandRunner():
     # A basic wrapper over shell commands.
     # Executes only once. Stores split `stdout` and `stderr`
@@ -56,7 +88,9 @@ class ShellCommandRunner():
             return False, "Command already executed! Skipping."
 
         cmd = self.command[self.args].with_cwd(self.cwd)
+        start = time.perf_counter()
         exit_code, stdout, stderr = cmd.run(retcode=None)
+        notify("command", self, elapsed=time.perf_counter() - start)
 
         self._exit_code = exit_code
         self._out_log = stdout.split("\n")
@@ -65,6 +99,31 @@ class ShellCommandRunner():
         return True, "Attemped command execution."
 
 
+class ActionLogger(logging.LoggerAdapter):
+    """Logger of an action: the shared `teff_py.actions` logger carrying
+    the action prefix as context. The prefix is computed only for the
+    records actually emitted, and shows up as the record `name`."""
+
+    def __init__(self, action):
+        super().__init__(_actions_logger, {})
+        self.action = action
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {"action": self.action.make_prefix()}
+        return msg, kwargs
+
+
+def _name_by_action(record):
+    # Keeps `%(name)s` in logging formats showing the action prefix
+    # as with the former per-action loggers.
+    record.name = getattr(record, "action", record.name)
+    return True
+
+
+_actions_logger = logging.getLogger("teff_py.actions")
+_actions_logger.addFilter(_name_by_action)
+
+
 class ActionMeta(type):
     """Metaclass for definitions of workflow Action classes.
     Ensures presence of `default_attrs` and definition of
@@ -76,9 +135,18 @@ class ActionMeta(type):
         'num_mpi_procs': None,
         'command': None,
         'args_source': [],
+        'parent_files': [],
+        'log_compression': None,
+        'scratch': None,
+        'scratch_outputs': ['outfile.*'],
+        'expected_outputs': [],
+        'discovered': None,
+        'coalesce_axis': None,
+        'coalesced_tables': [],
+        'coalesced': None,
+        'placement': None,
         'runner': None,
         'state': State.NEW,
-        'logger': logging.getLogger(''),
     }
 
     required_methods = [
@@ -93,7 +161,7 @@ class ActionMeta(type):
 
     @staticmethod
     def _check_field(field_name, bases, fields):
-        if field_name in fields:
+        if field_name in fields or field_name in fields.get('__slots__', ()):
             return True
 
         for base in bases:
@@ -117,11 +185,27 @@ class ActionMeta(type):
 class Action(metaclass=ActionMeta):
     "Default action class. Demonstrates the actions protocol compliance."
 
-    # TODO: consider turning those into properties
-    # @property
-    # def state(self):
-    #     return copy.deepcopy(self._state)
+    # Per-instance state of an action, no `__dict__`. Subclasses not
+    # declaring `__slots__` themselves get one for their own attributes
+    # and the ones set by the framework (`discovered`, `placement` etc.).
+    __slots__ = ('args_source', 'parent', '_state', 'runner', '_path')
 
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        # state changes are observable (progress monitoring etc.)
+        try:
+            old = self._state
+        except AttributeError:  # set for the first time
+            old = None
+        self._state = value
+        if _listeners:
+            notify("state", self, old=old, new=value)
+
+    # TODO: consider turning this into a property
     # @property
     # def runner(self):
     #     return copy.deepcopy(self._runner)
@@ -131,13 +215,29 @@ class Action(metaclass=ActionMeta):
 
     def make_path(self):
         if self.parent is None:
-            pwd = self.command.machine["pwd"]
-            path = self.command.machine.path(pwd().strip())
+            # working directory known to the machine, no `pwd` process
+            machine = self.command.machine
+            path = machine.path(str(machine.cwd))
 
             return path / self.make_prefix()
 
         return self.parent.path / self.make_prefix()
 
+    @property
+    def path(self):
+        "Action directory, resolved with `make_path` on first use."
+        if self._path is None:
+            self._path = self.make_path()
+        return self._path
+
+    @path.setter
+    def path(self, value):
+        self._path = value
+
+    @property
+    def logger(self):
+        return ActionLogger(self)
+
     def make_args_list(self):
         return self.args_source
 
@@ -149,16 +249,19 @@ class Action(metaclass=ActionMeta):
         self.args_source = args_source
         self.parent = parent
 
-        self.path = self.make_path()
-        self.logger = logging.getLogger(self.make_prefix())
+        self.state = State.NEW
+        self.runner = None
+        self._path = None       # resolved lazily, see `path`
 
         # Action initialized.
-        self.logger.debug("%-10s", self.state.name)
-        self.logger.debug("Args source collection received: %s",
-                          self.args_source)
-        if self.parent is not None:
-            self.logger.debug("Parent action linked: %s",
-                              self.parent.make_prefix())
+        if _actions_logger.isEnabledFor(logging.DEBUG):
+            logger = self.logger
+            logger.debug("%-10s", self.state.name)
+            logger.debug("Args source collection received: %s",
+                         self.args_source)
+            if self.parent is not None:
+                logger.debug("Parent action linked: %s",
+                             self.parent.make_prefix())
 
     @staticmethod
     def change_state_on_prepare(f):
@@ -172,20 +275,34 @@ class Action(metaclass=ActionMeta):
         """
         def wrapper(*args):
             # args[0] refers to self
-            if args[0].command.machine.path(args[0].path).exists():
-                args[0].state = State.IGNORED
-                args[0].logger.info(
-                    "%-10s Action-related path exists. Skipping.",
-                    State.IGNORED.name)
-
-                return
-
-            mkdir = args[0].command.machine["mkdir"]
-            mkdir("-p", args[0].path)
-            f(*args)
-            args[0].state = State.PREPARED
-            # Action-related path ready for execution.
-            args[0].logger.info("%-10s", State.PREPARED.name)
+            notify("begin", args[0], phase="prepare")
+            try:
+                if args[0].discovered is not None:
+                    # state seeded from a bulk listing, see `discovery`
+                    if args[0].discovered != "absent":
+                        args[0].logger.info(
+                            "%-10s Action state discovered. Skipping.",
+                            args[0].state.name)
+                        return
+                elif args[0].command.machine.path(args[0].path).exists():
+                    args[0].state = State.IGNORED
+                    args[0].logger.info(
+                        "%-10s Action-related path exists. Skipping.",
+                        State.IGNORED.name)
+
+                    return
+
+                if args[0].log_compression is not None:
+                    check_compression(args[0].log_compression)
+                mkdir = args[0].command.machine["mkdir"]
+                mkdir("-p", args[0].path)
+                notify("helper", mkdir.machine, command="mkdir")
+                f(*args)
+                args[0].state = State.PREPARED
+                # Action-related path ready for execution.
+                args[0].logger.info("%-10s", State.PREPARED.name)
+            finally:
+                notify("end", args[0], phase="prepare")
 
         return wrapper
 
@@ -209,43 +326,67 @@ class Action(metaclass=ActionMeta):
                 # Submtting the action command for execution.
                 args[0].logger.debug("%-10s", State.RUNNING.name)
 
-                f(*args)
-
-                # machine = args[0].command.machine
-                session = args[0].command.machine.session()
-                if args[0].runner.exit_code != 0:
-                    args[0].state = State.FAILED
-                    args[0].logger.error(
-                        "%-10s Action command execution resulted in non-zero exit code.",
-                        State.FAILED.name)
-                    err_path = args[0].path / "err.log"
-                    session.run("echo -n \"%s\" | tee %s" %
-                                ("\n".join(args[0].runner.err_log), err_path))
-                    args[0].logger.error("Error log written at: %s", err_path)
-                else:
-                    args[0].state = State.SUCCEEDED
-                    # Action command successfully executed.
-                    args[0].logger.info("%-10s", State.SUCCEEDED.name)
-
-                out_path = args[0].path / "out.log"
-                session.run("echo -n \"%s\" | tee %s" %
-                            ("\n".join(args[0].runner.out_log), out_path))
-                args[0].logger.debug("Output written at: %s", out_path)
+                notify("begin", args[0], phase="run")
+                try:
+                    f(*args)
+                finally:
+                    notify("end", args[0], phase="run")
+
+                # post-processing: logs writing
+                notify("begin", args[0], phase="post")
+                try:
+                    # machine = args[0].command.machine
+                    session = args[0].command.machine.session()
+                    if args[0].runner.exit_code != 0:
+                        args[0].state = State.FAILED
+                        args[0].logger.error(
+                            "%-10s Action command execution resulted in non-zero exit code.",
+                            State.FAILED.name)
+                        err_path = args[0].path / "err.log"
+                        session.run("echo -n \"%s\" | tee %s" %
+                                    ("\n".join(args[0].runner.err_log), err_path))
+                        notify("helper", args[0].command.machine,
+                               command="tee")
+                        args[0].logger.error("Error log written at: %s", err_path)
+                    else:
+                        args[0].state = State.SUCCEEDED
+                        # Action command successfully executed.
+                        args[0].logger.info("%-10s", State.SUCCEEDED.name)
+
+                    out_path = args[0].path / "out.log"
+                    if args[0].log_compression is not None:
+                        # compressed with a block index, see `logstore`
+                        out_path = args[0].path / (
+                            "out.log" + SUFFIXES[args[0].log_compression])
+                        lines = args[0].runner.out_log
+                        if lines and lines[-1] == "":
+                            lines.pop()     # final newline of the output
+                        write_log(out_path, lines, args[0].log_compression,
+                                  machine=args[0].command.machine)
+                    else:
+                        session.run("echo -n \"%s\" | tee %s" %
+                                    ("\n".join(args[0].runner.out_log), out_path))
+                        notify("helper", args[0].command.machine,
+                               command="tee")
+                    args[0].logger.debug("Output written at: %s", out_path)
+                finally:
+                    notify("end", args[0], phase="post")
 
         return wrapper
 
     @change_state_on_run
     def run(self):
-        self.runner = ShellCommandRunner(
-            self.command,
-            self.make_args_list(),
-            cwd=self.path,
-            num_mpi_procs=self.num_mpi_procs,
-        )
-
-        with self.command.machine.cwd(self.path):
+        # the runner sets the working directory of the command itself,
+        # so that concurrent actions never change the process-wide cwd
+        with working_dir(self) as cwd:
+            self.runner = ShellCommandRunner(
+                self.command,
+                self.make_args_list(),
+                cwd=cwd,
+                num_mpi_procs=self.num_mpi_procs,
+            )
             launch, message = self.runner.run()
-            if launch:
-                self.logger.debug(message)
-            else:
-                self.logger.warning(message)
+        if launch:
+            self.logger.debug(message)
+        else:
+            self.logger.warning(message)
@@ -2,11 +2,75 @@
 
 import asyncio
 import copy
-from teff_py.actions import Action, State
+import os
+import re
+import time
+from teff_py.actions import Action, State, notify
+from teff_py.remote_utils import hold_channel, write_files
+from teff_py.sentinels import SENTINEL, sentinel_trap
+
+
+PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+
+def render_template(template, fields):
+    """Text of a submission script from `template`, with `${name}`
+    placeholders and `LABEL_NAME` tokens replaced with the values of
+    `fields`. Other `$` expressions, e.g. `$path` or `$SLURM_JOB_ID`, are
+    left to the shell. `#SBATCH` directives with placeholders missing
+    from `fields` are left out, e.g. `--time=${time}` without a
+    predicted runtime: the scheduler defaults apply."""
+    lines = []
+    for line in template.splitlines(True):
+        names = PLACEHOLDER.findall(line)
+        if line.lstrip().startswith("#SBATCH") and \
+           not all(name in fields for name in names):
+            continue
+        lines.append(PLACEHOLDER.sub(
+            lambda m: str(fields.get(m.group(1), m.group(0))), line))
+    text = "".join(lines)
+
+    for name in sorted(fields, key=len, reverse=True):
+        text = text.replace("LABEL_" + name.upper(), str(fields[name]))
+    return text
+
+
+def upload_scripts(actions):
+    """Render the submission scripts of `actions` and write them into
+    their directories, in one transfer per machine."""
+    machines = {}
+    for action in actions:
+        machine = action.command.machine
+        machines.setdefault(id(machine), (machine, []))[1].append(action)
+
+    for machine, group in machines.values():
+        paths = [str(action.path) for action in group]
+        root = os.path.commonpath([os.path.dirname(p) for p in paths])
+        write_files(machine,
+                    {os.path.relpath(os.path.join(p, a.script_name), root):
+                     a.render_script() for a, p in zip(group, paths)},
+                    root, mode=0o755)
 
 
 class ScheduledAction(Action):
     "REVIEW: Experimental base action for asynchronous remote submission."
+    script_template = None      # text of the submission script template
+    script_name = "submit.sh"
+    channel = None              # machine commands context, `hold_channel`
+
+    def script_fields(self):
+        "Values of the submission script template placeholders."
+        fields = {}
+        if isinstance(self.args_source, dict):
+            fields.update(self.args_source)
+        fields.update(job_name=self.make_prefix(), path=str(self.path),
+                      cores=self.num_mpi_procs or 1,
+                      sentinel=sentinel_trap(self.path))
+        return fields
+
+    def render_script(self):
+        return render_template(self.script_template, self.script_fields())
+
     async def submit_hook(self):
         raise NotImplementedError
 
@@ -15,33 +79,97 @@ class ScheduledAction(Action):
 
     async def run(self):
         if self.state == State.PREPARED:
-            super().run()       # action task submission command
+            async with hold_channel(self.channel):
+                super().run()   # action task submission command
+            if self.state == State.FAILED:
+                return          # rejected, see `err.log`
             self.state = State.SUBMITTED
             await self.submit_hook()
 
-        await self.run_hook()
+        # waiting for the scheduler: queued and running job
+        notify("begin", self, phase="scheduled")
+        try:
+            await self.run_hook()
+        finally:
+            notify("end", self, phase="scheduled")
 
 
 class SlurmScheduledAction(ScheduledAction):
     "REVIEW: Action to be dispatched on remote with Slurm sheduler."
     _id = None
+    _time_limit = None
+    _time_on_command = False    # `--time` added to `command`
     poll_interval = 5           # polling time interval, seconds
+    runtime_model = None        # sets the job time from predicted runtimes
+    queue = None                # `slurm_queue.SlurmQueue` polling the job
+    completion = None           # `sentinels.SentinelWatcher`, no polling
+    accounting = None           # `sacct` record, see `accounting`
    
     @property
     def id(self):
         return copy.deepcopy(self._id)
 
+    def time_limit(self):
+        "Job time limit from `runtime_model`, None without a prediction."
+        if self._time_limit is None and self.runtime_model is not None:
+            self._time_limit = self.runtime_model.time_limit(self)
+        return self._time_limit
+
+    def script_fields(self):
+        fields = super().script_fields()
+        if self.time_limit() is not None:
+            fields["time"] = self.time_limit()
+        return fields
+
+    async def run(self):
+        # the time limit goes into the `${time}` of rendered scripts,
+        # on the `sbatch` command line otherwise
+        if self.state == State.PREPARED and self.script_template is None \
+           and not self._time_on_command:  # not by a former attempt
+            if self.time_limit() is not None:
+                self.command = self.command["--time=%s" % self.time_limit()]
+                self._time_on_command = True
+        if self.state == State.PREPARED and self.completion is not None:
+            # an exit status left by an earlier run is not this job's
+            async with hold_channel(self.channel):
+                self.command.machine["rm"]("-f", self.path / SENTINEL)
+            notify("helper", self.command.machine, command="rm")
+
+        await super().run()
+
     async def submit_hook(self):
         session = self.command.machine.session()
-        self._id = session.run(
-            "cat %s/out.log | awk '{print $4}'" % self.path
-        )[1].strip()
+        async with hold_channel(self.channel):
+            self._id = session.run(
+                "cat %s/out.log | awk '{print $4}'" % self.path
+            )[1].strip()
+        notify("helper", self.command.machine, command="cat")
 
     async def run_hook(self):
+        if self.completion is not None:
+            # exit status written by the job script itself
+            status = await self.completion.wait(self)
+            self.state = State.SUCCEEDED if status == 0 else State.FAILED
+            return
+
+        if self.queue is not None:
+            # one `squeue` listing shared by all the jobs of the queue
+            await self.queue.wait(self.id)
+            self.state = State.FINISHED     # outcome from `accounting`
+            return
+
         session = self.command.machine.session()
-        while len(session.run("squeue | grep %s" % self.id,
-                              retcode=None)[1]) > 0:
+        while True:
+            async with hold_channel(self.channel):
+                start = time.monotonic()
+                queued = session.run("squeue | grep %s" % self.id,
+                                     retcode=None)[1]
+                notify("poll", self, elapsed=time.monotonic() - start)
+            notify("helper", self.command.machine, command="squeue")
+            if len(queued) == 0:
+                break
             print("Waiting for task %s - %s" %
                   (self.make_prefix(), self.id))
             await asyncio.sleep(self.poll_interval)
         print("Finished task %s - %s" % (self.make_prefix(), self.id))
+        self.state = State.FINISHED
@@ -0,0 +1,209 @@
+"""Coalescing of compatible actions into single invocations.
+
+Actions of a class with a `coalesce_axis`, e.g. the points of a
+temperature scan with TDEP `thermal_conductivity`, differ only in one
+value of their `args_source`. `coalesce` merges those of the same class
+and parent into one action covering all the values at once, so that
+the force constants are read and the q-mesh is built only once:
+
+    class TC(Action):
+        coalesce_axis = "temperature"
+        coalesced_tables = ["outfile.thermal_conductivity"]
+
+        def make_coalesced_args_list(self, values):
+            # `None`: the values can not be covered by one invocation
+            temperatures = temperature_range_args(values)
+            if temperatures is not None:
+                return ["-qg", 20, 20, 20] + temperatures
+        ...
+
+    for action in coalesce(tc_list):
+        action.prepare()
+        action.run()
+
+The merged action is prepared with the `args_source` of its first
+member, the members with their own. It splits the rows of its
+`coalesced_tables` evenly back into the directories of its members, in
+the order of the sorted values, writes its logs there too, and hands
+them its state and runner: the members look processed on their own,
+e.g. to `discovery` and `tdep_utils.collect_reports`. If the merged
+action is not run, e.g. IGNORED as its directory exists, the members
+are run on their own instead. Members keep a link to it as
+`member.coalesced`. Only blocking actions are merged.
+"""
+
+import asyncio
+import json
+import os
+
+from teff_py.actions import Action, State
+from teff_py.logstore import SUFFIXES, encode_log
+from teff_py.remote_utils import write_files
+
+
+def split_table(text, parts):
+    """Split the rows of a table `text` into `parts` equal consecutive
+    blocks, each with the comment lines of the table."""
+    lines = text.splitlines(keepends=True)
+    comments = [line for line in lines if line.lstrip().startswith("#")]
+    rows = [line for line in lines
+            if line.strip() and not line.lstrip().startswith("#")]
+    if len(rows) % parts:
+        raise ValueError("%d rows do not split into %d parts" %
+                         (len(rows), parts))
+
+    size = len(rows) // parts
+    return ["".join(comments + rows[i*size:(i+1)*size])
+            for i in range(parts)]
+
+
+class Coalesced():
+    "Merged action of the `members`, see `coalesced_class`."
+    __slots__ = ()
+
+    def __init__(self, members):
+        first = members[0]
+        axis = first.coalesce_axis
+        self.members = members
+        self.values = [member.args_source[axis] for member in members]
+        # bypasses custom constructors of the members class,
+        # their extra attributes are copied below
+        Action.__init__(self, dict(first.args_source, **{axis: self.values}),
+                        parent=first.parent)
+        for name, value in vars(first).items():
+            self.__dict__.setdefault(name, value)
+        for member in members:
+            member.coalesced = self
+
+    def make_prefix(self):
+        return "%s.x%d" % (self.members[0].make_prefix(), len(self.members))
+
+    def make_args_list(self):
+        return self.members[0].make_coalesced_args_list(self.values)
+
+    def _share(self):
+        for member in self.members:
+            member.runner = self.runner
+            member.state = self.state
+
+    def prepare(self):
+        # the class `prepare` expects a single value on the axis
+        args_source = self.args_source
+        self.args_source = self.members[0].args_source
+        try:
+            super().prepare()
+        finally:
+            self.args_source = args_source
+        for member in self.members:
+            if member.state == State.NEW:
+                member.prepare()
+
+    def run(self):
+        super().run()
+        if self.runner is None:         # not run, e.g. IGNORED
+            for member in self.members:
+                member.run()
+            return
+
+        files = [{} for _ in self.members]
+        errors = []
+        if self.state == State.SUCCEEDED:
+            try:
+                for table in self.coalesced_tables:
+                    parts = split_table((self.path / table).read(),
+                                        len(self.members))
+                    for member_files, text in zip(files, parts):
+                        member_files[table] = text
+            except Exception as e:
+                self.logger.error("Results not split: %s", e)
+                self.state = State.FAILED
+                errors.append("Results not split: %s" % e)
+        for member_files in files:
+            member_files.update(self.logs(errors))
+        self.write(files)
+        self._share()
+
+    def logs(self, errors=()):
+        "Files of the logs of the run: `out.log`, and `err.log` if failed."
+        lines = self.runner.out_log
+        if self.log_compression is None:
+            logs = {"out.log": "\n".join(lines)}
+        else:
+            if lines and lines[-1] == "":
+                lines.pop()     # final newline of the output
+            data, index = encode_log(lines, self.log_compression)
+            fname = "out.log" + SUFFIXES[self.log_compression]
+            logs = {fname: data, fname + ".idx": json.dumps(index)}
+        if self.state == State.FAILED:
+            logs["err.log"] = "\n".join(list(self.runner.err_log) +
+                                        list(errors))
+        return logs
+
+    def write(self, files):
+        """Write `files`, {file name: contents} per member, into the
+        member directories in one transfer."""
+        paths = [str(member.path) for member in self.members]
+        root = os.path.commonpath([os.path.dirname(p) for p in paths])
+        contents = {os.path.relpath(os.path.join(path, fname), root): text
+                    for path, member_files in zip(paths, files)
+                    for fname, text in member_files.items()}
+        if contents:
+            write_files(self.command.machine, contents, root)
+
+
+_classes = {}
+
+
+def coalesced_class(cls):
+    "Action class merging actions of class `cls`."
+    if cls not in _classes:
+        _classes[cls] = type(cls)("Coalesced" + cls.__name__,
+                                  (Coalesced, cls), {})
+    return _classes[cls]
+
+
+def coalescable(action):
+    axis = action.coalesce_axis
+    return axis is not None and action.state == State.NEW and \
+        isinstance(action.args_source, dict) and \
+        axis in action.args_source and \
+        not asyncio.iscoroutinefunction(type(action).run)
+
+
+def coalesce_key(action):
+    "Actions of equal keys differ only in their `coalesce_axis` value."
+    args = sorted((k, v) for k, v in action.args_source.items()
+                  if k != action.coalesce_axis)
+    return (type(action), id(action.parent), repr(args))
+
+
+def coalesce(actions):
+    """`actions` with the coalescable groups of two or more replaced by
+    their merged actions, in the order of their first members."""
+    groups = {}
+    order = []
+    for action in actions:
+        if not coalescable(action):
+            order.append(action)
+            continue
+        key = coalesce_key(action)
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(action)
+
+    result = []
+    for item in order:
+        if not isinstance(item, tuple):
+            result.append(item)
+            continue
+        members = sorted(groups[item],
+                         key=lambda a: a.args_source[a.coalesce_axis])
+        values = [member.args_source[member.coalesce_axis]
+                  for member in members]
+        if len(members) > 1 and \
+           members[0].make_coalesced_args_list(values) is not None:
+            result.append(coalesced_class(type(members[0]))(members))
+        else:
+            result.extend(members)
+    return result
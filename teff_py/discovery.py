@@ -0,0 +1,100 @@
+"""Bulk discovery of the state of actions on a machine.
+
+`discover` lists the sweep root with a single `find` and classifies
+every action from its directory contents, instead of one `exists()`
+round trip per action:
+
+    "absent"    no action directory
+    "prepared"  directory without logs
+    "out.log"   command ran, but not all the expected outputs exist
+    "err.log"   command failed
+    "outputs"   command ran and the expected outputs exist
+
+The action states are seeded accordingly, so that resuming a sweep
+prepares only the absent actions and runs only the prepared ones.
+"""
+
+import fnmatch
+
+from teff_py.actions import State, notify
+
+STATES = {
+    "absent": State.NEW,
+    "prepared": State.PREPARED,
+    "out.log": State.FINISHED,
+    "err.log": State.FAILED,
+    "outputs": State.SUCCEEDED,
+}
+
+_LOGS = ("out.log", "out.log.gz", "out.log.zst")
+
+
+def list_tree(machine, root, maxdepth=None):
+    """Directories and files under `root` on `machine` in one listing.
+    Symbolic links, e.g. to the outputs of a parent action, are left out.
+
+    Result: (set of directories, {directory: [file names]}), relative
+    to `root`."""
+    find = machine["find"][str(root), "-mindepth", "1"]
+    if maxdepth is not None:
+        find = find["-maxdepth", maxdepth]
+    listing = find["-printf", r"%y %P\n"](retcode=None)
+    notify("helper", machine, command="find")
+
+    dirs, files = set(), {}
+    for line in listing.splitlines():
+        kind, _, rel = line.partition(" ")
+        if kind == "d":
+            dirs.add(rel)
+        elif kind != "l":
+            parent, _, name = rel.rpartition("/")
+            files.setdefault(parent, []).append(name)
+    return dirs, files
+
+
+def classify(names, outputs):
+    "Category of an existing action directory holding files `names`."
+    if "err.log" in names:
+        return "err.log"
+    if not any(log in names for log in _LOGS):
+        return "prepared"
+    if all(fnmatch.filter(names, pattern) for pattern in outputs):
+        return "outputs"
+    return "out.log"
+
+
+def discover(machine, root, actions, outputs=None, seed=True):
+    """Categories of `actions` (all under `root` on `machine`) from a
+    single listing. The expected outputs of an action are the glob
+    `outputs` if given, its `expected_outputs` otherwise.
+
+    With `seed` the action states are set from the categories (see
+    `STATES`), and `prepare` no longer checks the action paths.
+
+    Result: list of categories in the order of `actions`."""
+    root = str(root).rstrip("/")
+    rel_paths = []
+    for action in actions:
+        path = str(action.path)
+        if not path.startswith(root + "/"):
+            raise ValueError(f"{path} is not under {root}.")
+        rel_paths.append(path[len(root) + 1:])
+
+    depth = max((p.count("/") + 2 for p in rel_paths), default=1)
+    dirs, files = list_tree(machine, root, maxdepth=depth)
+
+    result = []
+    for action, rel in zip(actions, rel_paths):
+        if rel not in dirs:
+            category = "absent"
+        else:
+            category = classify(
+                files.get(rel, []),
+                action.expected_outputs if outputs is None else outputs)
+        result.append(category)
+
+        if seed:
+            action.state = STATES[category]
+            action.discovered = category
+
+    return result
@@ -0,0 +1,189 @@
+"""Compressed, seekable storage of action logs.
+
+A log is stored as a sequence of independently compressed blocks of
+lines, e.g. `out.log.gz`, with a JSON block index next to it,
+`out.log.gz.idx`. A gzip log is a valid multi-member gzip file that
+`zcat`/`zgrep` read as usual; the index lets `LogReader` fetch line
+ranges, the tail or the last matches of a pattern while decompressing
+only the blocks involved.
+
+Codecs: "gzip" from the standard library and "zstd" when the
+`zstandard` package is installed.
+"""
+
+import gzip
+import json
+import os
+import re
+
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _codec(name):
+    "(compress, decompress) functions of the codec `name`."
+    if name == "gzip":
+        return (lambda data: gzip.compress(data, compresslevel=6),
+                gzip.decompress)
+    if name == "zstd":
+        import zstandard        # optional dependency
+        return (zstandard.ZstdCompressor().compress,
+                zstandard.ZstdDecompressor().decompress)
+
+    raise ValueError(f"Unknown log compression {name!r}.")
+
+
+def check_compression(name):
+    """Raise if the codec `name` is unknown or its module is missing,
+    e.g. at prepare rather than when the log is written."""
+    _codec(name)
+
+
+def encode_log(lines, compression="gzip", block_size=1 << 20):
+    """Compress `lines` (without newlines) into blocks of about
+    `block_size` uncompressed bytes.
+
+    Result: (data, index) - the compressed bytes and the block index
+    {"compression": name, "blocks": [[offset, size, first_line, nlines]]}"""
+    compress, _ = _codec(compression)
+    chunks, blocks = [], []
+    offset = first = 0
+    buf, buf_size = [], 0
+
+    def flush():
+        nonlocal offset, first, buf, buf_size
+        data = compress("".join(buf).encode())
+        chunks.append(data)
+        blocks.append([offset, len(data), first, len(buf)])
+        offset += len(data)
+        first += len(buf)
+        buf, buf_size = [], 0
+
+    for line in lines:
+        buf.append(line + "\n")
+        buf_size += len(buf[-1])
+        if buf_size >= block_size:
+            flush()
+    if buf:
+        flush()
+
+    return b"".join(chunks), {"compression": compression, "blocks": blocks}
+
+
+def write_log(fname, lines, compression="gzip", block_size=1 << 20,
+              machine=None):
+    """Store `lines` compressed at `fname` with its index at `fname`.idx,
+    on `machine` if given (e.g. a remote one), locally otherwise."""
+    data, index = encode_log(lines, compression, block_size)
+    index = json.dumps(index).encode()
+
+    if machine is None:
+        with open(fname, "wb") as f:
+            f.write(data)
+        with open(os.fspath(fname) + ".idx", "wb") as f:
+            f.write(index)
+    else:
+        machine.path(fname).write(data)
+        machine.path(str(fname) + ".idx").write(index)
+
+
+def resolve_log(fname):
+    """Path of the log `fname` as stored: `fname` itself if present,
+    otherwise its compressed variant. `None` if neither exists."""
+    fname = os.fspath(fname)
+    for suffix in ("",) + tuple(SUFFIXES.values()):
+        if os.path.isfile(fname + suffix):
+            return fname + suffix
+    return None
+
+
+def open_log(fname):
+    "Text stream of the lines of the log `fname`, plain or compressed."
+    stored = resolve_log(fname)
+    if stored is None:
+        raise FileNotFoundError(fname)
+    if stored.endswith(SUFFIXES["gzip"]):
+        return gzip.open(stored, "rt")
+    if stored.endswith(SUFFIXES["zstd"]):
+        import io
+        import zstandard        # optional dependency
+        return io.TextIOWrapper(
+            zstandard.ZstdDecompressor().stream_reader(open(stored, "rb"),
+                                                       closefd=True))
+    return open(stored)
+
+
+class LogReader():
+    "Random access to the lines of a log stored with `write_log`."
+
+    def __init__(self, fname):
+        self.fname = os.fspath(fname)
+        with open(self.fname + ".idx") as f:
+            index = json.load(f)
+        self.blocks = index["blocks"]
+        _, self._decompress = _codec(index["compression"])
+
+    def __len__(self):
+        if not self.blocks:
+            return 0
+        _, _, first, nlines = self.blocks[-1]
+        return first + nlines
+
+    def _block(self, i):
+        offset, size, _, _ = self.blocks[i]
+        with open(self.fname, "rb") as f:
+            f.seek(offset)
+            data = self._decompress(f.read(size))
+        return data.decode().split("\n")[:-1]
+
+    def _block_of(self, line):
+        lo, hi = 0, len(self.blocks) - 1
+        while lo < hi:          # last block starting at or before `line`
+            mid = (lo + hi + 1) // 2
+            if self.blocks[mid][2] <= line:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def lines(self, start=0, stop=None):
+        "Lines `start` to `stop` (exclusive) of the log, as `lines[start:stop]`."
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return []
+
+        result = []
+        for i in range(self._block_of(start), self._block_of(stop - 1) + 1):
+            first = self.blocks[i][2]
+            block = self._block(i)
+            result += block[max(0, start - first):stop - first]
+        return result
+
+    def tail(self, n=10):
+        "Last `n` lines of the log."
+        return self.lines(max(0, len(self) - n))
+
+    def grep(self, pattern, after=0, last=None, flags=0):
+        """Lines matching the regular expression `pattern`, each followed
+        by `after` lines of context, as lists of lines.
+
+        With `last` only the last `last` matches are returned, and blocks
+        are decompressed from the end of the log until they are found."""
+        regex = re.compile(pattern, flags)
+        order = range(len(self.blocks))
+        if last is not None:
+            order = reversed(order)
+
+        matches = []            # line numbers
+        for i in order:
+            first = self.blocks[i][2]
+            found = [first + j for j, line in enumerate(self._block(i))
+                     if regex.search(line)]
+            if last is None:
+                matches += found
+            else:
+                matches = found + matches
+                if len(matches) >= last:
+                    matches = matches[-last:]
+                    break
+
+        return [self.lines(line, line + after + 1) for line in matches]
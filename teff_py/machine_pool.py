@@ -0,0 +1,205 @@
+"""Pools of machines for load-balanced dispatch of actions.
+
+Actions are submitted to a `MachinePool` without naming a host. Each
+one is placed on the machine with the most free cores, its `command`
+and `path` rebound to that machine, and executed there.
+
+Child actions prefer machines sharing a filesystem with the machine
+of their parent. They are moved elsewhere only to keep an otherwise
+idle machine busy, and then only the `parent_files` they declare
+are transferred.
+"""
+
+import asyncio
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from plumbum.commands.base import (BoundCommand, BoundEnvCommand,
+                                   ConcreteCommand, Pipeline)
+
+from teff_py.actions import notify
+from teff_py.remote_utils import transfer
+
+logger = logging.getLogger(__name__)
+
+
+def rebind_command(command, machine):
+    """Rebuild the plumbum `command` for execution on `machine`.
+
+    Bound arguments, environments and pipelines are preserved;
+    executables are looked up by name on the target machine."""
+    if isinstance(command, BoundCommand):
+        return rebind_command(command.cmd, machine)[command.args]
+    if isinstance(command, BoundEnvCommand):
+        return BoundEnvCommand(rebind_command(command.cmd, machine),
+                               env=command.env, cwd=command.cwd)
+    if isinstance(command, Pipeline):
+        return rebind_command(command.srccmd, machine) | \
+            rebind_command(command.dstcmd, machine)
+    if isinstance(command, ConcreteCommand):
+        return machine[os.path.basename(str(command.executable))]
+
+    raise TypeError(f"Cannot rebind command {command!r}.")
+
+
+class PoolMachine():
+    "A machine of a pool with its capacity and current load."
+
+    def __init__(self, machine, cores, max_queue=None, name=None,
+                 filesystem=None):
+        self.machine = machine
+        self.cores = cores
+        self.max_queue = max_queue  # max number of actions dispatched at once
+        self.name = name or str(machine)
+        # machines with the same `filesystem` label see the same files
+        self.filesystem = filesystem or self.name
+
+        self.used_cores = 0
+        self.active = 0
+
+    def __repr__(self):
+        return f"<PoolMachine {self.name}: {self.used_cores}/{self.cores} cores>"
+
+    @property
+    def free_cores(self):
+        return self.cores - self.used_cores
+
+    def fits(self, cores):
+        if self.max_queue is not None and self.active >= self.max_queue:
+            return False
+        # actions larger than the machine may only run there alone
+        return cores <= self.free_cores or self.active == 0
+
+    def acquire(self, cores):
+        self.used_cores += cores
+        self.active += 1
+
+    def release(self, cores):
+        self.used_cores -= cores
+        self.active -= 1
+
+
+class MachinePool():
+    """Dispatcher of actions over several `PoolMachine`s.
+
+    Blocking `prepare` and `run` methods are executed in worker threads,
+    coroutine `run` methods (e.g. of `ScheduledAction`) are awaited."""
+
+    def __init__(self, machines, max_threads=None):
+        self.machines = list(machines)
+        self.placed = Counter()     # machine name -> actions dispatched
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_threads or sum(m.cores for m in self.machines))
+        self._changed = {}      # event loop -> asyncio.Condition
+
+    @staticmethod
+    def cores_of(action):
+        return action.num_mpi_procs or 1
+
+    def score(self, pool_machine, action):
+        "Preference of `pool_machine` for `action`, the higher the better."
+        return (pool_machine.free_cores, -pool_machine.active)
+
+    def source_of(self, action):
+        "The `PoolMachine` that holds the outputs of the parent of `action`."
+        source = getattr(action.parent, "placement", None)
+        return source if source in self.machines else None
+
+    def is_local(self, pool_machine, action):
+        source = self.source_of(action)
+        return source is None or source.filesystem == pool_machine.filesystem
+
+    def place(self, action):
+        """The best machine able to take `action` now, or `None`.
+
+        Machines holding the parent outputs come first. Others are only
+        chosen when idle, as the parent data has to be moved there."""
+        cores = self.cores_of(action)
+        candidates = [m for m in self.machines if m.fits(cores)]
+
+        local = [m for m in candidates if self.is_local(m, action)]
+        if not local:
+            local = [m for m in candidates if m.active == 0]
+
+        return max(local, key=lambda m: self.score(m, action), default=None)
+
+    def bind(self, action, pool_machine):
+        "Rebind `command` and `path` of `action` to `pool_machine`."
+        machine = pool_machine.machine
+        action.command = rebind_command(action.command, machine)
+        action.path = machine.path(str(action.make_path()))
+        # kept by the action, not the pool: no record of past actions
+        action.placement = pool_machine
+        self.placed[pool_machine.name] += 1
+
+    def _condition(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._changed:
+            self._changed[loop] = asyncio.Condition()
+        return self._changed[loop]
+
+    def stage_parent_files(self, action, source, pool_machine):
+        "Copy the `parent_files` of `action` from `source` to `pool_machine`."
+        if not action.parent_files:
+            action.logger.warning(
+                "Placed away from parent outputs, but no `parent_files` "
+                "declared to transfer.")
+            return []
+
+        moved = transfer(source.machine, action.parent.path,
+                         pool_machine.machine, str(action.parent.path),
+                         action.parent_files)
+        action.logger.debug("Transferred from %s: %s", source.name, moved)
+        return moved
+
+    async def _execute(self, action, pool_machine, source=None):
+        loop = asyncio.get_running_loop()
+        if source is not None:
+            await loop.run_in_executor(
+                self._executor, self.stage_parent_files,
+                action, source, pool_machine)
+        await loop.run_in_executor(self._executor, action.prepare)
+        if asyncio.iscoroutinefunction(action.run):
+            await action.run()
+        else:
+            await loop.run_in_executor(self._executor, action.run)
+
+    async def submit(self, action):
+        """Place `action` as soon as a machine can take it, then prepare
+        and run it there. Returns the `PoolMachine` used."""
+        cores = self.cores_of(action)
+        changed = self._condition()
+        notify("begin", action, phase="queue")
+        async with changed:
+            await changed.wait_for(lambda: self.place(action) is not None)
+            pool_machine = self.place(action)
+            pool_machine.acquire(cores)
+        notify("end", action, phase="queue", machine=pool_machine.name)
+
+        try:
+            source = None
+            if not self.is_local(pool_machine, action):
+                source = self.source_of(action)
+            self.bind(action, pool_machine)
+            action.logger.debug("Placed on %s", pool_machine.name)
+            await self._execute(action, pool_machine, source)
+        finally:
+            async with changed:
+                pool_machine.release(cores)
+                changed.notify_all()
+
+        return pool_machine
+
+    async def run(self, actions, model=None):
+        """Submit all `actions` and wait for them to finish.
+
+        With a runtime `model` (e.g. `runtime_model.RuntimeHistory`) the
+        actions are submitted in its `order`, longest work first."""
+        if model is not None:
+            actions = model.order(actions)
+        return await asyncio.gather(*(self.submit(a) for a in actions))
+
+    def shutdown(self):
+        self._executor.shutdown()
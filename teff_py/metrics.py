@@ -0,0 +1,245 @@
+"""Prometheus metrics of running workflows.
+
+A `Metrics` listener counts the action state transitions and times the
+processing phases per Action class, the action commands run by
+`ShellCommandRunner` and the Slurm queue polls. The commands spawned,
+action and helper ones (file staging, logs writing, job lookups), are
+counted per machine, the ones on remote machines as SSH round trips.
+The metrics are exposed in the text exposition format, on an HTTP
+endpoint and/or in a file of the node exporter textfile collector:
+
+    with Metrics(port=9108):    # http://localhost:9108/metrics
+        ...                     # workflow
+    with Metrics(textfile="/var/lib/node_exporter/textfile/teff.prom"):
+        ...
+
+E.g. `time() - teff_last_transition_timestamp_seconds > 3600` flags
+a stalled sweep. Actions created before the listener was added are
+not in the `teff_actions` gauges.
+"""
+
+import bisect
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from teff_py.actions import add_listener, remove_listener
+from teff_py.tracing import host_name, machine_name
+
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# upper bounds of the durations histograms, seconds
+BUCKETS = (0.01, 0.1, 1.0, 10.0, 60.0, 600.0, 3600.0, 4 * 3600.0, 86400.0)
+
+# name -> (type, help)
+METRICS = {
+    "teff_actions_created": ("counter", "Actions created."),
+    "teff_action_transitions": ("counter", "Action state transitions."),
+    "teff_actions": ("gauge", "Actions per state."),
+    "teff_last_transition_timestamp_seconds": (
+        "gauge", "Time of the last action state transition."),
+    "teff_action_phase_seconds": (
+        "histogram", "Durations of the action processing phases."),
+    "teff_action_command_seconds": (
+        "histogram", "Durations of the action commands run, per machine."),
+    "teff_commands": (
+        "counter", "Commands spawned per machine, action and helper ones."),
+    "teff_ssh_round_trips": ("counter", "Commands run on remote machines."),
+    "teff_slurm_poll_seconds": ("histogram", "Durations of the queue polls."),
+    "teff_slurm_queue_depth": ("gauge", "Jobs in the queue at the last poll."),
+}
+
+
+class Histogram():
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one up to +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", r"\\").replace('"', r'\"')
+                     .replace("\n", r"\n"))
+        for k, v in labels)
+
+
+class Metrics():
+    """Workflow metrics, an `actions` listener.
+
+    Serves them on `addr`:`port` if `port` is given (0 picks a free
+    one, see `self.port`), writes them to `textfile` at most every
+    `interval` seconds and on `close`."""
+
+    def __init__(self, port=None, addr="127.0.0.1", textfile=None,
+                 interval=15.0, buckets=BUCKETS):
+        self.port = port
+        self.addr = addr
+        self.textfile = textfile
+        self.interval = interval
+        self.buckets = buckets
+
+        self.values = defaultdict(dict)     # name -> {labels: value}
+        self._lock = threading.Lock()
+        self._started = {}  # (action id, phase) -> start time
+        self._server = None
+        self._last_write = 0.0
+
+    def start(self):
+        add_listener(self)
+        if self.port is not None:
+            self.serve()
+        return self
+
+    def close(self):
+        remove_listener(self)
+        if self.textfile is not None:
+            self.write_textfile()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _add(self, name, labels, value=1):
+        values = self.values[name]
+        values[labels] = values.get(labels, 0) + value
+
+    def _observe(self, name, labels, value):
+        values = self.values[name]
+        if labels not in values:
+            values[labels] = Histogram(self.buckets)
+        values[labels].observe(value)
+
+    def _count_command(self, machine, command):
+        self._add("teff_commands", (("machine", machine),
+                                    ("command", command)))
+        if machine != "local":
+            self._add("teff_ssh_round_trips", (("machine", machine),))
+
+    def __call__(self, event, subject, phase=None, **info):
+        now = time.monotonic()
+        with self._lock:
+            if event == "state":
+                cls = (("class", type(subject).__name__),)
+                old, new = info["old"], info["new"]
+                if old is None:
+                    self._add("teff_actions_created", cls)
+                else:
+                    self._add("teff_action_transitions",
+                              cls + (("from", old.name), ("to", new.name)))
+                    # untracked actions are not counted down
+                    if self.values["teff_actions"].get(
+                            (("state", old.name),), 0) > 0:
+                        self._add("teff_actions", (("state", old.name),), -1)
+                self._add("teff_actions", (("state", new.name),))
+                self.values["teff_last_transition_timestamp_seconds"][()] = \
+                    time.time()
+            elif event == "begin":
+                self._started[(id(subject), phase)] = now
+            elif event == "end":
+                start = self._started.pop((id(subject), phase), None)
+                if start is not None:
+                    self._observe("teff_action_phase_seconds",
+                                  (("class", type(subject).__name__),
+                                   ("phase", phase)), now - start)
+            elif event == "command":
+                machine = machine_name(subject)
+                self._observe("teff_action_command_seconds",
+                              (("machine", machine),), info["elapsed"])
+                self._count_command(machine, "action")
+            elif event == "helper":
+                self._count_command(host_name(subject), info["command"])
+            elif event == "poll":
+                self._observe("teff_slurm_poll_seconds", (), info["elapsed"])
+                if "depth" in info:
+                    self.values["teff_slurm_queue_depth"][()] = info["depth"]
+
+            write = self.textfile is not None and \
+                now - self._last_write >= self.interval
+            if write:
+                self._last_write = now
+        if write:
+            self.write_textfile()
+
+    def exposition(self, openmetrics=True):
+        """Metrics in the OpenMetrics text format, or the Prometheus one
+        (version 0.0.4, as read by the textfile collector)."""
+        lines = []
+        with self._lock:
+            for name, (kind, text) in METRICS.items():
+                # OpenMetrics counter families drop the `_total` suffix
+                family = name + "_total" \
+                    if kind == "counter" and not openmetrics else name
+                lines.append("# HELP %s %s" % (family, text))
+                lines.append("# TYPE %s %s" % (family, kind))
+                for labels, value in sorted(self.values.get(name, {}).items()):
+                    if kind == "histogram":
+                        total = 0
+                        for bound, count in zip(value.buckets + (math.inf,),
+                                                value.counts):
+                            total += count
+                            le = "+Inf" if bound == math.inf else repr(bound)
+                            lines.append("%s_bucket%s %d" % (
+                                name, format_labels(labels + (("le", le),)),
+                                total))
+                        lines.append("%s_count%s %d" % (
+                            name, format_labels(labels), total))
+                        lines.append("%s_sum%s %r" % (
+                            name, format_labels(labels), value.sum))
+                    else:
+                        sample = name + "_total" if kind == "counter" else name
+                        lines.append("%s%s %r" % (
+                            sample, format_labels(labels), value))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self):
+        "Write the metrics to `textfile`, atomically for the collector."
+        tmp = "%s.%d.tmp" % (self.textfile, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(self.exposition(openmetrics=False))
+        os.replace(tmp, self.textfile)
+
+    def serve(self):
+        "Serve the metrics at /metrics from a background thread."
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                openmetrics = "application/openmetrics-text" in \
+                    self.headers.get("Accept", "")
+                body = metrics.exposition(openmetrics).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_TYPE
+                                 if openmetrics else PROMETHEUS_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):   # no access log on stderr
+                pass
+
+        self._server = ThreadingHTTPServer((self.addr, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
@@ -0,0 +1,151 @@
+"""Live progress of running workflows.
+
+A `ProgressMonitor` follows the state changes of all the actions and
+keeps a compact status line up to date: state counts, completion rate,
+cores in use and the estimated time to completion.
+
+    with ProgressMonitor():
+        ...                     # actions creation and processing
+
+Actions created before the monitor starts listening are counted with
+`track`.
+
+On a terminal the line is redrawn in place at most every `interval`
+seconds, otherwise it is printed every `interval` seconds (a minute by
+default) so that log files are not flooded.
+"""
+
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from teff_py.actions import State, add_listener, remove_listener
+
+DONE = {State.SUCCEEDED, State.FAILED, State.FINISHED, State.IGNORED}
+BUSY = {State.RUNNING, State.SUBMITTED}
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    if seconds >= 86400:
+        return "%dd%02dh" % (seconds // 86400, seconds % 86400 // 3600)
+    if seconds >= 3600:
+        return "%dh%02dm" % (seconds // 3600, seconds % 3600 // 60)
+    return "%dm%02ds" % (seconds // 60, seconds % 60)
+
+
+class ProgressMonitor():
+    """Aggregated state of the actions, an `actions` listener.
+
+    The ETA divides the remaining actions by the completion rate over
+    the last `window` seconds; before any completion it is predicted
+    from a runtime `model` (e.g. `runtime_model.RuntimeHistory`) if
+    given, for the actions running."""
+
+    def __init__(self, stream=None, interval=None, window=300, model=None):
+        self.stream = stream or sys.stderr
+        self.tty = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.interval = interval or (1.0 if self.tty else 60.0)
+        self.window = window
+        self.model = model
+
+        self.counts = Counter()     # State -> actions
+        self.cores = 0              # of running and submitted actions
+        self.done = deque()         # completion times within `window`
+        self.started = time.monotonic()
+
+        self._lock = threading.Lock()
+        self._busy = {}             # action id -> action, for predictions
+        self._last_render = 0.0
+
+    def __enter__(self):
+        add_listener(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_listener(self)
+        self.render(final=True)
+
+    def __call__(self, event, action, old=None, new=None, **info):
+        if event != "state":
+            return
+        now = time.monotonic()
+        with self._lock:
+            if old is not None and self.counts[old] > 0:  # else untracked
+                self.counts[old] -= 1
+            self.counts[new] += 1
+
+            cores = action.num_mpi_procs or 1
+            if old in BUSY and new not in BUSY:
+                self.cores -= cores
+                self._busy.pop(id(action), None)
+            elif new in BUSY and old not in BUSY:
+                self.cores += cores
+                if self.model is not None:
+                    self._busy[id(action)] = action
+            if new in DONE and old not in DONE:
+                self.done.append(now)
+
+            render = now - self._last_render >= self.interval
+            if render:
+                self._last_render = now
+        if render:
+            self.render()
+
+    def track(self, actions):
+        "Count `actions` created before the monitor was listening."
+        with self._lock:
+            for action in actions:
+                self.counts[action.state] += 1
+                if action.state in BUSY:
+                    self.cores += action.num_mpi_procs or 1
+
+    def rate(self):
+        "Completions per second over the last `window` seconds."
+        now = time.monotonic()
+        while self.done and now - self.done[0] > self.window:
+            self.done.popleft()
+        span = min(self.window, now - self.started)
+        return len(self.done) / span if span > 0 else 0.0
+
+    def eta(self):
+        "Estimated seconds to the completion of all known actions, or None."
+        remaining = sum(n for state, n in self.counts.items()
+                        if state not in DONE)
+        if remaining == 0:
+            return 0.0
+        rate = self.rate()
+        if rate > 0:
+            return remaining / rate
+        if self._busy:
+            predicted = [self.model.predict(a) for a in self._busy.values()]
+            predicted = [t for t in predicted if t is not None]
+            if predicted:
+                # the running actions set the pace for the rest
+                mean = sum(predicted) / len(predicted)
+                return mean * remaining / len(self._busy)
+        return None
+
+    def status_line(self):
+        with self._lock:
+            counts = dict(self.counts)
+            total = sum(counts.values())
+            done = sum(counts.get(s, 0) for s in DONE)
+            rate, eta = self.rate(), self.eta()
+            cores = self.cores
+
+        states = " ".join("%s %d" % (s.name.lower(), counts[s])
+                          for s in State if counts.get(s))
+        return "%d/%d done | %s | %d cores | %.1f/min | ETA %s" % (
+            done, total, states, cores, 60 * rate, format_duration(eta))
+
+    def render(self, final=False):
+        line = time.strftime("[%H:%M:%S] ") + self.status_line()
+        if self.tty:
+            self.stream.write("\r\033[K" + line + ("\n" if final else ""))
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
@@ -0,0 +1,144 @@
+"""Dry-run planning of workflows.
+
+`plan` evaluates `make_prefix`, `make_path` and `make_args_list` of
+every action of a sweep, without spawning processes or touching the
+filesystem, and reports what the workflow would create:
+
+    p = plan(actions)
+    print(p.summary())
+    print(p.tree())
+    p.collisions                # paths shared by several actions
+"""
+
+from collections import Counter
+
+from teff_py.actions import Action
+from teff_py.async_actions import ScheduledAction
+
+
+class Plan():
+    "Paths, arguments and resources of the actions of a workflow."
+
+    def __init__(self):
+        self.actions = []
+        self.paths = []         # str
+        self.args = []
+        self.counts = Counter()  # class name -> actions
+        self.cores = Counter()   # class name -> cores requested
+        self.core_hours = Counter()  # class name -> predicted core-hours
+        self.jobs = 0           # scheduler submissions
+        self.collisions = {}    # path -> [actions]
+        self.errors = []        # (action, exception)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def summary(self):
+        lines = ["%d actions, %d directories, %d scheduler jobs, %d cores"
+                 % (len(self), len(set(self.paths)), self.jobs,
+                    sum(self.cores.values()))]
+        for name, count in sorted(self.counts.items()):
+            line = "  %-24s %8d actions %8d cores" % (
+                name, count, self.cores[name])
+            if name in self.core_hours:
+                line += " %10.1f core-hours" % self.core_hours[name]
+            lines.append(line)
+        if self.collisions:
+            lines.append("%d colliding paths" % len(self.collisions))
+        if self.errors:
+            lines.append("%d actions failed to plan" % len(self.errors))
+        return "\n".join(lines)
+
+    def tree(self, max_children=4):
+        """Directory tree of the planned action paths as text, listing at
+        most `max_children` entries per directory."""
+        root = {}
+        for path in self.paths:
+            node = root
+            for part in path.rstrip("/").split("/"):
+                node = node.setdefault(part, {})
+
+        def size(node):
+            return 1 + sum(size(child) for child in node.values())
+
+        lines = []
+
+        def render(node, indent):
+            items = sorted(node.items())
+            for name, child in items[:max_children]:
+                while len(child) == 1:  # collapse chains of directories
+                    (sub, child), = child.items()
+                    name += "/" + sub
+                lines.append(indent + name + "/")
+                render(child, indent + "  ")
+            rest = [child for _, child in items[max_children:]]
+            if rest:
+                lines.append("%s... %d more (%d directories)" % (
+                    indent, len(rest), sum(size(c) for c in rest)))
+
+        render(root, "")
+        return "\n".join(lines)
+
+
+def _cores(action):
+    return action.num_mpi_procs or 1
+
+
+def plan(actions, model=None):
+    """Plan of the workflow made of `actions`, all evaluated in memory.
+
+    With a runtime `model` (e.g. `runtime_model.RuntimeHistory`) the
+    core-hours of the actions are predicted as well. Exceptions raised
+    by the actions are collected in `Plan.errors`."""
+    result = Plan()
+    paths = {}                  # action id -> path, reused for children
+    cwds = {}                   # machine id -> working directory
+    first = {}                  # path -> first action planned there
+
+    for action in actions:
+        try:
+            path = getattr(action, "_path", None)
+            if path is not None:
+                path = str(path)
+            elif type(action).make_path is not Action.make_path:
+                path = str(action.make_path())
+            else:
+                # `Action.make_path` with string operations only
+                parent = action.parent
+                if parent is None:
+                    machine = action.command.machine
+                    if id(machine) not in cwds:
+                        cwds[id(machine)] = str(machine.cwd)
+                    base = cwds[id(machine)]
+                else:
+                    base = paths.get(id(parent))
+                    if base is None:
+                        base = str(parent.path)
+                path = base.rstrip("/") + "/" + action.make_prefix()
+            args = action.make_args_list()
+        except Exception as e:
+            result.errors.append((action, e))
+            continue
+
+        paths[id(action)] = path
+        result.actions.append(action)
+        result.paths.append(path)
+        result.args.append(args)
+
+        name = type(action).__name__
+        cores = _cores(action)
+        result.counts[name] += 1
+        result.cores[name] += cores
+        if isinstance(action, ScheduledAction):
+            result.jobs += 1
+        if model is not None:
+            predicted = model.predict(action)
+            if predicted is not None:
+                result.core_hours[name] += predicted * cores / 3600
+
+        if path in first:
+            result.collisions.setdefault(path, [first[path]]).append(action)
+        else:
+            first[path] = action
+
+    return result
@@ -0,0 +1,291 @@
+"""Profiling of the driver-side overhead of workflows.
+
+A `Profiler` follows the prepare, run and post-processing phases of the
+actions: the CPU time and the memory allocated during the phases per
+Action class (tracemalloc), the hot spots per class sampled from the
+stacks of the threads in a phase, and a process-wide cProfile profile
+of the driver while any phase is open:
+
+    with Profiler() as profiler:
+        ...                     # workflow
+    print(profiler.report())
+
+Times are CPU times of the driver: the time spent waiting for the
+external commands is left out, while their construction, the logging,
+the decorators and the listeners are in. From Python 3.12 on, cProfile
+follows all threads and only one profile may be enabled at a time:
+the single profile is enabled by the first phase opened and disabled
+with the last one closed. Before, a profile follows only the thread it
+is enabled in: each thread has its own, enabled by its first phase
+opened, and `stats` merges them.
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+from teff_py.actions import add_listener, remove_listener
+
+PHASES = ("prepare", "run", "post")
+
+# cProfile hooks only the calling thread before Python 3.12, and the
+# `disable` of a profile shared by threads breaks the others' records
+_PER_THREAD = sys.version_info < (3, 12)
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return "%.0f %s" % (size, unit)
+        size /= 1024
+    return "%.1f GiB" % size
+
+
+def _thread_cpu_time(thread_id):
+    # CPU seconds of another thread, None where not available
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+def _walk(frame):
+    # frames of a stack, innermost first, the profiler's own left out
+    while frame is not None:
+        if frame.f_code.co_filename != __file__:
+            yield frame
+        frame = frame.f_back
+
+
+class Profiler():
+    """Per Action class profiles of the `phases`, an `actions` listener.
+
+    Stacks are sampled every `interval` seconds, each sample weighted
+    with the CPU time of its thread since the previous one. Allocations
+    are traced with `frames` frames per trace if `memory`; a tracemalloc
+    tracing started elsewhere is reused."""
+
+    def __init__(self, phases=PHASES, memory=True, frames=1, interval=0.005):
+        self.phases = phases
+        self.memory = memory
+        self.frames = frames
+        self.interval = interval
+
+        self.profiles = {}      # thread id (None from 3.12) -> cProfile
+        self.calls = defaultdict(int)   # (class name, phase) -> phases
+        self.cpu = defaultdict(float)   # (class name, phase) -> CPU seconds
+        self.allocated = defaultdict(int)   # class name -> net bytes
+        self.peak = defaultdict(int)        # class name -> largest peak
+        # class name -> function -> [own CPU, total CPU, samples]
+        self.samples = defaultdict(lambda: defaultdict(lambda: [0.0, 0.0, 0]))
+
+        self._open = {}         # thread id -> stack of the open phases
+        self._cpu = {}          # thread id -> CPU time at the last sample
+        self._active = defaultdict(int)     # `profiles` key -> open phases
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = None
+        self._tracing = False
+        self._snapshots = None
+
+    def start(self):
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._tracing = True
+            self._snapshots = [tracemalloc.take_snapshot()]
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._sample_loop,
+                                         name="teff-profiler", daemon=True)
+        self._sampler.start()
+        add_listener(self)
+        return self
+
+    def stop(self):
+        remove_listener(self)
+        self._stopped.set()
+        self._sampler.join()
+        with self._lock:
+            # stopped within a phase: only the profile of this thread
+            # may be disabled before 3.12, the others are left
+            key = threading.get_ident() if _PER_THREAD else None
+            if self._active.get(key):
+                self.profiles[key].disable()
+            self._active.clear()
+        if self.memory:
+            self._snapshots.append(tracemalloc.take_snapshot())
+            if self._tracing:
+                tracemalloc.stop()
+                self._tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _sample_loop(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        "Attribute the current stacks of the threads in a phase."
+        frames = sys._current_frames()
+        # under the lock, the sampled threads are within their phases
+        with self._lock:
+            for thread_id, stack in self._open.items():
+                frame = frames.get(thread_id)
+                if not stack or frame is None:
+                    continue
+                cpu = _thread_cpu_time(thread_id)
+                if cpu is None:
+                    weight = self.interval
+                else:
+                    weight = cpu - self._cpu.get(thread_id, cpu)
+                    self._cpu[thread_id] = cpu
+
+                functions = self.samples[stack[-1][0]]
+                seen = set()
+                for frame in _walk(frame):
+                    code = frame.f_code
+                    func = (code.co_filename, code.co_firstlineno,
+                            code.co_name)
+                    if not seen:        # innermost: own time
+                        functions[func][0] += weight
+                    if func not in seen:
+                        seen.add(func)
+                        functions[func][1] += weight
+                        functions[func][2] += 1
+
+    def _enable(self, thread_id):
+        key = thread_id if _PER_THREAD else None
+        self._active[key] += 1
+        if self._active[key] == 1:
+            if key not in self.profiles:
+                self.profiles[key] = cProfile.Profile(time.process_time)
+            self.profiles[key].enable()
+
+    def _disable(self, thread_id):
+        key = thread_id if _PER_THREAD else None
+        self._active[key] -= 1
+        if self._active[key] == 0:
+            self.profiles[key].disable()
+
+    def __call__(self, event, action, phase=None, **info):
+        if phase not in self.phases:
+            return
+        thread_id = threading.get_ident()
+
+        if event == "begin":
+            name = type(action).__name__
+            memory = tracemalloc.get_traced_memory()[0] if self.memory else 0
+            if self.memory:
+                tracemalloc.reset_peak()
+            with self._lock:
+                stack = self._open.setdefault(thread_id, [])
+                if not stack:
+                    self._cpu[thread_id] = time.thread_time()
+                stack.append((name, phase, id(action), time.thread_time(),
+                              memory))
+                self._enable(thread_id)
+        elif event == "end":
+            with self._lock:
+                stack = self._open.get(thread_id)
+                if not stack or stack[-1][1:3] != (phase, id(action)):
+                    return
+                name, _, _, cpu, memory = stack.pop()
+                if not stack:
+                    del self._open[thread_id]
+                    self._cpu.pop(thread_id, None)
+                self._disable(thread_id)
+
+            cpu = time.thread_time() - cpu
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+            with self._lock:
+                self.calls[name, phase] += 1
+                self.cpu[name, phase] += cpu
+                if self.memory:
+                    self.allocated[name] += current - memory
+                    self.peak[name] = max(self.peak[name], peak - memory)
+
+    def stats(self):
+        "`pstats.Stats` of the process-wide profile, None if empty."
+        stats = None
+        for profile in list(self.profiles.values()):
+            try:
+                profile = pstats.Stats(profile)
+            except TypeError:   # nothing profiled yet
+                continue
+            if stats is None:
+                stats = profile
+            else:
+                stats.add(profile)
+        return stats
+
+    def hot_spots(self, name, top=10):
+        """The `top` functions by own CPU time in the phases of `name`:
+        (own seconds, total seconds, samples, (file, line, function))."""
+        rows = [(own, total, n, func) for func, (own, total, n) in
+                list(self.samples.get(name, {}).items())]
+        return sorted(rows, reverse=True)[:top]
+
+    def allocation_sites(self, top=10):
+        "The `top` source lines by memory allocated since `start`."
+        if not self._snapshots:
+            return []
+        if len(self._snapshots) == 1:   # still running
+            snapshots = self._snapshots + [tracemalloc.take_snapshot()]
+        else:
+            snapshots = self._snapshots
+        ignored = [tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                   tracemalloc.Filter(False, __file__)]
+        first, last = (s.filter_traces(ignored) for s in snapshots)
+        return [stat for stat in last.compare_to(first, "lineno")
+                if stat.size_diff > 0][:top]
+
+    def report(self, top=10):
+        "Text report of the CPU time, hot spots and allocations per class."
+        names = sorted({name for name, _ in self.calls},
+                       key=lambda n: -sum(self.cpu[n, p] for p in self.phases))
+        lines = []
+        for name in names:
+            lines.append("%s: %s" % (name, ", ".join(
+                "%s %d x %.3fs" % (phase, self.calls[name, phase],
+                                   self.cpu[name, phase])
+                for phase in self.phases if self.calls[name, phase])))
+            if self.memory:
+                lines.append("  allocated %s, peak %s" % (
+                    format_size(self.allocated[name]),
+                    format_size(self.peak[name])))
+            lines.append("  %9s %9s %8s  %s" % ("own", "total", "samples",
+                                               "function"))
+            for own, total, n, (fname, line, func) in \
+                    self.hot_spots(name, top):
+                lines.append("  %8.4fs %8.4fs %8d  %s:%d(%s)" % (
+                    own, total, n, os.path.basename(fname), line, func))
+        stats = self.stats()
+        if stats is not None:
+            lines.append("Process-wide:")
+            lines.append("  %9s %9s %8s  %s" % ("own", "total", "calls",
+                                               "function"))
+            rows = sorted(((tt, ct, nc, func) for func, (cc, nc, tt, ct, _)
+                           in stats.stats.items()), reverse=True)[:top]
+            for tt, ct, nc, (fname, line, func) in rows:
+                where = func if fname == "~" else "%s:%d(%s)" % (
+                    os.path.basename(fname), line, func)
+                lines.append("  %8.4fs %8.4fs %8d  %s" % (tt, ct, nc, where))
+        if self.memory:
+            lines.append("Allocation sites:")
+            for stat in self.allocation_sites(top):
+                frame = stat.traceback[0]
+                lines.append("  %10s in %6d blocks  %s:%d" % (
+                    format_size(stat.size_diff), stat.count_diff,
+                    frame.filename, frame.lineno))
+        return "\n".join(lines)
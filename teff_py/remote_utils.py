@@ -0,0 +1,280 @@
+"""Utilities for data exchange with remote machines.
+
+Input and output directories are moved as single compressed tar
+archives instead of file-by-file copies. Files whose content already
+matches on the receiving side, judged by their SHA-1 hashes, are skipped.
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import time
+import uuid
+from fnmatch import fnmatch
+from plumbum import local
+from plumbum.commands.base import shquote
+from plumbum.path.utils import copy
+
+from teff_py import tdep_reports
+from teff_py.actions import notify
+
+logger = logging.getLogger(__name__)
+
+
+def hold_channel(channel=None):
+    """Async context of a remote command: `channel()`, e.g.
+    `systems_runner.System.channel` limiting the concurrent SSH channels,
+    no-op if `channel` is None."""
+    if channel is None:
+        return contextlib.nullcontext()
+    return channel()
+
+
+def _sha1(fname, blocksize=1 << 20):
+    h = hashlib.sha1()
+    with open(fname, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _matches(fname, patterns):
+    return patterns is None or any(fnmatch(fname, p) for p in patterns)
+
+
+def _find_files(local_dir, patterns=None):
+    "Regular files under `local_dir`: {path relative to its parent: full path}"
+    local_dir = os.fspath(local_dir)
+    parent = os.path.dirname(local_dir.rstrip(os.sep))
+    files = {}
+    for dirpath, _, filenames in os.walk(local_dir):
+        for fname in filenames:
+            full = os.path.join(dirpath, fname)
+            if not _matches(fname, patterns):
+                continue
+            if os.path.islink(full):
+                logger.warning("Symbolic link not transferred: %s", full)
+                continue
+            files[os.path.relpath(full, parent)] = full
+    return files
+
+
+def _find_command(names, patterns=None, maxdepth=None):
+    "Shell `find` invocation over `names` restricted to `patterns`."
+    cmd = "find %s" % " ".join(shquote(n) for n in names)
+    if maxdepth is not None:
+        cmd += " -maxdepth %d" % maxdepth
+    cmd += " -type f"
+    if patterns:
+        cmd += " \\( %s \\)" % " -o ".join("-name %s" % shquote(p)
+                                           for p in patterns)
+    return cmd
+
+
+def remote_hashes(machine, root, names, patterns=None, create=False,
+                  maxdepth=None):
+    """SHA-1 hashes of regular files in `names` directories under `root`
+    on `machine`, obtained with a single remote command.
+
+    Result: {path relative to `root`: sha1 hex digest}"""
+    script = "cd %s && %s -print0 2>/dev/null | xargs -0 -r sha1sum" % (
+        shquote(str(root)), _find_command(names, patterns, maxdepth))
+    if create:
+        script = "mkdir -p %s && %s" % (shquote(str(root)), script)
+
+    _, stdout, _ = machine["sh"]["-c", script].run(retcode=None)
+    notify("helper", machine, command="sh")
+
+    hashes = {}
+    for line in stdout.splitlines():
+        digest, _, fname = line.partition("  ")
+        if fname:
+            hashes[os.path.normpath(fname)] = digest
+    return hashes
+
+
+def push(machine, local_dirs, remote_root, compresslevel=6):
+    """Stage `local_dirs` as subdirectories of `remote_root` on `machine`.
+
+    Files already present remotely with the same content are skipped,
+    the rest travel in one gzip-compressed tar archive.
+
+    Result: list of transferred paths relative to `remote_root`."""
+    files = {}
+    for local_dir in local_dirs:
+        found = _find_files(local_dir)
+        clashes = sorted(set(files) & set(found))
+        if clashes:     # e.g. directories of the same name
+            raise ValueError("%s: already staged from %s" % (
+                found[clashes[0]], files[clashes[0]]))
+        files.update(found)
+
+    names = sorted({fname.split(os.sep)[0] for fname in files})
+    if not names:
+        return []
+
+    # only files present remotely are hashed, the others are sent as is
+    known = remote_hashes(machine, remote_root, names, create=True)
+    todo = sorted(fname for fname, full in files.items()
+                  if fname not in known or known[fname] != _sha1(full))
+    logger.debug("Staging %d of %d files to %s",
+                 len(todo), len(files), remote_root)
+    if not todo:
+        return []
+
+    archive = ".teff-stage-%s.tar.gz" % uuid.uuid4().hex
+    with tempfile.TemporaryDirectory() as tmpdir:
+        local_archive = os.path.join(tmpdir, archive)
+        with tarfile.open(local_archive, "w:gz",
+                          compresslevel=compresslevel) as tar:
+            for fname in todo:
+                tar.add(files[fname], arcname=fname)
+
+        copy(local.path(local_archive), machine.path(remote_root) / archive)
+
+    script = "cd %s && tar -xzf %s; status=$?; rm -f %s; exit $status" % (
+        shquote(str(remote_root)), archive, archive)
+    machine["sh"]["-c", script]()
+    notify("helper", machine, command="sh")
+
+    return todo
+
+
+def write_files(machine, contents, remote_root, mode=0o644, compresslevel=6):
+    """Write `contents`, {path relative to `remote_root`: text or bytes},
+    under `remote_root` on `machine` with a single remote command: the
+    files travel as a compressed tar archive on its stdin.
+
+    Result: list of written paths relative to `remote_root`."""
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz",
+                      compresslevel=compresslevel) as tar:
+        for fname, data in sorted(contents.items()):
+            if isinstance(data, str):
+                data = data.encode()
+            info = tarfile.TarInfo(fname)
+            info.size, info.mode, info.mtime = len(data), mode, time.time()
+            tar.addfile(info, io.BytesIO(data))
+
+    script = "mkdir -p %s && cd %s && tar -xzf -" % (
+        (shquote(str(remote_root)),) * 2)
+    (machine["sh"]["-c", script] << buf.getvalue())()
+    notify("helper", machine, command="sh")
+
+    return sorted(contents)
+
+
+def pull(machine, remote_root, names, local_root,
+         patterns=("outfile.*", "out.log", "out.log.*", "err.log"), maxdepth=None):
+    """Fetch files matching `patterns` from the `names` subdirectories of
+    `remote_root` on `machine` into the same layout under `local_root`.
+    Subdirectories deeper than `maxdepth` are not searched.
+
+    Files already present locally with the same content are skipped,
+    the rest travel in one gzip-compressed tar archive.
+
+    Result: list of transferred paths relative to `local_root`."""
+    local_root = os.fspath(local_root)
+    known = remote_hashes(machine, remote_root, names, patterns,
+                          maxdepth=maxdepth)
+
+    todo = []
+    for fname, digest in sorted(known.items()):
+        full = os.path.join(local_root, fname)
+        if not os.path.isfile(full) or _sha1(full) != digest:
+            todo.append(fname)
+    logger.debug("Fetching %d of %d files from %s",
+                 len(todo), len(known), remote_root)
+    if not todo:
+        return []
+
+    archive = ".teff-stage-%s.tar.gz" % uuid.uuid4().hex
+    remote_archive = machine.path(remote_root) / archive
+    # the file list goes on stdin: no command line length limit
+    script = "cd %s && tar -czf %s --null -T -" % (
+        shquote(str(remote_root)), archive)
+    try:
+        (machine["sh"]["-c", script] << "\0".join(todo) + "\0")()
+        notify("helper", machine, command="sh")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local_archive = local.path(tmpdir) / archive
+            copy(remote_archive, local_archive)
+            with tarfile.open(local_archive, "r:gz") as tar:
+                if hasattr(tarfile, "data_filter"):
+                    tar.extractall(local_root, filter="data")
+                else:
+                    tar.extractall(local_root)
+    finally:
+        machine["rm"]("-f", remote_archive)
+        notify("helper", machine, command="rm")
+
+    return todo
+
+
+def transfer(src_machine, src_dir, dst_machine, dst_dir, patterns):
+    """Copy the files of `src_dir` (not its subdirectories) matching
+    `patterns` from `src_machine` to `dst_dir` on `dst_machine`.
+
+    The files go through a local temporary directory, so any pair of
+    local and remote machines works. Files already present at the
+    destination with the same content are not uploaded.
+
+    Result: list of transferred file names."""
+    src_root, src_name = os.path.split(str(src_dir).rstrip("/"))
+    dst_root, dst_name = os.path.split(str(dst_dir).rstrip("/"))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pull(src_machine, src_root, [src_name], tmpdir, patterns, maxdepth=1)
+        staged = os.path.join(tmpdir, src_name)
+        if not os.path.isdir(staged):
+            return []
+        if dst_name != src_name:
+            os.rename(staged, os.path.join(tmpdir, dst_name))
+            staged = os.path.join(tmpdir, dst_name)
+
+        return [os.path.basename(fname) for fname in
+                push(dst_machine, [staged], dst_root)]
+
+
+class RemoteReports():
+    """Extraction of TDEP reports on the machine where they reside.
+
+    The self-contained `tdep_reports` script is uploaded once per
+    instance; each `collect` call then parses any number of action
+    directories with a single remote command and returns only the
+    compact JSON reports."""
+
+    def __init__(self, machine, python="python3", script_dir="/tmp"):
+        self.machine = machine
+        self.python = python
+        with open(tdep_reports.__file__, "rb") as f:
+            self._source = f.read()
+        self.script = machine.path(script_dir) / (
+            "teff-tdep-reports-%s.py" % hashlib.sha1(self._source).hexdigest())
+        self._installed = False
+
+    def install(self):
+        if not self._installed:
+            self.script.write(self._source)
+            self._installed = True
+
+    def collect(self, paths):
+        """Reports of the actions in directories `paths` on the machine.
+
+        Result: {path: report, ...} as in `tdep_reports.collect_reports`."""
+        paths = [str(path) for path in paths]
+        if not paths:
+            return {}
+
+        self.install()
+        cmd = self.machine[self.python][self.script] << "\n".join(paths)
+        reports = json.loads(cmd())
+        notify("helper", self.machine, command=self.python)
+
+        return {path: tdep_reports.decode_report(report)
+                for path, report in reports.items()}
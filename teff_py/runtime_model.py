@@ -0,0 +1,200 @@
+"""Historical runtime model of actions.
+
+`RuntimeHistory` records runtimes of finished actions per Action class
+in a JSON-lines file and predicts runtimes of new actions with a
+power-law fit on their numeric `args_source` entries, atom counts and
+cores. Predictions order submissions longest-first along the critical
+path and size Slurm `--time` limits.
+
+    history = RuntimeHistory("runtimes.jsonl")
+    add_listener(history)       # record runtimes as actions finish
+    await pool.run(actions, model=history)
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from numbers import Number
+
+import numpy as np
+
+from teff_py.async_actions import ScheduledAction
+
+
+def features(action):
+    """Numeric features of `action` the runtime is regressed on:
+    numeric `args_source` entries, `natoms` and `cores`."""
+    args = action.args_source
+    if isinstance(args, dict):
+        items = args.items()
+    elif isinstance(args, (list, tuple)):
+        items = (("arg%d" % i, v) for i, v in enumerate(args))
+    else:
+        items = ()
+
+    result = {str(k): float(v) for k, v in items
+              if isinstance(v, Number) and not isinstance(v, bool)}
+
+    natoms = getattr(action, "natoms", None)
+    if natoms is not None:
+        result["natoms"] = float(natoms)
+    result["cores"] = float(action.num_mpi_procs or 1)
+
+    return result
+
+
+def runtime_phase(action):
+    "Phase whose duration is the runtime of `action`."
+    return "scheduled" if isinstance(action, ScheduledAction) else "run"
+
+
+def format_slurm_time(seconds):
+    "Slurm time limit string `[days-]hours:minutes:seconds` for `seconds`."
+    minutes = math.ceil(seconds / 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    limit = "%02d:%02d:00" % (hours, minutes)
+    return "%d-%s" % (days, limit) if days else limit
+
+
+class RuntimeHistory():
+    """Runtimes of finished actions stored in the JSON-lines file `fname`,
+    and the regression model built on them. Also an `actions` listener
+    that records the runtimes of successfully finished actions: the run
+    phase of blocking actions and, as their accounting comes in (see
+    `accounting`), the elapsed time of completed Slurm jobs, without
+    their queue wait."""
+
+    min_records = 3             # below that predict the class average
+
+    def __init__(self, fname):
+        self.fname = os.fspath(fname)
+        self.records = []
+        self._lock = threading.Lock()
+        self._started = {}
+        self._index = {}        # (class name, phase) -> records
+        self._fits = {}         # (class name, phase, features) -> fit
+
+        if os.path.exists(self.fname):
+            with open(self.fname) as f:
+                for line in f:
+                    if line.strip():
+                        self._add(json.loads(line))
+
+    def _add(self, rec):
+        key = (rec["class"], rec["phase"])
+        self.records.append(rec)
+        self._index.setdefault(key, []).append(rec)
+        # fits of the class are outdated
+        self._fits = {k: v for k, v in self._fits.items() if k[:2] != key}
+
+    def record(self, action, runtime):
+        rec = {"class": type(action).__name__,
+               "phase": runtime_phase(action),
+               "features": features(action),
+               "runtime": runtime,
+               "time": time.time()}
+        with self._lock:
+            self._add(rec)
+            with open(self.fname, "a") as f:
+                f.write(json.dumps(rec) + "\n")
+
+    def __call__(self, event, action, phase=None, record=None, **info):
+        if event == "accounting":
+            if record["state"] == "COMPLETED":
+                self.record(action, record["elapsed"])
+        elif phase == "run" and runtime_phase(action) == "run":
+            key = id(action)
+            if event == "begin":
+                self._started[key] = time.monotonic()
+            elif event == "end":
+                # popped whether the phase succeeded or raised
+                start = self._started.pop(key, None)
+                runner = action.runner
+                if start is not None and runner is not None and \
+                   runner.exit_code == 0:
+                    self.record(action, time.monotonic() - start)
+
+    def _fit(self, name, phase, keys):
+        """Regression of log(runtime) on the logarithms of the `keys`
+        features over the records of a class, cached until new records.
+
+        Result: (coefficients or `None`, mean log(runtime)) or `None`."""
+        fit_key = (name, phase, keys)
+        if fit_key in self._fits:
+            return self._fits[fit_key]
+
+        records = self._index.get((name, phase), [])
+        fit = None
+        if records:
+            runtimes = [rec["runtime"] for rec in records]
+            rows = [(rec["features"], rec["runtime"]) for rec in records
+                    if all(rec["features"].get(k, 0) > 0 for k in keys)]
+            coef = None
+            if len(rows) >= max(self.min_records, len(keys) + 1):
+                X = np.array([[1.0] + [math.log(f[k]) for k in keys]
+                              for f, _ in rows])
+                y = np.log([max(t, 1e-3) for _, t in rows])
+                # a small ridge keeps constant features from breaking the fit
+                reg = 1e-6 * np.eye(X.shape[1])
+                coef = np.linalg.solve(X.T @ X + reg, X.T @ y)
+            fit = (coef, float(np.mean(np.log(runtimes))))
+
+        self._fits[fit_key] = fit
+        return fit
+
+    def predict(self, action):
+        """Predicted runtime of `action` in seconds, `None` if no runtimes
+        of its class are known.
+
+        Fits log(runtime) linearly on the logarithms of the positive
+        features of `action` over the past records of its class."""
+        x = {k: v for k, v in features(action).items() if v > 0}
+        keys = tuple(sorted(x))
+
+        fit = self._fit(type(action).__name__, runtime_phase(action), keys)
+        if fit is None:
+            return None
+        coef, mean_log = fit
+        if coef is None:
+            return float(np.exp(mean_log))
+
+        return float(np.exp(coef @ ([1.0] + [math.log(x[k]) for k in keys])))
+
+    def order(self, actions):
+        """`actions` sorted for submission, critical path first.
+
+        The priority of an action is its predicted runtime plus the
+        highest priority among its children in `actions`; unknown
+        runtimes count as the median of the known ones."""
+        actions = list(actions)
+        predicted = {id(a): self.predict(a) for a in actions}
+        known = [t for t in predicted.values() if t is not None]
+        default = float(np.median(known)) if known else 0.0
+
+        children = {}
+        for a in actions:
+            children.setdefault(id(a.parent), []).append(a)
+
+        priority = {}
+
+        def priority_of(a):
+            if id(a) not in priority:
+                own = predicted[id(a)]
+                priority[id(a)] = (default if own is None else own) + max(
+                    (priority_of(c) for c in children.get(id(a), [])),
+                    default=0.0)
+            return priority[id(a)]
+
+        return sorted(actions, key=lambda a: -priority_of(a))
+
+    def time_limit(self, action, margin=2.0, minimum=600):
+        """Slurm `--time` limit for `action`: the predicted runtime times
+        `margin`, at least `minimum` seconds. `None` when unpredictable."""
+        predicted = self.predict(action)
+        if predicted is None:
+            return None
+
+        return format_slurm_time(max(predicted * margin, minimum))
@@ -0,0 +1,65 @@
+"""Execution of actions in node-local scratch directories.
+
+Actions declaring a `scratch` root (e.g. "$TMPDIR" or "/dev/shm") run
+their command in a fresh directory under it instead of `Action.path`:
+the contents of `Action.path` are staged in (symlinks resolved), and
+only the files matching `scratch_outputs` are copied back afterwards,
+keeping the small-file traffic off the shared filesystem. The scratch
+directory is removed whether the command succeeds or not.
+
+    class FCs(Action):
+        scratch = "/dev/shm"
+        scratch_outputs = ["outfile.*"]
+"""
+
+import contextlib
+from plumbum.commands.base import shquote
+
+from teff_py import actions     # imports this module: `notify` at call time
+
+
+def stage_in(machine, path, root):
+    """Create a scratch directory under `root` on `machine` and copy the
+    contents of `path` into it. Shell variables in `root` are expanded
+    on the machine. Returns the scratch directory path."""
+    script = ('tmp=$(mktemp -d -p "%s" teff.XXXXXX) || exit 1; '
+              'cp -RL %s/. "$tmp"/ || { rm -rf "$tmp"; exit 1; }; '
+              'echo "$tmp"') % (root, shquote(str(path)))
+    tmp = machine["sh"]["-c", script]().strip()
+    actions.notify("helper", machine, command="sh")
+    return machine.path(tmp)
+
+
+def copy_back(machine, tmp, path, patterns):
+    "Copy the files of `tmp` matching glob `patterns` into `path`."
+    script = ('cd %s || exit 1; for f in %s; do '
+              '[ -e "$f" ] && cp -a "$f" %s/; done; exit 0') % (
+        shquote(str(tmp)), " ".join(patterns), shquote(str(path)))
+    machine["sh"]["-c", script]()
+    actions.notify("helper", machine, command="sh")
+
+
+def cleanup(machine, tmp):
+    machine["rm"]("-rf", tmp)
+    actions.notify("helper", machine, command="rm")
+
+
+@contextlib.contextmanager
+def working_dir(action):
+    """Directory to run the command of `action` in: `action.path`, or a
+    scratch directory when `action.scratch` is set."""
+    if action.scratch is None:
+        yield action.path
+        return
+
+    machine = action.command.machine
+    tmp = stage_in(machine, action.path, action.scratch)
+    action.logger.debug("Staged in scratch directory %s", tmp)
+    try:
+        yield tmp
+    finally:
+        # outputs are copied back on failure too, for the post-mortem
+        try:
+            copy_back(machine, tmp, action.path, action.scratch_outputs)
+        finally:
+            cleanup(machine, tmp)
@@ -0,0 +1,261 @@
+"""Completion detection of scheduled jobs through sentinel files.
+
+Job scripts atomically write their exit status into the `SENTINEL`
+file of the action directory when they exit, with the trap set by the
+`${sentinel}` placeholder of `ScheduledAction` script templates:
+
+    #!/bin/bash
+    #SBATCH --job-name=${job_name}
+    ${sentinel}
+    srun extract_forceconstants -rc2 ${rc2}
+
+A `SentinelWatcher` set as `completion` of the actions picks the files
+up without any scheduler query: on the local machine with inotify as
+soon as they are written (Linux), and with a stat of all the pending
+files every `interval` seconds, the only channel for remote machines
+and for files written by other nodes of a shared filesystem.
+
+Jobs may end without their trap running, e.g. on a node failure or
+when cancelled before they start. With a `queue` (e.g. a `SlurmQueue`)
+the watcher lists the jobs every `queue_interval` seconds and gives up
+on the sentinels of the jobs missing from two listings in a row; with
+a `timeout` it gives up after that many seconds of waiting. Either way
+the status is `LOST`.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import time
+from plumbum.commands.base import shquote
+from plumbum.machines.local import LocalMachine
+
+from teff_py.actions import notify
+from teff_py.remote_utils import hold_channel
+
+logger = logging.getLogger(__name__)
+
+SENTINEL = ".teff-exit"
+LOST = -1                       # status of jobs that left no sentinel
+
+
+def sentinel_trap(path=None):
+    """Shell line installing a trap that stores the exit status of the
+    script in the sentinel of the directory `path` (of the working
+    directory if `None`) with an atomic rename. Also catches the SIGTERM
+    Slurm sends on time limits."""
+    target = os.path.join(str(path), SENTINEL) if path else SENTINEL
+    write = 'status=$?; echo $status > "%s.$$" && mv -f "%s.$$" "%s"' % (
+        target, target, target)
+    return "trap 'exit 143' TERM; trap '%s' EXIT" % write
+
+
+def read_status(text):
+    "Exit status stored in a sentinel, -1 if unreadable."
+    try:
+        return int(text.strip())
+    except ValueError:
+        return -1
+
+
+class _Inotify():
+    # Minimal inotify binding: watches of directories for files
+    # moved into them or closed after writing.
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    _event = struct.Struct("iIII")
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}          # watch descriptor -> directory
+
+    def add(self, directory):
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(directory),
+            self.IN_CLOSE_WRITE | self.IN_MOVED_TO)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        self.dirs[wd] = directory
+        return wd
+
+    def remove(self, wd):
+        if self.dirs.pop(wd, None) is not None:
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        "Paths of the files written since the last call."
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        paths, offset = [], 0
+        while offset < len(data):
+            wd, _, _, length = self._event.unpack_from(data, offset)
+            offset += self._event.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if wd in self.dirs:
+                paths.append(os.path.join(self.dirs[wd], os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SentinelWatcher():
+    """Watcher of the sentinels of the actions run on `machine`.
+
+    Remote sentinels are checked in batches of `batch` files per remote
+    command, within `channel()` if given, e.g. `SystemsRunner.channel`.
+    `queue` is any object with a `list_jobs()` method returning the ids
+    of the queued jobs, e.g. a `slurm_queue.SlurmQueue`."""
+
+    def __init__(self, machine, interval=None, use_inotify=True, batch=500,
+                 channel=None, queue=None, queue_interval=300, timeout=None):
+        self.machine = machine
+        self.local = isinstance(machine, LocalMachine)
+        self.channel = None if self.local else channel
+        self.interval = interval or (5.0 if self.local else 2.0)
+        self.batch = batch
+        self.queue = queue
+        self.queue_interval = queue_interval
+        self.timeout = timeout
+
+        self.pending = {}       # sentinel path -> future of the exit status
+        self.lost = 0
+        self._jobs = {}         # sentinel path -> job id, for `queue`
+        self._missing = {}      # sentinel path -> listings missing the job
+        self._listed_at = time.monotonic()
+        self._watches = {}      # sentinel path -> inotify watch descriptor
+        self._inotify = None
+        self._poller = None
+
+        if self.local and use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:  # no inotify: stat only
+                logger.debug("inotify unavailable: %s", e)
+
+    def check(self, paths):
+        "Exit statuses of the existing sentinels among `paths`."
+        found = {}
+        if self.local:
+            for path in paths:
+                try:
+                    with open(path) as f:
+                        found[path] = read_status(f.read())
+                except FileNotFoundError:
+                    pass
+            return found
+
+        for i in range(0, len(paths), self.batch):
+            script = ('for f in %s; do [ -e "$f" ] && '
+                      'printf "%%s\\t%%s\\n" "$f" "$(cat "$f")"; done; exit 0') % (
+                " ".join(shquote(p) for p in paths[i:i + self.batch]))
+            listing = self.machine["sh"]["-c", script]()
+            notify("helper", self.machine, command="sh")
+            for line in listing.splitlines():
+                path, _, status = line.partition("\t")
+                found[path] = read_status(status)
+        return found
+
+    def _resolve(self, found):
+        for path, status in found.items():
+            future = self.pending.pop(path, None)
+            if future is not None and not future.done():
+                future.set_result(status)
+            self._jobs.pop(path, None)
+            self._missing.pop(path, None)
+            if path in self._watches:
+                self._inotify.remove(self._watches.pop(path))
+
+    def _give_up(self, paths, reason):
+        for path in paths:
+            logger.warning("No sentinel %s: %s", path, reason)
+        self.lost += len(paths)
+        self._resolve(dict.fromkeys(paths, LOST))
+
+    def _check_queue(self, queued):
+        # jobs missing from two listings: a lagging shared filesystem
+        # may show the sentinel of a job just gone one poll late
+        lost = []
+        for path, job_id in self._jobs.items():
+            if job_id in queued:
+                self._missing.pop(path, None)
+            else:
+                self._missing[path] = self._missing.get(path, 0) + 1
+                if self._missing[path] >= 2:
+                    lost.append(path)
+        self._give_up(lost, "the job left the queue")
+
+    def _on_inotify(self):
+        written = [p for p in self._inotify.read() if p in self.pending]
+        if written:
+            self._resolve(self.check(written))
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        if self._inotify is not None:
+            loop.add_reader(self._inotify.fd, self._on_inotify)
+        try:
+            while self.pending:
+                await asyncio.sleep(self.interval)
+                queued = None
+                try:
+                    async with hold_channel(self.channel):
+                        # jobs listed before their sentinels are checked:
+                        # the trap of a job runs before it leaves the queue
+                        if self.queue is not None and self._jobs and \
+                           time.monotonic() - self._listed_at >= \
+                           self.queue_interval:
+                            self._listed_at = time.monotonic()
+                            queued = await loop.run_in_executor(
+                                None, self.queue.list_jobs)
+                        found = await loop.run_in_executor(
+                            None, self.check, list(self.pending))
+                except Exception as e:  # e.g. a dropped connection
+                    logger.warning("Sentinel check failed: %s", e)
+                    continue
+                self._resolve(found)
+                if queued is not None:
+                    self._check_queue(queued)
+        finally:
+            if self._inotify is not None:
+                loop.remove_reader(self._inotify.fd)
+            self._poller = None
+
+    async def wait(self, action):
+        """Exit status of the job of `action`, once its sentinel is
+        written; `LOST` if the job is gone without it or on `timeout`."""
+        path = os.path.join(str(action.path), SENTINEL)
+        future = self.pending.get(path)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[path] = future
+            if getattr(action, "id", None):
+                self._jobs[path] = str(action.id)
+            if self._inotify is not None:
+                try:
+                    self._watches[path] = self._inotify.add(str(action.path))
+                except OSError as e:    # e.g. max_user_watches reached
+                    logger.warning("No inotify watch of %s, polled: %s",
+                                   action.path, e)
+            if self.local:      # written already, e.g. before a restart
+                self._resolve(self.check([path]))
+
+        if not future.done() and self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future),
+                                          self.timeout)
+        except asyncio.TimeoutError:
+            if path in self.pending:
+                self._give_up([path], "timed out after %gs" % self.timeout)
+            return future.result()
@@ -0,0 +1,166 @@
+"""Conversion of SIESTA outputs into TDEP input files.
+
+Replaces per-configuration `cat | tail | awk` and `grep` shell pipelines
+with in-process parsing: each output file is read once, configurations
+are parsed in parallel and each `infile.` is written in a single pass.
+"""
+
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from teff_py.logstore import LogReader, open_log, resolve_log
+
+
+def _fields(line, *idx):
+    "Equivalent of `awk '{ print $i, $j, ... }'` for a single `line`."
+    fields = line.split()
+    return " ".join(fields[i-1] if i <= len(fields) else "" for i in idx)
+
+
+def _reader(fname):
+    "`LogReader` of the log `fname` if stored with a block index, else None."
+    stored = resolve_log(fname)
+    if stored is not None and os.path.isfile(stored + ".idx"):
+        return LogReader(stored)
+    return None
+
+
+def _tail(fname, count):
+    "Last `count` lines of `fname`, newlines stripped."
+    reader = _reader(fname)
+    if reader is not None:
+        return reader.tail(count)
+    with open_log(fname) as f:
+        return [line.rstrip("\n") for line in deque(f, maxlen=count)]
+
+
+class _GrepTail():
+    # Streaming equivalent of `grep -A{after} pattern | tail -{count}`.
+    # Lines are fed one by one; only the tail of the output is kept.
+    def __init__(self, pattern, after=0, count=1, ignore_case=False):
+        self.regex = re.compile(re.escape(pattern),
+                                re.IGNORECASE if ignore_case else 0)
+        self.after = after
+        self.out = deque(maxlen=count)
+        self._until = -1
+        self._last = -1
+
+    def feed(self, i, line):
+        if self.regex.search(line):
+            self._until = i + self.after
+        if i <= self._until:
+            if 0 <= self._last < i - 1:
+                self.out.append("--")  # grep group separator
+            self.out.append(line)
+            self._last = i
+
+    def feed_indexed(self, reader):
+        # only the blocks holding the last matches are decompressed
+        groups = reader.grep(self.regex.pattern, after=self.after,
+                             last=self.out.maxlen, flags=self.regex.flags)
+        self.out.extend(line for group in groups for line in group)
+
+
+def read_siesta_log(fname):
+    """Read the last total and kinetic energies, pressure and stress
+    from a SIESTA output log `fname`, in a single pass. The log may be
+    stored compressed, see `logstore`: with a block index only the
+    blocks holding the last matches are read.
+
+    Result: {"Etot": float, "Ekin": float, "P": float, "stress": str}
+    with the pressure converted from kBar to GPa."""
+    etot = _GrepTail("Etot ")
+    ekin = _GrepTail("Ekin ")
+    pres = _GrepTail("pres", after=4, ignore_case=True)
+    stress = _GrepTail("Stress ", after=3, count=3, ignore_case=True)
+
+    reader = _reader(fname)
+    if reader is not None:
+        for grep in (etot, ekin, pres, stress):
+            grep.feed_indexed(reader)
+    else:
+        with open_log(fname) as f:
+            for i, line in enumerate(f):
+                line = line.rstrip("\n")
+                for grep in (etot, ekin, pres, stress):
+                    grep.feed(i, line)
+
+    return {
+        "Etot": float(_fields(etot.out[-1], 4)),
+        "Ekin": float(_fields(ekin.out[-1], 4)),
+        "P": float(_fields(pres.out[-1], 2)) * 0.1,
+        "stress": " ".join(_fields(line, 2, 3, 4) for line in stress.out),
+    }
+
+
+def read_configuration(struct_fname, forces_fname, log_fname, natoms):
+    """Parse one SIESTA configuration: fractional positions from
+    `.STRUCT_OUT`, forces from `.FA` and energies from the log.
+
+    Positions and forces are kept as text lines, exactly as they appear
+    in the SIESTA outputs."""
+    conf = read_siesta_log(log_fname)
+    conf["positions"] = [_fields(line, 3, 4, 5)
+                         for line in _tail(struct_fname, natoms)]
+    conf["forces"] = [_fields(line, 2, 3, 4)
+                      for line in _tail(forces_fname, natoms)]
+
+    return conf
+
+
+def _read_configuration(args):
+    return read_configuration(*args)
+
+
+def read_canonical_temperatures(fname, nconfs):
+    """Temperatures of the `nconfs` configurations listed at the bottom
+    of the `canonical_configuration` output log `fname`."""
+    return [float(_fields(line, 4)) for line in _tail(fname, nconfs)]
+
+
+def write_tdep_infiles(path, confs, natoms, temperatures,
+                       timestep=1.0, temperature=300):
+    """Write `infile.positions`, `infile.forces`, `infile.stat` and
+    `infile.meta` under `path` from the parsed configurations `confs`."""
+    path = str(path)
+
+    with open(os.path.join(path, "infile.positions"), "w") as f:
+        f.writelines(line + "\n" for conf in confs
+                     for line in conf["positions"])
+
+    with open(os.path.join(path, "infile.forces"), "w") as f:
+        f.writelines(line + "\n" for conf in confs
+                     for line in conf["forces"])
+
+    with open(os.path.join(path, "infile.stat"), "w") as f:
+        for nc, (conf, T) in enumerate(zip(confs, temperatures), start=1):
+            Etot, Ekin = conf["Etot"], conf["Ekin"]
+            f.write(f"{nc} {nc} {Etot} {Etot - Ekin} {Ekin} {T} "
+                    f"{conf['P']} {conf['stress']}\n")
+
+    with open(os.path.join(path, "infile.meta"), "w") as f:
+        f.write(f"{natoms}\n{len(confs)}\n{timestep}\n{temperature}\n")
+
+
+def siesta_to_tdep(path, conf_files, natoms, temperatures,
+                   timestep=1.0, temperature=300, max_workers=None):
+    """Convert SIESTA configurations into TDEP input files under `path`.
+
+    `conf_files` is an ordered list of `(struct_out, fa, log)` file name
+    triples, one per configuration. They are parsed in a process pool of
+    `max_workers` (all cores by default; 1 parses in-process)."""
+    conf_files = [tuple(map(str, files)) + (natoms,) for files in conf_files]
+
+    if max_workers == 1 or len(conf_files) < 2:
+        confs = list(map(_read_configuration, conf_files))
+    else:
+        workers = max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(conf_files) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            confs = list(pool.map(_read_configuration, conf_files,
+                                  chunksize=chunksize))
+
+    write_tdep_infiles(path, confs, natoms, temperatures,
+                       timestep=timestep, temperature=temperature)
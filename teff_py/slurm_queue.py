@@ -0,0 +1,142 @@
+"""Throttled submission of Slurm jobs.
+
+A `SlurmQueue` keeps at most `max_jobs` jobs of its actions pending or
+running on a cluster, e.g. below the MaxSubmitJobs/MaxJobs limits of
+the user, and submits more as jobs finish:
+
+    queue = SlurmQueue(rem, max_jobs=200)
+    await queue.run(actions)    # `SlurmScheduledAction`s
+
+A single `squeue` listing per `poll_interval` tracks all the jobs.
+Submissions rejected by the scheduler for policy or transient reasons
+are retried after `retry_interval`; meanwhile no other submissions
+are attempted. The logs and exit status left by a rejected submission
+are removed before the retry. The `squeue` calls are made within
+`channel()` if given, e.g. `SystemsRunner.channel`.
+"""
+
+import asyncio
+import logging
+import re
+import time
+
+from plumbum.commands.base import shquote
+
+from teff_py.actions import State, notify
+from teff_py.remote_utils import hold_channel
+from teff_py.sentinels import SENTINEL
+
+logger = logging.getLogger(__name__)
+
+# `sbatch` errors worth a retry: submission limits and transient failures
+RETRYABLE = re.compile(
+    r"MaxSubmit|MaxJobs|QOSMax|AssocMax|AssocGrp|QOSGrp|"
+    r"temporarily unavailable|Socket timed out|try again|"
+    r"Unable to contact slurm controller", re.IGNORECASE)
+
+
+class SlurmQueue():
+    "Submission queue of `SlurmScheduledAction`s with a shared status poller."
+
+    def __init__(self, machine, max_jobs, poll_interval=30,
+                 retry_interval=60, max_retries=10, channel=None):
+        self.machine = machine
+        self.channel = channel
+        self.max_jobs = max_jobs
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+
+        self.squeue = None      # job ids listing, looked up on first use
+        self.jobs = {}          # job id -> future resolved when it is gone
+        self.submitted = 0
+        self.rejected = 0
+
+        self._slots = None
+        self._poller = None
+        self._resume_at = 0.0   # no submissions before, after a rejection
+
+    def list_jobs(self):
+        "Ids of the jobs of the user in the queue."
+        if self.squeue is None:
+            self.squeue = self.machine["squeue"]["-h", "-o", "%i", "--me"]
+        listing = self.squeue()
+        notify("helper", self.machine, command="squeue")
+        # array jobs show up as <id>_<index>
+        return {line.strip().split("_")[0]
+                for line in listing.splitlines() if line.strip()}
+
+    async def _poll(self):
+        while self.jobs:
+            await asyncio.sleep(self.poll_interval)
+            loop = asyncio.get_running_loop()
+            try:
+                async with hold_channel(self.channel):
+                    start = time.monotonic()
+                    queued = await loop.run_in_executor(None, self.list_jobs)
+            except Exception as e:  # e.g. a controller timeout, poll again
+                logger.warning("squeue failed: %s", e)
+                continue
+            notify("poll", self, elapsed=time.monotonic() - start,
+                   depth=len(queued))
+            for job_id in [j for j in self.jobs if j not in queued]:
+                self.jobs.pop(job_id).set_result(None)
+        self._poller = None
+
+    async def wait(self, job_id):
+        "Wait for the job `job_id` to leave the queue."
+        if job_id not in self.jobs:
+            self.jobs[job_id] = asyncio.get_running_loop().create_future()
+        if self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll())
+        await asyncio.shield(self.jobs[job_id])
+
+    @staticmethod
+    def retryable(action):
+        "Whether the failed submission of `action` may succeed later."
+        if action.runner is None:
+            return False
+        return RETRYABLE.search("\n".join(action.runner.err_log)) is not None
+
+    async def clear(self, action):
+        "Remove the logs and exit status of a rejected submission of `action`."
+        script = "cd %s && rm -f err.log out.log out.log.* %s" % (
+            shquote(str(action.path)), SENTINEL)
+        async with hold_channel(self.channel):
+            action.command.machine["sh"]["-c", script]()
+        notify("helper", action.command.machine, command="sh")
+
+    async def submit(self, action):
+        """Submit `action` once a job slot is free, retrying rejected
+        submissions, and wait for its job to finish."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_jobs)
+        action.queue = self
+
+        async with self._slots:
+            for attempt in range(self.max_retries + 1):
+                delay = self._resume_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                await action.run()
+                if action.state != State.FAILED or \
+                   not self.retryable(action) or attempt == self.max_retries:
+                    break
+
+                self.rejected += 1
+                action.logger.warning("Submission rejected, retry %d/%d",
+                                      attempt + 1, self.max_retries)
+                # `err.log` left would mark the job failed, see `discovery`
+                await self.clear(action)
+                action.state = State.PREPARED
+                self._resume_at = time.monotonic() + self.retry_interval
+
+            if action.state != State.FAILED:
+                self.submitted += 1
+
+        return action
+
+    async def run(self, actions):
+        "Submit all `actions` within the job limit, wait for all to finish."
+        return await asyncio.gather(*(self.submit(a) for a in actions))
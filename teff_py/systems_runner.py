@@ -0,0 +1,201 @@
+"""Concurrent execution of the workflows of many input systems.
+
+Each system's workflow is a coroutine function receiving its `System`
+and awaiting `system.execute(action)` for its actions. All the systems
+run concurrently in one event loop, under limits shared by all of them:
+
+    runner = SystemsRunner(cores=512, channels=8)
+    queue = SlurmQueue(rem, max_jobs=100, channel=runner.channel)
+    for name in systems:
+        runner.add(name, workflow)
+    results = asyncio.run(runner.run())
+
+`cores` caps the cores (`num_mpi_procs`) of the actions in flight,
+`channels` the commands executed concurrently on remote machines (SSH
+channels): the blocking prepare and run of remote actions, the
+submission commands of remote scheduled actions, and the polls of the
+queues and sentinel watchers given `channel=runner.channel`, which are
+shared by all the systems and served first. The Slurm jobs queued or
+running are capped by the `max_jobs` of a `slurm_queue.SlurmQueue`.
+
+Waiting actions are granted resources by system `priority`, then
+fair-share: the system holding the fewest cores relative to its `share`
+comes first. An action that cannot be granted yet reserves its
+resources: actions of less entitled systems do not overtake it.
+"""
+
+import asyncio
+import contextlib
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from plumbum.machines.local import LocalMachine
+
+from teff_py.actions import State
+from teff_py.async_actions import ScheduledAction
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ("cores", "channels")
+
+
+def _remote(action):
+    machine = getattr(action.command, "machine", None)
+    return machine is not None and not isinstance(machine, LocalMachine)
+
+
+class System():
+    "An input system of the screening, with its workflow and resources held."
+
+    def __init__(self, runner, name, workflow, share=1.0, priority=0):
+        self.runner = runner
+        self.name = name
+        self.workflow = workflow
+        self.share = share
+        self.priority = priority
+
+        self.held = dict.fromkeys(RESOURCES, 0)
+        self.done = 0
+        self.result = None
+        self.error = None
+
+    def __repr__(self):
+        return f"<System {self.name}: {self.held['cores']} cores, {self.done} done>"
+
+    def channel(self):
+        "Context of a command of the system on a remote machine."
+        return self.runner.hold(self, channels=1)
+
+    async def _blocking(self, action, method):
+        # blocking commands of remote actions take an SSH channel each
+        loop = asyncio.get_running_loop()
+        if not _remote(action):
+            return await loop.run_in_executor(self.runner.executor, method)
+
+        async with self.channel():
+            return await loop.run_in_executor(self.runner.executor, method)
+
+    async def execute(self, action):
+        """Prepare (unless done already) and run `action` once its cores
+        are granted."""
+        if isinstance(action, ScheduledAction) and _remote(action):
+            action.channel = self.channel   # submission commands
+
+        async with self.runner.hold(self, cores=action.num_mpi_procs or 1):
+            if action.state == State.NEW:
+                await self._blocking(action, action.prepare)
+            if getattr(action, "queue", None) is not None:
+                await action.queue.submit(action)   # `slurm_queue` limits
+            elif asyncio.iscoroutinefunction(action.run):
+                await action.run()
+            else:
+                await self._blocking(action, action.run)
+        self.done += 1
+
+        return action
+
+
+class SystemsRunner():
+    "Runner of concurrent system workflows under shared resource limits."
+
+    def __init__(self, cores=None, channels=None, max_threads=None):
+        self.limits = {"cores": cores, "channels": channels}
+        self.used = dict.fromkeys(RESOURCES, 0)
+        self.systems = []
+        # holder of the commands shared by all systems, e.g. queue polls
+        self.shared = System(self, "shared", None, priority=float("inf"))
+        self.executor = ThreadPoolExecutor(max_workers=max_threads)
+
+        self._waiting = []      # (system, needs, sequence number, future)
+        self._counter = itertools.count()
+
+    def add(self, name, workflow, share=1.0, priority=0):
+        "Add the system `name` running the coroutine function `workflow`."
+        system = System(self, name, workflow, share, priority)
+        self.systems.append(system)
+        return system
+
+    def _fits(self, needs):
+        for kind, n in needs.items():
+            limit = self.limits[kind]
+            # requests above a limit may only be granted alone
+            if limit is not None and self.used[kind] + n > limit \
+               and self.used[kind] > 0:
+                return False
+        return True
+
+    def _grant(self, system, needs):
+        for kind, n in needs.items():
+            self.used[kind] += n
+            system.held[kind] += n
+
+    def _dispatch(self):
+        def entitlement(waiting):
+            system, _, seq, _ = waiting
+            return (-system.priority, system.held["cores"] / system.share, seq)
+
+        blocked = set()         # resources reserved by earlier waiters
+        for waiting in sorted(self._waiting, key=entitlement):
+            system, needs, _, future = waiting
+            if future.done():   # cancelled
+                self._waiting.remove(waiting)
+            elif blocked.isdisjoint(needs):
+                if self._fits(needs):
+                    self._grant(system, needs)
+                    future.set_result(None)
+                    self._waiting.remove(waiting)
+                else:
+                    blocked.update(needs)
+
+    async def acquire(self, system, **needs):
+        needs = {kind: n for kind, n in needs.items() if n}
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append((system, needs, next(self._counter), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(system, **needs)
+            raise
+
+    def release(self, system, **needs):
+        for kind, n in needs.items():
+            self.used[kind] -= n
+            system.held[kind] -= n
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, system, **needs):
+        "Context of `system` holding the resources `needs`."
+        needs = {kind: n for kind, n in needs.items() if n}
+        await self.acquire(system, **needs)
+        try:
+            yield
+        finally:
+            self.release(system, **needs)
+
+    def channel(self):
+        "Context of a remote command shared by all the systems."
+        return self.hold(self.shared, channels=1)
+
+    async def _run_system(self, system):
+        try:
+            system.result = await system.workflow(system)
+            logger.info("%s finished: %d actions", system.name, system.done)
+        except Exception as e:
+            system.error = e
+            logger.exception("%s failed after %d actions",
+                             system.name, system.done)
+
+    async def run(self):
+        """Run the workflows of all the systems concurrently.
+
+        A failing workflow does not stop the others. Returns
+        {name: workflow result, or the exception raised}."""
+        await asyncio.gather(*(self._run_system(s) for s in self.systems))
+        return {s.name: s.error if s.error is not None else s.result
+                for s in self.systems}
+
+    def shutdown(self):
+        self.executor.shutdown()
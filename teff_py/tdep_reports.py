@@ -0,0 +1,178 @@
+"""In-process parsers of TDEP reports.
+
+Pure-python counterparts of the `grep` pipelines in `tdep_utils`.
+The module depends on the standard library only, so that it can be
+shipped as-is and run as a script on a remote machine:
+
+    python3 tdep_reports.py ACTION_DIR [ACTION_DIR ...]
+
+prints a JSON object {action_dir: report, ...}. Without arguments the
+action directories are read from stdin, one per line.
+"""
+
+import gzip
+import json
+import os
+import re
+import sys
+
+
+def _grep_after(lines, pattern, after):
+    "Output lines of `grep -A{after} pattern`, without group separators."
+    regex = re.compile(re.escape(pattern))
+    out = []
+    until = -1
+    for i, line in enumerate(lines):
+        if regex.search(line):
+            until = i + after
+        if i <= until:
+            out.append(line)
+    return out
+
+
+def _last_match(lines, regex):
+    for line in reversed(lines):
+        if re.search(regex, line):
+            return line.split()
+    return None
+
+
+def parse_overdetermination_report(lines):
+    """Grade of FCs equations system overdetermination from the lines
+    of `extract_forceconstants` output.
+
+    Result: {fc_order: (num_fcs_upto_this_order, overdetermination_grade), ...}
+    """
+    block = _grep_after(lines, "REPORT GRADE OF OVERDETERMINATION", 4)
+    results = {}
+    for fc in [2, 3, 4]:
+        fields = _last_match(block, r"up %d. order" % fc)
+        if fields is not None:
+            results[fc] = (int(fields[6]), float(fields[10]))
+
+    return results
+
+
+def parse_r_squared(lines):
+    """`R-squared` coefficients of determination from the lines
+    of `extract_forceconstants` output.
+
+    Result: {fc_order: r_squared, ...}"""
+    block = _grep_after(lines, "R^2", 4)
+    results = {}
+    for fc, label in [(2, "second"), (3, "third"), (4, "fourth")]:
+        fields = _last_match(block, r"%s order" % label)
+        if fields is not None:
+            results[fc] = float(fields[2])
+
+    return results
+
+
+def parse_interactions(lines):
+    """Number of shells and forceconstants from the lines
+    of `extract_forceconstants` output.
+
+    Result: {fc_order: (num_shells, num_fcs), ...}"""
+    block = _grep_after(lines, "Interactions:", 4)
+    results = {}
+    for fc, label in [(1, "first"), (2, "second"),
+                      (3, "third"), (4, "fourth")]:
+        fields = _last_match(block, r"%sorder forceconstant:" % label)
+        if fields is not None:
+            results[fc] = (int(fields[2]), int(fields[3]))
+
+    return results
+
+
+def parse_elastic_constants(lines):
+    """Elastic constants matrix, as a list of rows, from the lines
+    of `extract_forceconstants` output. `None` if not reported."""
+    block = _grep_after(lines, "elastic constants", 6)
+    if not block:
+        return None
+
+    return [[float(x) for x in line.split()] for line in block[-6:]]
+
+
+def parse_table(lines):
+    "Numeric rows of a TDEP `outfile.` table, comments skipped."
+    return [[float(x) for x in line.split()] for line in lines
+            if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _open_zstd(fname, mode):
+    import io
+    import zstandard            # optional dependency
+    return io.TextIOWrapper(
+        zstandard.ZstdDecompressor().stream_reader(open(fname, "rb"),
+                                                   closefd=True))
+
+
+# Openers of compressed logs by file suffix. Mirrors `logstore.SUFFIXES`,
+# which is not imported to keep this module standalone.
+OPENERS = {".gz": gzip.open, ".zst": _open_zstd}
+
+
+def _read_lines(fname):
+    suffix = os.path.splitext(fname)[1]
+    with OPENERS.get(suffix, open)(fname, "rt") as f:
+        return f.read().splitlines()
+
+
+def _find_log(fname):
+    "Stored name of the log `fname`, plain or compressed, or None."
+    for suffix in ("",) + tuple(OPENERS):
+        if os.path.isfile(fname + suffix):
+            return fname + suffix
+    return None
+
+
+def collect_report(path):
+    """Report of the TDEP action in directory `path`: whatever of
+    `out.log` and `outfile.thermal_conductivity` is present."""
+    report = {}
+
+    log_fname = _find_log(os.path.join(path, "out.log"))
+    if log_fname is not None:
+        lines = _read_lines(log_fname)
+        report["overdetermination"] = parse_overdetermination_report(lines)
+        report["r_squared"] = parse_r_squared(lines)
+        report["interactions"] = parse_interactions(lines)
+        report["elastic_constants"] = parse_elastic_constants(lines)
+
+    tc_fname = os.path.join(path, "outfile.thermal_conductivity")
+    if os.path.isfile(tc_fname):
+        report["thermal_conductivity"] = parse_table(_read_lines(tc_fname))
+
+    return report
+
+
+def collect_reports(paths):
+    """Reports of the actions in directories `paths`.
+
+    Result: {path: report, ...}, where a failed report is
+    {"error": message}."""
+    reports = {}
+    for path in paths:
+        try:
+            reports[path] = collect_report(path)
+        except Exception as e:
+            reports[path] = {"error": "%s: %s" % (type(e).__name__, e)}
+
+    return reports
+
+
+def decode_report(report):
+    "Restore integer `fc_order` keys of a report decoded from JSON."
+    return {key: ({int(k): v for k, v in value.items()}
+                  if isinstance(value, dict) else value)
+            for key, value in report.items()}
+
+
+def main(argv):
+    paths = argv or [line.strip() for line in sys.stdin if line.strip()]
+    json.dump(collect_reports(paths), sys.stdout, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
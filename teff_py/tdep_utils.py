@@ -1,8 +1,15 @@
+import glob
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
 from plumbum import local
 from plumbum.cmd import grep, awk, head, tail
 
+from teff_py import tdep_reports
+
 
 def get_overdetermination_report(fname):
     """Obtain data on the grade of FCs equations system overdetermination
@@ -81,5 +88,406 @@ def get_rcmax(fname):
     cell = (head[-5, fname] | tail[-3])().strip()
     cell = np.matrix(";".join(cell.split("\n"))) * alat
     rcmax = np.min(np.sqrt(np.sum(np.square(cell), axis=(1))).flatten()) * 0.5
-        
-    return rcmax
\ No newline at end of file
+
+    return rcmax
+
+
+def read_ssposcar(fname):
+    """Read lattice and atomic positions from a VASP-formatted
+    `fname` (usually `infile.ssposcar`).
+
+    Result: (cell, positions) - cell vectors as rows and cartesian
+    positions, both in the units of the file, scaled by `alat`."""
+    with open(fname) as f:
+        lines = f.readlines()
+
+    alat = float(lines[1].split()[0])
+    cell = np.array([line.split()[:3] for line in lines[2:5]],
+                    dtype=float) * alat
+
+    # line 6 may hold species names (VASP5) or already the counts (VASP4)
+    i_counts = 5 if lines[5].split()[0].isdigit() else 6
+    natoms = sum(map(int, lines[i_counts].split()))
+
+    i_coord = i_counts + 1
+    if lines[i_coord].strip()[0] in "sS":  # `Selective dynamics`
+        i_coord += 1
+    direct = lines[i_coord].strip()[0] in "dD"
+
+    coords = np.array([line.split()[:3]
+                       for line in lines[i_coord+1:i_coord+1+natoms]],
+                      dtype=float)
+    positions = coords @ cell if direct else coords * alat
+
+    return cell, positions
+
+
+def iter_pair_distances(cell, positions, cutoff):
+    """Yield arrays of interatomic distances up to `cutoff` in the
+    periodic `cell`, including all periodic images.
+
+    Uses a cell-list: atoms are binned into sub-cells not thinner than
+    `cutoff`, and only neighbouring sub-cells are searched. Memory stays
+    linear in the number of atoms, no full distance matrix is built."""
+    cell = np.asarray(cell, dtype=float)
+    frac = np.linalg.solve(cell.T, np.asarray(positions, dtype=float).T).T
+    frac -= np.floor(frac)
+
+    # perpendicular widths of the cell along each lattice vector
+    widths = 1.0 / np.linalg.norm(np.linalg.inv(cell), axis=0)
+    nbins = np.maximum(1, np.floor(widths / cutoff)).astype(int)
+    reach = np.ceil(cutoff * nbins / widths).astype(int)
+
+    bins = np.minimum((frac * nbins).astype(int), nbins - 1)
+    bin_ids = np.ravel_multi_index(bins.T, nbins)
+    order = np.argsort(bin_ids, kind="stable")
+    starts = np.searchsorted(bin_ids[order], np.arange(np.prod(nbins) + 1))
+
+    offsets = np.stack(np.meshgrid(*[np.arange(-r, r+1) for r in reach],
+                                   indexing="ij"), axis=-1).reshape(-1, 3)
+
+    for bin_id in np.unique(bin_ids):
+        home = np.array(np.unravel_index(bin_id, nbins))
+        atoms_i = positions[order[starts[bin_id]:starts[bin_id+1]]]
+
+        for offset in offsets:
+            target = home + offset
+            shift = np.floor_divide(target, nbins) @ cell
+            target_id = np.ravel_multi_index(np.mod(target, nbins), nbins)
+            atoms_j = positions[order[starts[target_id]:starts[target_id+1]]]
+            if len(atoms_j) == 0:
+                continue
+
+            diff = atoms_j[None, :, :] + shift - atoms_i[:, None, :]
+            dist = np.sqrt(np.sum(np.square(diff), axis=-1)).ravel()
+            yield dist[dist <= cutoff]
+
+
+def get_shell_radii(fname, cutoff=None, thr=1e-3, decimals=5):
+    """Distinct neighbour shell radii of the structure in `fname`
+    (usually `infile.ssposcar`) up to `cutoff`, `get_rcmax` by default.
+
+    The radii are shifted by `thr` and rounded to `decimals`, the
+    on-site "shell" `thr` included at index 0, so the result is a drop-in
+    for the sorted unique `get_all_distances` arrays of the examples."""
+    cell, positions = read_ssposcar(fname)
+    cutoff = get_rcmax(fname) if cutoff is None else cutoff
+
+    # unique per chunk first, then once over all: no quadratic merging
+    chunks = [np.unique((dist + thr).round(decimals=decimals))
+              for dist in iter_pair_distances(cell, positions, cutoff)]
+
+    return np.unique(np.concatenate([[thr]] + chunks))
+
+
+def get_max_mic_distance(fname, thr=1e-3, decimals=5, chunk=1 << 22):
+    """Largest minimum-image distance between the atoms of the structure
+    in `fname` (usually `infile.ssposcar`), shifted by `thr` and rounded
+    to `decimals` as the `get_shell_radii` radii.
+
+    This is the outermost shell of the full minimum-image distances
+    table, `get_shell_radii` stops at `get_rcmax`. Pairs are processed
+    `chunk` at a time; the 27 neighbouring images are searched only for
+    the pairs whose wrapped distance may still exceed the maximum."""
+    cell, positions = read_ssposcar(fname)
+    frac = np.linalg.solve(cell.T, positions.T).T
+    images = np.array(list(itertools.product((-1, 0, 1), repeat=3)),
+                      dtype=float)
+
+    step = max(1, chunk // len(frac))
+    longest = 0.0
+    for i in range(0, len(frac), step):
+        diff = (frac[None, :, :] - frac[i:i+step, None, :]).reshape(-1, 3)
+        diff -= np.round(diff)
+        # the wrapped distance bounds the minimum-image one from above
+        wrapped = np.sqrt(np.sum(np.square(diff @ cell), axis=-1))
+        candidates = np.flatnonzero(wrapped > longest)
+        candidates = candidates[np.argsort(-wrapped[candidates])]
+        for j in range(0, len(candidates), 4096):
+            batch = candidates[j:j+4096]
+            if wrapped[batch[0]] <= longest:
+                break
+            cart = (diff[batch, None, :] + images) @ cell
+            dist = np.sqrt(np.sum(np.square(cart), axis=-1)).min(axis=-1)
+            longest = max(longest, dist.max())
+
+    return round(longest + thr, decimals)
+
+
+def find_max_rc2(radii, rc_limit=None, thr=1e-3):
+    """Index of the first shell in `radii` reaching `rc_limit`.
+
+    By default `rc_limit` is half of the outermost shell radius, meant
+    for `radii` up to the largest minimum-image distance. Radii of
+    `get_shell_radii` stop short at `get_rcmax`: pass
+    `0.5 * get_max_mic_distance(fname) + thr` then."""
+    if rc_limit is None:
+        rc_limit = radii[-1] * 0.5 + thr
+
+    i_rc2 = 1 + int(np.searchsorted(radii[1:], rc_limit))
+    return min(i_rc2, len(radii) - 1)
+
+
+def find_rc3_list(radii, i_rc2=None, dist_thr=None):
+    """Indices of the outermost shells in each window of width
+    `dist_thr` below `i_rc2`. These are candidate `rc3` cutoffs.
+
+    Windows are laid greedily from the first neighbour shell on.
+    By default `dist_thr` is the mean shell spacing up to `i_rc2`."""
+    i_rc2 = i_rc2 or find_max_rc2(radii)
+    dist_thr = dist_thr or radii[i_rc2] / i_rc2
+
+    i_rc3_list = []
+    beg = 1
+    while True:
+        end = beg + int(np.searchsorted(radii[beg:i_rc2] - radii[beg],
+                                        dist_thr, side="right"))
+        i_rc3_list.append(end - 1)
+        if end >= i_rc2:
+            break
+        beg = end
+
+    return i_rc3_list
+
+
+def temperature_range_args(temperatures):
+    """`--temperature_range` arguments of the TDEP programs covering the
+    sorted `temperatures` in one run, `None` if not evenly spaced."""
+    temps = np.asarray(temperatures, dtype=float)
+    if len(temps) < 2 or temps[1] <= temps[0] or \
+       not np.allclose(np.diff(temps), temps[1] - temps[0]):
+        return None
+
+    return ["--temperature_range", "%g" % temps[0], "%g" % temps[-1],
+            str(len(temps))]
+
+
+def _sidecar_paths(fname):
+    "Hidden `.npy` sidecar and its metadata file next to `fname`."
+    dirname, basename = os.path.split(os.fspath(fname))
+    base = os.path.join(dirname, "." + basename)
+    return base + ".npy", base + ".npy.json"
+
+
+def cached_array(fname, parse, kind, cache=True):
+    """Return the array `parse(fname)` through a binary sidecar cache.
+
+    On the first read the parsed array is stored next to `fname` as a
+    hidden `.npy` file together with the size and mtime of `fname`.
+    Later reads memory-map the sidecar without parsing, as long as the
+    source is unchanged and the sidecar was built for the same `kind`."""
+    if not cache:
+        return parse(fname)
+
+    npy_fname, meta_fname = _sidecar_paths(fname)
+    st = os.stat(fname)
+    meta = {"kind": kind, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    try:
+        with open(meta_fname) as f:
+            if json.load(f) == meta:
+                return np.load(npy_fname, mmap_mode="r")
+    except (OSError, ValueError):
+        pass                    # missing, stale or broken sidecar
+
+    data = parse(fname)
+    try:
+        tmp_fname = npy_fname + ".%d.tmp" % os.getpid()
+        with open(tmp_fname, "wb") as f:
+            np.save(f, data)
+        os.replace(tmp_fname, npy_fname)
+        # metadata goes last: it validates a complete sidecar only
+        with open(meta_fname + ".%d.tmp" % os.getpid(), "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_fname + ".%d.tmp" % os.getpid(), meta_fname)
+    except OSError:
+        pass                    # read-only location, serve uncached
+
+    return data
+
+
+def _loadtxt(fname):
+    return np.loadtxt(fname, ndmin=2)
+
+
+def _read_configurations(fname, natoms, kind, cache):
+    data = cached_array(fname, _loadtxt, kind, cache=cache)
+    if natoms is not None:
+        data = data.reshape(-1, natoms, data.shape[-1])
+
+    return data
+
+
+def read_positions(fname, natoms=None, cache=True):
+    """Read `infile.positions` as an array of fractional coordinates.
+
+    Result has shape (nconfs * natoms, 3), or (nconfs, natoms, 3)
+    when `natoms` is given."""
+    return _read_configurations(fname, natoms, "positions", cache)
+
+
+def read_forces(fname, natoms=None, cache=True):
+    """Read `infile.forces` as an array of forces.
+
+    Result has shape (nconfs * natoms, 3), or (nconfs, natoms, 3)
+    when `natoms` is given."""
+    return _read_configurations(fname, natoms, "forces", cache)
+
+
+def read_stat(fname, cache=True):
+    "Read `infile.stat` as an array with one row per configuration."
+    return cached_array(fname, _loadtxt, "stat", cache=cache)
+
+
+def read_meta(fname, cache=True):
+    """Read `infile.meta`.
+
+    Result: {"natoms": int, "nconfs": int,
+             "timestep": float, "temperature": float}"""
+    values = cached_array(fname, lambda f: np.loadtxt(f, usecols=0),
+                          "meta", cache=cache)
+
+    return {"natoms": int(values[0]), "nconfs": int(values[1]),
+            "timestep": float(values[2]), "temperature": float(values[3])}
+
+
+def read_dispersion_relations(fname, cache=True):
+    "Read `outfile.dispersion_relations` as a (nq, 1 + nbranches) array."
+    return cached_array(fname, _loadtxt, "dispersion_relations", cache=cache)
+
+
+def read_thermal_conductivity(fname, cache=True):
+    "Read `outfile.thermal_conductivity` as an array, one row per temperature."
+    return cached_array(fname, _loadtxt, "thermal_conductivity", cache=cache)
+
+
+FORCECONSTANT_DTYPE = np.dtype([
+    ("atom", np.int32),
+    ("neighbour", np.int32),
+    ("lattice_vector", np.float64, (3,)),
+    ("fc", np.float64, (3, 3)),
+])
+
+
+def _parse_forceconstant(fname):
+    # Leading numbers of each line; the rest are TDEP's comments.
+    def numbers(line):
+        values = []
+        for token in line.split():
+            try:
+                values.append(float(token))
+            except ValueError:
+                break
+        return values
+
+    with open(fname) as f:
+        lines = iter([numbers(line) for line in f])
+
+    natoms = int(next(lines)[0])
+    next(lines)                 # realspace cutoff
+    pairs = []
+    for atom in range(1, natoms + 1):
+        for _ in range(int(next(lines)[0])):
+            neighbour = int(next(lines)[0])
+            lattice_vector = next(lines)[:3]
+            fc = [next(lines)[:3] for _ in range(3)]
+            pairs.append((atom, neighbour, lattice_vector, fc))
+
+    return np.array(pairs, dtype=FORCECONSTANT_DTYPE)
+
+
+def read_forceconstant(fname, cache=True):
+    """Read the second order `outfile.forceconstant` of TDEP.
+
+    Result: structured array with a record per pair, fields `atom`,
+    `neighbour` (1-based unit cell indices), `lattice_vector` and the
+    3x3 force constant `fc`."""
+    return cached_array(fname, _parse_forceconstant, "forceconstant",
+                        cache=cache)
+
+
+REPORT_FIELDS = (
+    [(f"num_fcs_{fc}", f"overd_{fc}") for fc in (2, 3, 4)] +
+    [(f"r_squared_{fc}",) for fc in (2, 3, 4)] +
+    [(f"num_shells_{fc}", f"num_fcs_order_{fc}") for fc in (1, 2, 3, 4)] +
+    [("temperature", "kappa")]
+)
+REPORT_FIELDS = [name for group in REPORT_FIELDS for name in group]
+
+
+def _report_rows(report):
+    """Flat tuples of `REPORT_FIELDS` from a `tdep_reports` report, one
+    per temperature of its thermal conductivity table."""
+    row = []
+    for fc in (2, 3, 4):
+        row += report.get("overdetermination", {}).get(fc, (np.nan, np.nan))
+    for fc in (2, 3, 4):
+        row.append(report.get("r_squared", {}).get(fc, np.nan))
+    for fc in (1, 2, 3, 4):
+        row += report.get("interactions", {}).get(fc, (np.nan, np.nan))
+
+    tc = report.get("thermal_conductivity") or [[np.nan, np.nan]]
+    for tc_row in tc:
+        if len(tc_row) < 2:
+            raise ValueError("Thermal conductivity row of %d values: %s" %
+                             (len(tc_row), tc_row))
+
+    return [tuple(float(x) for x in row + tc_row[:2]) for tc_row in tc]
+
+
+def _chunks(items, size):
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+
+def collect_reports(paths, max_workers=None, as_frame=False):
+    """Parse the TDEP reports (`out.log`, `outfile.thermal_conductivity`)
+    of many action directories in a process pool.
+
+    `paths` is a list of action directories or a glob pattern such as
+    "work/forceconstants_*".
+
+    Result: (reports, failures) - a structured array with a `path` field
+    and the float `REPORT_FIELDS` (NaN where not reported), one record
+    per temperature of multi-temperature conductivity tables, or a
+    pandas DataFrame indexed by path and temperature with `as_frame`;
+    and a list of (path, error message) for directories that could not
+    be parsed."""
+    if isinstance(paths, (str, os.PathLike)):
+        paths = sorted(glob.glob(os.fspath(paths)))
+    paths = [os.fspath(path) for path in paths]
+
+    workers = max_workers or os.cpu_count() or 1
+    chunks = _chunks(paths, max(1, min(64, len(paths) // (4 * workers))))
+    if workers == 1 or len(chunks) < 2:
+        results = map(tdep_reports.collect_reports, chunks)
+        collected = {k: v for chunk in results for k, v in chunk.items()}
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            collected = {k: v for chunk in
+                         pool.map(tdep_reports.collect_reports, chunks)
+                         for k, v in chunk.items()}
+
+    rows, failures = [], []
+    for path in paths:
+        report = collected[path]
+        if "error" in report:
+            failures.append((path, report["error"]))
+        elif not report:
+            failures.append((path, "No TDEP reports found."))
+        else:
+            try:
+                rows += [(path,) + r for r in _report_rows(report)]
+            except ValueError as e:
+                failures.append((path, str(e)))
+
+    width = max([len(row[0]) for row in rows], default=1)
+    dtype = [("path", f"U{width}")] + [(name, np.float64)
+                                       for name in REPORT_FIELDS]
+    reports = np.array(rows, dtype=dtype)
+
+    if as_frame:
+        import pandas as pd     # optional dependency
+        reports = pd.DataFrame.from_records(reports).set_index(
+            ["path", "temperature"])
+
+    return reports, failures
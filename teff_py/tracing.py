@@ -0,0 +1,115 @@
+"""Timeline tracing of workflow execution.
+
+A `Tracer` records timestamped spans of each action's processing
+phases (queue wait, prepare, run, post-processing, scheduler wait) and
+exports them in the Chrome trace event format, to be inspected with
+`chrome://tracing` or https://ui.perfetto.dev:
+
+    with Tracer() as tracer:
+        ...                     # workflow
+    tracer.export("wf.trace.json")
+
+Actions are laid out one per row, grouped by machine. Child actions
+are linked to their parents with flow arrows.
+"""
+
+import json
+import os
+import threading
+import time
+
+from teff_py.actions import add_listener, remove_listener
+
+
+def host_name(machine):
+    return str(getattr(machine, "host", None) or "local")
+
+
+def machine_name(action):
+    return host_name(getattr(action.command, "machine", None))
+
+
+class Tracer():
+    "Recorder of action phase spans, an `actions` listener."
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        # keyed by the actions themselves: ids of freed actions are reused
+        self._open = {}         # (action, phase) -> start timestamp
+        self._rows = {}         # action -> (pid, tid)
+        self._pids = {}         # machine name -> pid
+        self._last = {}         # action -> end of its last span
+        self._flows = 0
+
+    def __enter__(self):
+        add_listener(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_listener(self)
+
+    def _now(self):
+        "Microseconds since the tracer creation."
+        return (time.perf_counter() - self._t0) * 1e6
+
+    def _row(self, action):
+        key = action
+        if key not in self._rows:
+            machine = machine_name(action)
+            if machine not in self._pids:
+                self._pids[machine] = len(self._pids) + 1
+                self.events.append({
+                    "ph": "M", "name": "process_name",
+                    "pid": self._pids[machine], "tid": 0,
+                    "args": {"name": machine}})
+            row = (self._pids[machine], len(self._rows) + 1)
+            self._rows[key] = row
+            self.events.append({
+                "ph": "M", "name": "thread_name", "pid": row[0],
+                "tid": row[1], "args": {"name": str(action.path)}})
+            self._link_parent(action, row)
+        return self._rows[key]
+
+    def _link_parent(self, action, row):
+        # flow arrow from the end of the parent work to the child
+        parent = getattr(action, "parent", None)
+        if parent is None or parent not in self._last:
+            return
+        ts, parent_row = self._last[parent]
+        self._flows += 1
+        for ph, (pid, tid), t in (("s", parent_row, ts),
+                                  ("f", row, max(ts, self._now()))):
+            self.events.append({
+                "ph": ph, "id": self._flows, "name": "parent", "cat": "link",
+                "pid": pid, "tid": tid, "ts": t, "bp": "e"})
+
+    def __call__(self, event, action, phase=None, **info):
+        with self._lock:
+            key = (action, phase)
+            if event == "begin":
+                self._row(action)
+                self._open[key] = self._now()
+            elif event == "end" and key in self._open:
+                start = self._open.pop(key)
+                end = self._now()
+                pid, tid = self._row(action)
+                parent = getattr(action, "parent", None)
+                self.events.append({
+                    "ph": "X", "name": phase, "cat": type(action).__name__,
+                    "pid": pid, "tid": tid, "ts": start, "dur": end - start,
+                    "args": {"action": action.make_prefix(),
+                             "parent": (parent.make_prefix()
+                                        if parent is not None else None),
+                             "state": action.state.name, **info}})
+                self._last[action] = (end, (pid, tid))
+
+    def export(self, fname):
+        "Write the trace to `fname` in the Chrome trace JSON format."
+        with self._lock:
+            trace = {"traceEvents": list(self.events),
+                     "displayTimeUnit": "ms",
+                     "otherData": {"pid": os.getpid()}}
+        with open(fname, "w") as f:
+            json.dump(trace, f)
@@ -0,0 +1,80 @@
+import pytest
+from plumbum import CommandNotFound, local
+from teff_py.actions import State
+from teff_py.accounting import AccountingLog, parse_duration, parse_memory
+from teff_py.async_actions import SlurmScheduledAction
+
+# stand-in `sacct`: records of the jobs 101 (half idle on 4 cores),
+# 102 (killed on its time limit) and 103 (still running)
+SACCT = """#!/bin/sh
+cat <<END
+101|COMPLETED|0:0|3600|02:00:00|4||4000Mn|60
+101.batch|COMPLETED|0:0|3600|02:00:00|4|1048576K||
+101.0|COMPLETED|0:0|3590|01:59:00|4|2G||
+102|TIMEOUT|0:0|7200|1-00:00:00|16||64G|120
+102.batch|CANCELLED by 0|0:15|7200|1-00:00:00|16|3.5G||
+103|RUNNING|0:0|60|00:01:00|1|||10
+END
+"""
+
+
+def test_parsers():
+    assert(parse_duration("1-02:03:04.5") == 93784.5)
+    assert(parse_duration("02:03.25") == 123.25)
+    assert(parse_memory("4000Mn") == 4000 << 20)
+    assert(parse_memory("") == 0)
+
+
+def test_accounting(tmp_path):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    (bindir / "sacct").write_text(SACCT)
+    (bindir / "sacct").chmod(0o755)
+
+    class Root():
+        path = local.path(str(tmp_path))
+
+    class FCs(SlurmScheduledAction):
+        command = local["true"]
+
+        def make_prefix(self):
+            return "fcs_%s" % self._id
+
+    class TC(FCs):
+        pass
+
+    actions = []
+    for cls, job_id in ((FCs, "101"), (TC, "102"), (FCs, "103")):
+        action = cls([], parent=Root())
+        action._id = job_id
+        action.state = State.FINISHED   # left the queue
+        actions.append(action)
+
+    accounting = AccountingLog(tmp_path / "accounting.jsonl")
+    for action in actions:
+        accounting("end", action, phase="scheduled")
+
+    # `sacct` not found: nothing lost
+    with local.env(PATH=str(tmp_path)):
+        with pytest.raises(CommandNotFound):
+            accounting.ingest(local)
+    assert(accounting.pending == actions)
+
+    with local.env(PATH=str(bindir) + ":" + local.env["PATH"]):
+        new = accounting.ingest(local)
+
+    assert([rec["job_id"] for rec in new] == ["101", "102"])
+    assert(accounting.pending == [actions[2]])      # not finished yet
+    fcs = actions[0].accounting
+    assert(fcs["cpu_efficiency"] == 0.5 and fcs["wasted_core_hours"] == 2.0)
+    assert(fcs["max_rss"] == 2 << 30 and fcs["req_mem"] == 4000 << 20)
+    assert(actions[1].accounting["state"] == "TIMEOUT")
+    assert([a.state for a in actions] ==
+           [State.SUCCEEDED, State.FAILED, State.FINISHED])
+
+    # persisted records
+    summary = AccountingLog(tmp_path / "accounting.jsonl").summary()
+    assert(summary["TC"] == {"jobs": 1, "failed": 1, "core_hours": 32.0,
+                             "wasted_core_hours": 8.0,
+                             "max_rss": int(3.5 * (1 << 30))})
+    assert(accounting.report().splitlines()[1].startswith("TC "))
@@ -1,5 +1,6 @@
+import logging
 from plumbum import local
-from teff_py.actions import Action, State
+from teff_py.actions import Action, State, add_listener, remove_listener
 
 class Parent():             # mock parent class
     path = local.path("/tmp")
@@ -56,3 +57,59 @@ def test_bound_action_mpi():
     assert(ls.state == State.SUCCEEDED)
 
     local["rm"]("-r", ls.path)     # cleanup
+
+
+def test_lightweight_action(caplog):
+    class TempAction(Action):
+        command = local["ls"]
+
+        def make_prefix(self):
+            return "light_%d" % self.args_source["n"]
+
+    num_loggers = len(logging.Logger.manager.loggerDict)
+    with caplog.at_level(logging.DEBUG):
+        actions = [TempAction({"n": n}, parent=Parent()) for n in range(100)]
+
+    # one shared logger, records named after the action prefix
+    assert(len(logging.Logger.manager.loggerDict) == num_loggers)
+    assert(caplog.records[0].name == "light_0")
+
+    assert(actions[0]._path is None)     # resolved on first use only
+    assert(actions[0].path == local.path("/tmp/light_0"))
+
+    root = TempAction({"n": 0})
+    assert(root.path == local.cwd / "light_0")
+
+
+def test_scratch_action(tmp_path):
+    class Dir():
+        path = local.path(str(tmp_path))
+
+        def make_prefix(self):
+            return "parent"
+
+    (tmp_path / "infile.data").write_text("input\n")
+
+    class TempAction(Action):
+        command = local["sh"]
+        scratch = str(tmp_path / "scratch")
+        scratch_outputs = ["outfile.*"]
+
+        @Action.change_state_on_prepare
+        def prepare(self):
+            local["ln"]("-s", tmp_path / "infile.data", self.path / "infile.data")
+
+    local["mkdir"](tmp_path / "scratch")
+    script = "pwd > outfile.pwd; cat infile.data > outfile.copy; touch junk; exit %d"
+    for code, state in ((0, State.SUCCEEDED), (1, State.FAILED)):
+        sh = TempAction(["-c", script % code], parent=Dir())
+        sh.prepare()
+        sh.run()
+        assert(sh.state == state)
+
+        # ran in scratch, outputs copied back, scratch removed
+        assert(str(tmp_path / "scratch") in (sh.path / "outfile.pwd").read())
+        assert((sh.path / "outfile.copy").read() == "input\n")
+        assert(not (sh.path / "junk").exists())
+        assert(not list((tmp_path / "scratch").iterdir()))
+        local["rm"]("-r", sh.path)
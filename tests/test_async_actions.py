@@ -0,0 +1,76 @@
+import asyncio
+from plumbum import local
+from teff_py.actions import State
+from teff_py.async_actions import SlurmScheduledAction, upload_scripts
+
+TEMPLATE = """\
+#!/bin/bash
+#SBATCH --job-name=${job_name}
+#SBATCH --ntasks=${cores}
+#SBATCH --time=${time}
+cd $path
+extract_forceconstants -rc2 LABEL_RC2 -rc3 LABEL_RC3 > "$SLURM_JOB_ID.log"
+"""
+
+
+class Model():
+    def time_limit(self, action):
+        if action.args_source["rc3"] > 4.0:
+            return "01:00:00"
+
+
+def test_upload_scripts(tmp_path):
+    class Root():
+        path = local.path(str(tmp_path))
+
+    class FCsToSubmit(SlurmScheduledAction):
+        command = local["true"]
+        num_mpi_procs = 8
+        script_template = TEMPLATE
+        script_name = "sub_fcs.sh"
+        runtime_model = Model()
+
+        def make_prefix(self):
+            return "fcs_%s_%s" % (self.args_source["rc2"],
+                                  self.args_source["rc3"])
+
+    calcs = [FCsToSubmit({"rc2": 6.5, "rc3": rc3}, parent=Root())
+             for rc3 in (4.0, 4.5)]
+    upload_scripts(calcs)
+
+    script = (tmp_path / "fcs_6.5_4.5" / "sub_fcs.sh").read_text()
+    assert(script == TEMPLATE
+           .replace("${job_name}", "fcs_6.5_4.5").replace("${cores}", "8")
+           .replace("${time}", "01:00:00")
+           .replace("LABEL_RC2", "6.5").replace("LABEL_RC3", "4.5"))
+    assert((tmp_path / "fcs_6.5_4.0" / "sub_fcs.sh").stat().st_mode & 0o100)
+
+    # no prediction: scheduler default time
+    script = (tmp_path / "fcs_6.5_4.0" / "sub_fcs.sh").read_text()
+    assert("--time" not in script and "--ntasks=8" in script)
+
+
+def test_time_on_command(tmp_path):
+    class Root():
+        path = local.path(str(tmp_path))
+
+    class Job(SlurmScheduledAction):
+        command = local["echo"]
+        runtime_model = Model()
+
+        def make_prefix(self):
+            return "job"
+
+        async def submit_hook(self):
+            pass
+
+        async def run_hook(self):
+            self.state = State.SUCCEEDED
+
+    job = Job({"rc3": 5.0}, parent=Root())
+    assert(job.time_limit() == "01:00:00")  # e.g. by `planning`
+    job.prepare()
+    asyncio.run(job.run())
+    job.state = State.PREPARED              # resubmission
+    asyncio.run(job.run())
+    assert(job.command.formulate().count("--time=01:00:00") == 1)
@@ -0,0 +1,105 @@
+from plumbum import local
+from teff_py.actions import Action, State
+from teff_py.coalescing import coalesce, split_table
+from teff_py.discovery import discover
+from teff_py.tdep_utils import temperature_range_args
+
+
+class Scan(Action):
+    # every invocation is recorded in `calls`, one table row per T
+    command = local["sh"]
+    coalesce_axis = "temperature"
+    coalesced_tables = ["outfile.table"]
+
+    def make_prefix(self):
+        return "scan_q%d_T%d" % (self.args_source["qg"],
+                                 self.args_source["temperature"])
+
+    def table_args(self, temperatures):
+        return ["-c", "echo >> ../calls; echo '# T qg' > outfile.table; "
+                "for t in %s; do echo $t %d >> outfile.table; done" % (
+                    " ".join(map(str, temperatures)),
+                    self.args_source["qg"])]
+
+    def make_args_list(self):
+        return self.table_args([self.args_source["temperature"]])
+
+    def make_coalesced_args_list(self, values):
+        if temperature_range_args(values) is not None:
+            return self.table_args(values)
+
+    @Action.change_state_on_prepare
+    def prepare(self):
+        (self.path / "infile.T").write(
+            "%d" % self.args_source["temperature"])
+
+
+def test_temperature_range_args():
+    assert(temperature_range_args([100, 200, 300]) ==
+           ["--temperature_range", "100", "300", "3"])
+    assert(temperature_range_args([100, 150, 400]) is None)
+    assert(temperature_range_args([300]) is None)
+
+
+def test_split_table():
+    text = "# T kappa\n100 3.0\n200 2.0\n\n300 1.0\n400 0.5\n"
+    assert(split_table(text, 2) == ["# T kappa\n100 3.0\n200 2.0\n",
+                                    "# T kappa\n300 1.0\n400 0.5\n"])
+
+
+def test_coalesce(tmp_path):
+    class Root():
+        path = local.path(str(tmp_path))
+
+    root = Root()
+    actions = [Scan({"qg": qg, "temperature": t}, parent=root)
+               for qg, temperatures in ((1, (300, 100, 200)),
+                                        (2, (100,)),
+                                        (3, (100, 150, 400)))
+               for t in temperatures]
+    runs = coalesce(actions)
+
+    assert(len(runs) == 5)
+    merged = runs[0]
+    assert(merged.members == [actions[1], actions[2], actions[0]])
+    assert(merged.make_prefix() == "scan_q1_T100.x3")
+    assert(all(a.coalesced is merged for a in actions[:3]))
+    assert(actions[3].coalesced is None)
+
+    for action in runs:
+        action.prepare()
+        action.run()
+
+    assert(all(a.state == State.SUCCEEDED for a in actions))
+    assert(len((tmp_path / "calls").read_text().split("\n")) == 6)  # 5 calls
+    assert((tmp_path / "scan_q1_T300" / "outfile.table").read_text() ==
+           "# T qg\n300 1\n")
+    assert(actions[0].runner is merged.runner)
+
+    # members prepared with their own values, the merged action with
+    # the first one; logs in the member directories too
+    assert((tmp_path / "scan_q1_T300" / "infile.T").read_text() == "300")
+    assert((tmp_path / "scan_q1_T100.x3" / "infile.T").read_text() == "100")
+    assert(all((a.path / "out.log").exists() for a in actions))
+    assert(set(discover(local, tmp_path, actions, outputs=["outfile.table"],
+                        seed=False)) == {"outputs"})
+
+
+def test_coalesced_ignored(tmp_path):
+    class Root():
+        path = local.path(str(tmp_path))
+
+    root = Root()
+    actions = [Scan({"qg": 1, "temperature": t}, parent=root)
+               for t in (100, 200)]
+    merged, = coalesce(actions)
+    # directory left by an earlier merged run, the members are new
+    (tmp_path / merged.make_prefix()).mkdir()
+    merged.prepare()
+    merged.run()
+
+    assert(merged.state == State.IGNORED)
+    assert(all(a.state == State.SUCCEEDED for a in actions))
+    assert(len((tmp_path / "calls").read_text().split("\n")) == 3)  # 2 calls
+    assert((tmp_path / "scan_q1_T200" / "outfile.table").read_text() ==
+           "# T qg\n200 1\n")
@@ -0,0 +1,48 @@
+from plumbum import local
+from teff_py.actions import Action, State
+from teff_py.discovery import discover
+
+
+def test_discover(tmp_path):
+    class Root():
+        path = local.path(str(tmp_path)) / "sweep"
+
+    class TempAction(Action):
+        command = local["touch"]
+        expected_outputs = ["outfile.result"]
+
+        def make_prefix(self):
+            return "calc.%s" % self.args_source[0]
+
+        def make_args_list(self):
+            return ["outfile.result"]
+
+    files = {"prepared": [],
+             "out.log": ["out.log", "outfile.other"],
+             "err.log": ["out.log", "err.log"],
+             "outputs": ["out.log.gz", "outfile.result"]}
+    for name, fnames in files.items():
+        (Root.path / ("calc." + name)).mkdir()
+        for fname in fnames:
+            (Root.path / ("calc." + name) / fname).touch()
+    # a link to the outputs of another action is not an output
+    (Root.path / "calc.out.log" / "outfile.result").symlink_to(
+        Root.path / "calc.outputs" / "outfile.result")
+
+    names = ["absent"] + list(files)
+    actions = [TempAction([name], parent=Root()) for name in names]
+    categories = discover(local, Root.path, actions)
+    assert(categories == names)
+    assert([a.state for a in actions] ==
+           [State.NEW, State.PREPARED, State.FINISHED, State.FAILED,
+            State.SUCCEEDED])
+
+    # resuming: only the absent action is prepared, new and old run
+    for action in actions:
+        action.prepare()
+        action.run()
+    assert([a.state for a in actions] ==
+           [State.SUCCEEDED, State.SUCCEEDED, State.FINISHED, State.FAILED,
+            State.SUCCEEDED])
+    assert(discover(local, Root.path, actions) ==
+           ["outputs"] * 2 + names[2:])
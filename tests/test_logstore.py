@@ -0,0 +1,65 @@
+import gzip
+import pytest
+from plumbum import local
+from teff_py.actions import Action, State
+from teff_py.logstore import write_log, LogReader, open_log
+
+LINES = ["step %d Etot = %f" % (i, -100.0 - i) if i % 7 == 0 else
+         "line %d" % i for i in range(1000)]
+
+
+def test_log_reader(tmp_path):
+    fname = tmp_path / "out.log.gz"
+    write_log(fname, LINES, block_size=500)
+    log = LogReader(fname)
+
+    assert(len(log.blocks) > 10)
+    assert(len(log) == len(LINES))
+    assert(log.lines(123, 456) == LINES[123:456])
+    assert(log.lines(990, 2000) == LINES[990:])
+    assert(log.tail(3) == LINES[-3:])
+
+    matches = [[line, LINES[i+1]] for i, line in enumerate(LINES)
+               if "Etot" in line]
+    assert(log.grep("Etot", after=1) == matches)
+    assert(log.grep("Etot", after=1, last=2) == matches[-2:])
+
+    # still a plain (multi-member) gzip file
+    assert(gzip.decompress(fname.read_bytes()).decode() ==
+           "\n".join(LINES) + "\n")
+    with open_log(tmp_path / "out.log") as f:
+        assert(f.read().splitlines() == LINES)
+
+
+def test_compressed_action_log(tmp_path):
+    class Parent():
+        path = local.path(str(tmp_path))
+
+        def make_prefix(self):
+            return "parent"
+
+    class TempAction(Action):
+        command = local["seq"]
+        log_compression = "gzip"
+
+    seq = TempAction(["5"], parent=Parent())
+    seq.prepare()
+    seq.run()
+    assert(seq.state == State.SUCCEEDED)
+
+    assert(not (seq.path / "out.log").exists())
+    assert(LogReader(seq.path / "out.log.gz").tail(2) == ["4", "5"])
+
+
+def test_unknown_compression_at_prepare(tmp_path):
+    class TempAction(Action):
+        command = local["seq"]
+        log_compression = "unknown"
+
+        def make_path(self):
+            return local.path(tmp_path) / self.make_prefix()
+
+    seq = TempAction(["5"])
+    with pytest.raises(ValueError):
+        seq.prepare()
+    assert(seq.state == State.NEW and not seq.path.exists())
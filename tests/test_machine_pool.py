@@ -0,0 +1,112 @@
+import asyncio
+from plumbum import local
+from plumbum.machines.local import LocalMachine
+from teff_py.actions import Action, State, add_listener, remove_listener
+from teff_py.machine_pool import MachinePool, PoolMachine, rebind_command
+
+
+class Parent():             # mock parent class
+    path = local.path("/tmp")
+
+    def make_prefix(self):
+        return "mock_parent"
+
+
+class Sleep(Action):
+    command = local["sleep"]
+
+    def make_prefix(self):
+        return "pool_sleep_%d" % self.args_source["n"]
+
+    def make_args_list(self):
+        return ["0.2"]
+
+
+def test_rebind_command():
+    machine = LocalMachine()
+    command = local["env"].with_env(FOO="bar") | local["grep"]["FOO="]
+    rebound = rebind_command(command, machine)
+    assert(rebound.formulate() == command.formulate())
+    assert(rebound().strip() == "FOO=bar")
+
+
+def test_pool_dispatch():
+    # several local machine stand-ins of different capacity
+    pool = MachinePool([PoolMachine(LocalMachine(), 2, name="ws1"),
+                        PoolMachine(LocalMachine(), 1, name="ws2")])
+    actions = [Sleep({"n": n}, parent=Parent()) for n in range(6)]
+
+    started = []                # (action number, cores in use)
+
+    def record(event, action, phase=None, **info):
+        if event == "begin" and phase == "run":
+            started.append((action.args_source["n"],
+                            sum(m.used_cores for m in pool.machines)))
+
+    add_listener(record)
+    try:
+        placements = asyncio.run(pool.run(actions))
+    finally:
+        remove_listener(record)
+    pool.shutdown()
+
+    assert(all(a.state == State.SUCCEEDED for a in actions))
+    assert(sorted(m.name for m in placements) == ["ws1"] * 4 + ["ws2"] * 2)
+    assert(pool.placed == {"ws1": 4, "ws2": 2})
+    assert(all(m.used_cores == 0 for m in pool.machines))
+    # three at a time, dispatched in submission order
+    assert(max(cores for _, cores in started) == 3)
+    assert(sorted(n for n, _ in started[:3]) == [0, 1, 2])
+
+    for action in actions:
+        local["rm"]("-r", action.path)     # cleanup
+
+
+def test_locality_placement(tmp_path):
+    class Root(Sleep):
+        def make_path(self):
+            return local.path(tmp_path) / self.make_prefix()
+
+    class Child(Sleep):
+        parent_files = ["outfile.*"]
+
+    class RecordingPool(MachinePool):
+        staged = []
+
+        def stage_parent_files(self, action, source, pool_machine):
+            self.staged.append((action.args_source["n"], source.name,
+                                pool_machine.name))
+
+    pool = RecordingPool([PoolMachine(LocalMachine(), 2, name="ws1"),
+                          PoolMachine(LocalMachine(), 1, name="ws2",
+                                      filesystem="cluster")])
+    parent = Root({"n": 0})
+
+    async def workflow():
+        await pool.submit(parent)
+        return await pool.run([Child({"n": n}, parent=parent)
+                               for n in (1, 2, 3)])
+
+    placements = asyncio.run(workflow())
+    pool.shutdown()
+
+    # two children run next to the parent outputs, the third one only
+    # fits on the idle remote machine, with its parent data moved there
+    assert([m.name for m in placements].count("ws2") == 1)
+    assert(len(pool.staged) == 1 and pool.staged[0][1:] == ("ws1", "ws2"))
+
+
+def test_transfer(tmp_path):
+    from teff_py.remote_utils import transfer
+
+    src = tmp_path / "src" / "fcs"
+    (src / "tc").mkdir(parents=True)
+    (src / "outfile.forceconstant").write_text("fc2")
+    (src / "infile.forces").write_text("forces")
+    (src / "tc" / "outfile.thermal_conductivity").write_text("kappa")
+
+    dst = tmp_path / "dst" / "fcs"
+    assert(transfer(local, src, local, dst, ["outfile.*"]) ==
+           ["outfile.forceconstant"])
+    assert(sorted(p.name for p in dst.iterdir()) == ["outfile.forceconstant"])
+    assert(transfer(local, src, local, dst, ["outfile.*"]) == [])
@@ -0,0 +1,65 @@
+import urllib.request
+from plumbum import local
+from teff_py.actions import Action, notify
+from teff_py.metrics import Metrics
+
+
+class Parent():             # mock parent class
+    path = local.path("/tmp")
+
+    def make_prefix(self):
+        return "mock_parent"
+
+
+class Ls(Action):
+    command = local["ls"]
+
+    def make_prefix(self):
+        return "metrics_ls"
+
+    def make_args_list(self):
+        return []
+
+
+def test_metrics(tmp_path):
+    textfile = tmp_path / "teff.prom"
+    with Metrics(port=0, textfile=str(textfile)) as metrics:
+        action = Ls([], parent=Parent())
+        action.prepare()
+        action.run()
+
+        class Remote():
+            host = "cluster"
+        notify("helper", Remote(), command="squeue")
+
+        request = urllib.request.Request(
+            "http://127.0.0.1:%d/metrics" % metrics.port,
+            headers={"Accept": "application/openmetrics-text"})
+        with urllib.request.urlopen(request) as response:
+            assert("openmetrics" in response.headers["Content-Type"])
+            exposition = response.read().decode()
+
+    local["rm"]("-r", action.path)     # cleanup
+
+    lines = exposition.splitlines()
+    assert(lines[-1] == "# EOF")
+    assert('teff_actions_created_total{class="Ls"} 1' in lines)
+    assert('teff_action_transitions_total'
+           '{class="Ls",from="RUNNING",to="SUCCEEDED"} 1' in lines)
+    assert('teff_actions{state="SUCCEEDED"} 1' in lines)
+    assert('teff_action_phase_seconds_bucket'
+           '{class="Ls",phase="run",le="+Inf"} 1' in lines)
+    assert('teff_action_command_seconds_count{machine="local"} 1' in lines)
+    # commands spawned: the action one, `mkdir` at prepare, `tee` of out.log
+    for command in ("action", "mkdir", "tee"):
+        assert('teff_commands_total{machine="local",command="%s"} 1' %
+               command in lines)
+    # only the remote ones are round trips
+    round_trips = [line for line in lines
+                   if line.startswith("teff_ssh_round_trips_total")]
+    assert(round_trips == ['teff_ssh_round_trips_total{machine="cluster"} 1'])
+
+    # Prometheus format in the textfile, written on exit
+    text = textfile.read_text()
+    assert("# TYPE teff_actions_created_total counter" in text)
+    assert("# EOF" not in text)
@@ -0,0 +1,55 @@
+import io
+from plumbum import local
+from teff_py.actions import Action, State
+from teff_py.monitor import ProgressMonitor
+
+
+class Parent():             # mock parent class
+    path = local.path("/tmp")
+
+    def make_prefix(self):
+        return "mock_parent"
+
+
+class Ls(Action):
+    command = local["ls"]
+    num_mpi_procs = 2
+
+    def make_prefix(self):
+        return "monitor_ls_%d" % self.args_source[0]
+
+    def make_args_list(self):
+        return []
+
+
+def test_progress_monitor():
+    stream = io.StringIO()
+    with ProgressMonitor(stream, interval=1e-9) as monitor:
+        actions = [Ls([n], parent=Parent()) for n in range(3)]
+        actions[0].prepare()
+        actions[0].state = State.RUNNING
+        assert(monitor.cores == 2)
+        actions[0].state = State.PREPARED
+        actions[0].run()
+        assert(monitor.counts[State.SUCCEEDED] == 1)
+        assert(monitor.counts[State.NEW] == 2 and monitor.cores == 0)
+        line = monitor.status_line()
+
+    local["rm"]("-r", actions[0].path)     # cleanup
+
+    assert(line.startswith("1/3 done | new 2 succeeded 1 | 0 cores"))
+    assert("ETA" in line and "/min" in line)
+    # not a terminal: one line per render, the final one on exit
+    lines = stream.getvalue().splitlines()
+    assert(len(lines) > 3 and "] 1/3 done | new 2 succeeded 1 |" in lines[-1])
+
+
+def test_monitor_overhead():
+    # state changes only update counters, rendering is rate limited
+    stream = io.StringIO()
+    with ProgressMonitor(stream, interval=60) as monitor:
+        actions = [Ls([n], parent=Parent()) for n in range(20000)]
+        for action in actions:
+            action.state = State.SUCCEEDED
+        assert(monitor.counts[State.SUCCEEDED] == len(actions))
+    assert(len(stream.getvalue().splitlines()) <= 2)
@@ -0,0 +1,48 @@
+from plumbum import local
+from teff_py.actions import Action
+from teff_py.planning import plan
+
+
+class Root(Action):
+    command = local["false"]
+
+    def make_prefix(self):
+        return "root.%d" % self.args_source[0]
+
+
+class Leaf(Action):
+    command = local["false"]
+    num_mpi_procs = 4
+
+    def make_prefix(self):
+        return "leaf.%d" % (self.args_source[0] % 50)
+
+    def make_args_list(self):
+        return ["--n", str(self.args_source[0])]
+
+
+class Broken(Leaf):
+    def make_args_list(self):
+        raise KeyError("missing")
+
+
+def test_plan(tmp_path):
+    with local.cwd(tmp_path):
+        roots = [Root([i]) for i in range(2)]
+        leaves = [Leaf([j], parent=roots[j % 2]) for j in range(200)]
+        p = plan(roots + leaves + [Broken([0], parent=roots[0])])
+        assert(p.paths == [str(a.path) for a in p.actions])
+
+    assert(len(p) == 202)
+    assert(p.counts["Leaf"] == 200 and p.cores["Leaf"] == 800)
+    assert(p.paths[2] == str(tmp_path / "root.0" / "leaf.0"))
+    assert(p.args[2] == ["--n", "0"])
+    # each leaf directory is planned for 4 actions
+    assert(len(p.collisions) == 50)
+    assert(len(p.errors) == 1)
+    assert(not list(tmp_path.iterdir()))     # nothing created
+
+    assert("202 actions, 52 directories" in p.summary())
+    tree = p.tree(max_children=2).splitlines()
+    assert(tree[0] == str(tmp_path) + "/")
+    assert(tree[1:4] == ["  root.0/", "    leaf.0/", "    leaf.10/"])
@@ -0,0 +1,87 @@
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from plumbum import local
+from teff_py.actions import Action
+from teff_py.profiling import Profiler
+
+kept = []
+
+
+class Parent():             # mock parent class
+    path = local.path("/tmp")
+
+    def make_prefix(self):
+        return "mock_parent"
+
+
+def busy(seconds):
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+class Sleep(Action):
+    command = local["sleep"]
+
+    def make_prefix(self):
+        return "profiling_sleep_%d" % self.args_source[0]
+
+    @Action.change_state_on_prepare
+    def prepare(self):
+        kept.append([bytes(1000) for _ in range(100)])  # ~100 KiB
+        busy(0.05)
+
+    def make_args_list(self):
+        return ["0.2"]
+
+
+def test_profiler():
+    with Profiler() as profiler:
+        actions = [Sleep([n], parent=Parent()) for n in range(2)]
+        for action in actions:
+            action.prepare()
+            action.run()
+
+    for action in actions:
+        local["rm"]("-r", action.path)     # cleanup
+
+    assert(profiler.calls["Sleep", "prepare"] == 2)
+    assert(profiler.calls["Sleep", "run"] == 2)
+    # the commands run for 0.4s, not the driver
+    assert(profiler.cpu["Sleep", "run"] < 0.2)
+    assert(profiler.allocated["Sleep"] > 200000)
+
+    # sampled: the CPU time of prepare is spent busy
+    own, total, _, func = profiler.hot_spots("Sleep")[0]
+    assert(func[2] == "busy" and 0.05 < own <= total < 0.2)
+    report = profiler.report()
+    assert(report.startswith("Sleep: prepare 2 x "))
+    assert("Process-wide:" in report)
+    lines, first = inspect.getsourcelines(Sleep)
+    line = first + next(i for i, text in enumerate(lines) if "kept" in text)
+    assert("test_profiling.py:%d" % line in report)     # allocation site
+
+
+def test_profiler_threads():
+    # phases overlapping in several threads, one profile per thread
+    # before Python 3.12
+    def process(n):
+        action = Sleep([n], parent=Parent())
+        action.prepare()
+        action.run()
+        return action
+
+    with Profiler(memory=False) as profiler:
+        with ThreadPoolExecutor(4) as executor:
+            actions = list(executor.map(process, range(4)))
+
+    for action in actions:
+        local["rm"]("-r", action.path)     # cleanup
+
+    assert(profiler.calls["Sleep", "run"] == 4)
+    assert(not profiler._open and not any(profiler._active.values()))
+    # merged, none of the threads lost
+    calls = {func[2]: nc for func, (cc, nc, tt, ct, _) in
+             profiler.stats().stats.items()}
+    assert(calls["busy"] == 4)
@@ -0,0 +1,51 @@
+import pytest
+from plumbum import local
+from teff_py import remote_utils
+from teff_py.remote_utils import push, pull
+
+
+def test_push_pull(tmp_path, monkeypatch):
+    # The local machine stands in for a remote one.
+    inputs, remote, results = (tmp_path / d for d in ("inp", "rem", "res"))
+    for system in ("sys_a", "sys_b"):
+        (inputs / system).mkdir(parents=True)
+        (inputs / system / "infile.ucposcar").write_text(system)
+        (inputs / system / "infile.meta").write_text("4\n2\n1.0\n300\n")
+
+    local_dirs = [inputs / "sys_a", inputs / "sys_b"]
+    hashed = []
+    sha1 = remote_utils._sha1
+    monkeypatch.setattr(remote_utils, "_sha1",
+                        lambda fname: hashed.append(fname) or sha1(fname))
+    assert(len(push(local, local_dirs, remote)) == 4)
+    assert(hashed == [])                # nothing remote to compare with
+    assert((remote / "sys_b" / "infile.ucposcar").read_text() == "sys_b")
+    assert(push(local, local_dirs, remote) == [])
+    assert(len(hashed) == 4)
+
+    (inputs / "sys_a" / "infile.meta").write_text("8\n2\n1.0\n300\n")
+    assert(push(local, local_dirs, remote) == ["sys_a/infile.meta"])
+
+    (remote / "sys_a" / "outfile.forceconstant").write_text("fc")
+    (remote / "sys_a" / "out.log").write_text("log")
+    fetched = pull(local, remote, ["sys_a", "sys_b"], results)
+    assert(fetched == ["sys_a/out.log", "sys_a/outfile.forceconstant"])
+    assert((results / "sys_a" / "outfile.forceconstant").read_text() == "fc")
+    assert(not (results / "sys_a" / "infile.meta").exists())
+    assert(pull(local, remote, ["sys_a", "sys_b"], results) == [])
+    assert(not list(remote.glob(".teff-stage-*")))
+
+
+def test_push_checks(tmp_path, caplog):
+    for parent in ("a", "b"):
+        (tmp_path / parent / "sys").mkdir(parents=True)
+        (tmp_path / parent / "sys" / "infile.meta").write_text(parent)
+    (tmp_path / "a" / "sys" / "infile.link").symlink_to("infile.meta")
+
+    with pytest.raises(ValueError):     # both staged as sys/infile.meta
+        push(local, [tmp_path / "a" / "sys", tmp_path / "b" / "sys"],
+             tmp_path / "rem")
+
+    assert(push(local, [tmp_path / "a" / "sys"], tmp_path / "rem") ==
+           ["sys/infile.meta"])
+    assert("infile.link" in caplog.text)
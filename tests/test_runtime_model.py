@@ -0,0 +1,76 @@
+from plumbum import local
+from teff_py.actions import Action, add_listener, remove_listener
+from teff_py.async_actions import SlurmScheduledAction
+from teff_py.runtime_model import RuntimeHistory, format_slurm_time
+
+
+class Parent():             # mock parent class
+    path = local.path("/tmp")
+
+    def make_prefix(self):
+        return "mock_parent"
+
+
+class FCs(Action):
+    command = local["true"]
+    num_mpi_procs = 4
+
+    def make_prefix(self):
+        return "runtime_fcs_%s" % self.args_source["rc2"]
+
+
+class TC(Action):
+    command = local["true"]
+
+
+class Broken(FCs):
+    command = local["false"]
+
+
+class Job(SlurmScheduledAction):
+    command = local["true"]
+
+
+def test_predict_and_order(tmp_path):
+    history = RuntimeHistory(tmp_path / "runtimes.jsonl")
+    for rc2 in (2.0, 3.0, 4.0, 5.0):
+        history.record(FCs({"rc2": rc2, "natoms": 64}, parent=Parent()),
+                       10.0 * rc2**3)
+
+    reloaded = RuntimeHistory(tmp_path / "runtimes.jsonl")
+    big = FCs({"rc2": 6.0, "natoms": 64}, parent=Parent())
+    assert(abs(reloaded.predict(big) - 2160.0) < 1.0)
+    assert(reloaded.predict(TC([], parent=Parent())) is None)
+
+    small = FCs({"rc2": 2.5, "natoms": 64}, parent=Parent())
+    tc = TC([], parent=small)   # unknown runtime, on the critical path
+    assert(reloaded.order([big, tc, small]) == [big, small, tc])
+
+    assert(reloaded.time_limit(big) == "01:12:00")
+    assert(format_slurm_time(2 * 86400 + 61) == "2-00:02:00")
+
+
+def test_history_listener(tmp_path):
+    history = RuntimeHistory(tmp_path / "runtimes.jsonl")
+    add_listener(history)
+    try:
+        fcs = FCs({"rc2": 3.0}, parent=Parent())
+        broken = Broken({"rc2": 4.0}, parent=Parent())
+        for action in (fcs, broken):
+            action.prepare()
+            action.run()
+    finally:
+        remove_listener(history)
+        for action in (fcs, broken):
+            local["rm"]("-r", action.path)     # cleanup
+
+    # the failed run is not recorded
+    assert(len(history.records) == 1)
+    assert(history.records[0]["features"] == {"rc2": 3.0, "cores": 4.0})
+
+    # Slurm jobs: elapsed times of the completed ones only
+    job = Job({"rc2": 3.0}, parent=Parent())
+    history("accounting", job, record={"state": "COMPLETED", "elapsed": 60.0})
+    history("accounting", job, record={"state": "TIMEOUT", "elapsed": 90.0})
+    assert(abs(history.predict(job) - 60.0) < 1e-9)
+    assert(not history._started)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import time
+from plumbum import local
+from teff_py.actions import State
+from teff_py.async_actions import SlurmScheduledAction
+from teff_py.sentinels import LOST, SentinelWatcher, SENTINEL, sentinel_trap
+
+
+def test_sentinel_watcher(tmp_path):
+    class Root():
+        path = local.path(str(tmp_path))
+
+    class Job(SlurmScheduledAction):
+        # a background process stands in for the batch job
+        command = local["sh"]
+
+        def make_prefix(self):
+            return "job.%d" % self.args_source["code"]
+
+        def make_args_list(self):
+            return ["-c", "(%s; sleep 0.2; exit %d) > /dev/null 2>&1 &" % (
+                sentinel_trap(self.path), self.args_source["code"])]
+
+    # slow polling: only inotify can be that fast
+    watcher = SentinelWatcher(local, interval=30)
+    jobs = [Job({"code": code}, parent=Root()) for code in (0, 3)]
+    for job in jobs:
+        job.completion = watcher
+        job.prepare()
+    (jobs[1].path / SENTINEL).write("0\n")     # left by an earlier run
+
+    async def main():
+        await asyncio.gather(*(job.run() for job in jobs))
+        return time.time()
+
+    done = asyncio.run(main())
+
+    assert([job.state for job in jobs] == [State.SUCCEEDED, State.FAILED])
+    assert((jobs[1].path / SENTINEL).read() == "3\n")
+    latest = max(os.stat(job.path / SENTINEL).st_mtime for job in jobs)
+    assert(done - latest < 0.5)
+    assert(not watcher.pending)
+
+
+def test_sentinel_polling(tmp_path):
+    class Action():
+        path = local.path(str(tmp_path))
+
+    watcher = SentinelWatcher(local, interval=0.01, use_inotify=False)
+
+    async def main():
+        waiting = asyncio.ensure_future(watcher.wait(Action()))
+        await asyncio.sleep(0.05)
+        (tmp_path / SENTINEL).write_text("0\n")
+        return await waiting
+
+    assert(asyncio.run(main()) == 0)
+
+
+def test_lost_sentinels(tmp_path, caplog):
+    class Queue():              # job 1 is gone
+        def list_jobs(self):
+            return {"2", "3"}
+
+    class Job():
+        def __init__(self, job_id):
+            self.id = job_id
+            self.path = local.path(str(tmp_path / job_id))
+            self.path.mkdir()
+
+    watcher = SentinelWatcher(local, interval=0.01, queue=Queue(),
+                              queue_interval=0)
+    if watcher._inotify is not None:
+        def add(directory):
+            raise OSError(28, "inotify_add_watch failed")
+        watcher._inotify.add = add      # e.g. max_user_watches reached
+
+    gone, queued, written = Job("1"), Job("2"), Job("3")
+
+    async def main():
+        statuses = [await watcher.wait(gone)]   # trap never ran
+        watcher.timeout = 0.05
+        statuses.append(await watcher.wait(queued))
+        watcher.timeout = None
+        waiting = asyncio.ensure_future(watcher.wait(written))
+        await asyncio.sleep(0.05)
+        (written.path / SENTINEL).write_text("0\n")
+        statuses.append(await waiting)
+        return statuses
+
+    assert(asyncio.run(main()) == [LOST, LOST, 0])
+    assert(watcher.lost == 2 and not watcher.pending)
+    assert("timed out" in caplog.text)
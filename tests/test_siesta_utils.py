@@ -0,0 +1,96 @@
+from plumbum import local
+from plumbum.cmd import grep, awk, head, tail
+from teff_py.logstore import write_log
+from teff_py.siesta_utils import (siesta_to_tdep, read_canonical_temperatures,
+                                   read_siesta_log)
+
+NATOMS = 2
+SIESTA_LOG = """\
+siesta: Etot    =     -100.000000
+siesta: Ekin    =        1.500000
+Stress-tensor-Voigt (kbar):       1.0       2.0       3.0
+siesta: Etot    =     -{etot}
+siesta: Ekin    =        {ekin}
+siesta: Pressure (static):
+siesta:                Solids            Molecules
+siesta:          -0.00004657         -0.00004560  Ry/Bohr**3
+siesta:          -0.00684752         -0.00670545  eV/Ang**3
+siesta:          {pres}        -10.74343837  kBar
+siesta: Stress tensor (static) (eV/Ang**3):
+siesta:     {s}    0.000000    0.000000
+siesta:     0.000000    {s}    0.000000
+siesta:     0.000000    0.000000    {s}
+siesta: Final energy (eV):
+"""
+
+
+def write_configuration(path, nc):
+    path.mkdir()
+    label = path / ("siesta_conf%04d" % nc)
+    (path / "out.log").write_text(SIESTA_LOG.format(
+        pres=10.0 * nc, etot=200.0 + nc, ekin=2.0 + nc, s=0.01 * nc))
+    with open(str(label) + ".STRUCT_OUT", "w") as f:
+        f.write("4.0 0.0 0.0\n0.0 4.0 0.0\n0.0 0.0 4.0\n%d\n" % NATOMS)
+        f.write("1 13 0.000 0.00%d 0.000\n1 13 0.500 0.500 0.50%d\n" % (nc, nc))
+    with open(str(label) + ".FA", "w") as f:
+        f.write("%d\n1 0.1 -0.2 0.00%d\n2 -0.1 0.2 -0.00%d\n" % (NATOMS, nc, nc))
+    return (str(label) + ".STRUCT_OUT", str(label) + ".FA",
+            str(path / "out.log"))
+
+
+def shell_stat_line(log, nc, T):
+    "The `infile.stat` line as built with shell pipelines in `mp_wf.py`."
+    Etot = float((grep["Etot ", log] | tail[-1] | awk['{ print $4 }'])().strip())
+    Ekin = float((grep["Ekin ", log] | tail[-1] | awk['{ print $4 }'])().strip())
+    P = float((grep["-i", "-A4", "pres", log] | tail[-1] |
+               awk['{ print $2 }'])().strip()) * 0.1
+    stress = " ".join((grep["-i", "-A3", "Stress ", log] | tail[-3] |
+                       awk['{ print $2, $3, $4 }'])().strip().split("\n"))
+    return f"{nc} {nc} {Etot} {Etot - Ekin} {Ekin} {T} {P} {stress}"
+
+
+def test_siesta_to_tdep(tmp_path):
+    nconfs = 3
+    conf_files = [write_configuration(tmp_path / ("spsiesta.%d" % nc), nc)
+                  for nc in range(1, nconfs + 1)]
+    (tmp_path / "out.log").write_text(
+        "header\n" + "".join("conf %d T: %.1f\n" % (nc, 290.0 + nc)
+                             for nc in range(1, nconfs + 1)))
+
+    temperatures = read_canonical_temperatures(str(tmp_path / "out.log"), nconfs)
+    assert(temperatures == [291.0, 292.0, 293.0])
+
+    for max_workers in (1, 2):
+        out = tmp_path / ("fcs.%d" % max_workers)
+        out.mkdir()
+        siesta_to_tdep(out, conf_files, NATOMS, temperatures,
+                       max_workers=max_workers)
+
+        positions = "".join(
+            (tail[-NATOMS, f[0]] | awk['{ print $3, $4, $5 }'])()
+            for f in conf_files)
+        forces = "".join(
+            (tail[-NATOMS, f[1]] | awk['{ print $2, $3, $4 }'])()
+            for f in conf_files)
+        stat = [shell_stat_line(f[2], nc, T) for nc, (f, T) in
+                enumerate(zip(conf_files, temperatures), start=1)]
+
+        assert((out / "infile.positions").read_text() == positions)
+        assert((out / "infile.forces").read_text() == forces)
+        assert((out / "infile.stat").read_text().splitlines() == stat)
+        assert((out / "infile.meta").read_text().split() ==
+               ["2", "3", "1.0", "300"])
+
+
+def test_read_indexed_log(tmp_path):
+    lines = "".join(SIESTA_LOG.format(pres=10.0 * nc, etot=200.0 + nc,
+                                      ekin=2.0 + nc, s=0.01 * nc)
+                    for nc in range(50)).splitlines()
+    (tmp_path / "out.log").write_text("\n".join(lines) + "\n")
+    plain = read_siesta_log(str(tmp_path / "out.log"))
+
+    stored = tmp_path / "stored"
+    stored.mkdir()
+    write_log(stored / "out.log.gz", lines, block_size=200)
+    assert(read_siesta_log(str(stored / "out.log")) == plain)
+    assert(plain["Etot"] == -249.0)
@@ -0,0 +1,84 @@
+import asyncio
+import io
+from plumbum import local
+from teff_py.actions import State
+from teff_py.async_actions import SlurmScheduledAction
+from teff_py.discovery import discover
+from teff_py.monitor import ProgressMonitor
+from teff_py.slurm_queue import SlurmQueue
+from teff_py.systems_runner import SystemsRunner
+
+# stand-ins of the Slurm commands: at most 3 jobs accepted at once,
+# each job stays listed by `squeue` twice
+SBATCH = """#!/bin/sh
+cd {jobs}
+if [ $(ls | wc -l) -ge 3 ]; then
+    echo "sbatch: error: QOSMaxSubmitJobPerUserLimit" >&2
+    exit 1
+fi
+id=$(($(cat ../counter) + 1)); echo $id > ../counter
+echo 0 > $id
+ls | wc -l >> ../load
+echo "Submitted batch job $id"
+"""
+SQUEUE = """#!/bin/sh
+cd {jobs}
+for id in *; do
+    [ -e "$id" ] || continue
+    n=$(($(cat $id) + 1))
+    if [ $n -gt 2 ]; then rm $id; else echo $n > $id; echo $id; fi
+done
+"""
+
+
+def test_slurm_queue(tmp_path):
+    jobs = tmp_path / "jobs"
+    jobs.mkdir()
+    (tmp_path / "counter").write_text("0\n")
+    for name, script in (("sbatch", SBATCH), ("squeue", SQUEUE)):
+        (tmp_path / name).write_text(script.format(jobs=jobs))
+        (tmp_path / name).chmod(0o755)
+
+    class Root():
+        path = local.path(str(tmp_path))
+
+    class Job(SlurmScheduledAction):
+        command = local[str(tmp_path / "sbatch")]
+
+        def make_prefix(self):
+            return "job.%d" % self.args_source[0]
+
+    actions = [Job([i], parent=Root()) for i in range(8)]
+    for action in actions:
+        action.prepare()
+
+    # polls within the SSH channels limit shared by all systems
+    runner = SystemsRunner(channels=1)
+    queue = SlurmQueue(local, max_jobs=4, poll_interval=0.01,
+                       retry_interval=0.02, channel=runner.channel)
+    squeue = local[str(tmp_path / "squeue")]
+    channels = []
+
+    def list_jobs():
+        channels.append(runner.used["channels"])
+        return squeue()
+    queue.squeue = list_jobs
+    with ProgressMonitor(io.StringIO(), interval=60) as monitor:
+        monitor.track(actions)
+        asyncio.run(queue.run(actions))
+    runner.shutdown()
+
+    # jobs gone from the queue: done, outcome left to `accounting`
+    assert(all(a.state == State.FINISHED for a in actions))
+    assert(monitor.counts[State.FINISHED] == 8 and monitor.cores == 0)
+    assert(monitor.status_line().startswith("8/8 done"))
+    assert(sorted(int(a.id) for a in actions) == list(range(1, 9)))
+    assert(queue.submitted == 8 and queue.rejected > 0)
+    # no logs left from the rejected attempts
+    assert(not any((a.path / "err.log").exists() for a in actions))
+    assert(set(discover(local, tmp_path, actions, seed=False)) ==
+           {"outputs"})
+    assert(not queue.jobs and not list(jobs.iterdir()))
+    assert(max(map(int, (tmp_path / "load").read_text().split())) <= 3)
+    assert(channels and set(channels) == {1})
+    assert(runner.used["channels"] == 0)
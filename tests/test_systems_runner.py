@@ -0,0 +1,51 @@
+import asyncio
+from plumbum import local
+from teff_py.actions import Action, State
+from teff_py.systems_runner import SystemsRunner
+
+
+class Step(Action):
+    command = local["true"]
+    log = []                    # (system, event, cores in use)
+
+    def __init__(self, system, cores):
+        super().__init__({"system": system})
+        self.num_mpi_procs = cores
+        self.state = State.PREPARED
+
+    async def run(self):
+        runner = self.args_source["system"].runner
+        self.log.append((self.args_source["system"].name, runner.used["cores"]))
+        await asyncio.sleep(0.01)
+        self.state = State.SUCCEEDED
+
+
+def test_systems_runner():
+    runner = SystemsRunner(cores=4)
+
+    async def workflow(system):
+        steps = [Step(system, 2) for _ in range(int(system.share) * 5)]
+        await asyncio.gather(*(system.execute(s) for s in steps))
+        return len(steps)
+
+    async def failing(system):
+        await system.execute(Step(system, 8))      # larger than the limit
+        raise RuntimeError("broken")
+
+    runner.add("huge", workflow, share=4)  # entitled to more, not to all
+    runner.add("small", workflow)
+    runner.add("failing", failing)
+
+    results = asyncio.run(runner.run())
+    runner.shutdown()
+
+    assert(results["huge"] == 20 and results["small"] == 5)
+    assert(isinstance(results["failing"], RuntimeError))
+    assert(runner.used["cores"] == 0)
+    assert(all(used <= 4 for name, used in Step.log if name != "failing"))
+
+    # the small system is not starved by the huge one
+    order = [name for name, _ in Step.log]
+    assert(order.index("small") < 4)
+    assert(max(i for i, name in enumerate(order) if name == "small") <
+           max(i for i, name in enumerate(order) if name == "huge"))
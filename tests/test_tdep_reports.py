@@ -0,0 +1,93 @@
+import numpy as np
+from plumbum import local
+from teff_py import tdep_utils
+from teff_py.logstore import SUFFIXES, write_log
+from teff_py.tdep_reports import OPENERS, collect_report
+from teff_py.remote_utils import RemoteReports
+
+FC_LOG = """\
+... solving for forceconstants
+REPORT GRADE OF OVERDETERMINATION (1 is exactly determined)
+   Number of forceconstants up 2. order:     12    equations:   1200   ratio:   100.000
+   Number of forceconstants up 3. order:     40    equations:   1200   ratio:    30.000
+ Interactions:
+   firstorder forceconstant:  0  0
+   secondorder forceconstant:  5  12
+   thirdorder forceconstant:  4  28
+   fourthorder forceconstant:  0  0
+ R^2 of the fit:
+   second order:   0.99876
+   third order:    0.87654
+ elastic constants (GPa):
+  110.0  60.0  60.0   0.0   0.0   0.0
+   60.0 110.0  60.0   0.0   0.0   0.0
+   60.0  60.0 110.0   0.0   0.0   0.0
+    0.0   0.0   0.0  30.0   0.0   0.0
+    0.0   0.0   0.0   0.0  30.0   0.0
+    0.0   0.0   0.0   0.0   0.0  30.0
+"""
+
+
+def test_reports_match_tdep_utils(tmp_path):
+    (tmp_path / "out.log").write_text(FC_LOG)
+    (tmp_path / "outfile.thermal_conductivity").write_text(
+        "# T kxx kyy\n300.0 236.5 236.5\n")
+    log = str(tmp_path / "out.log")
+
+    report = collect_report(str(tmp_path))
+    assert(report["overdetermination"] ==
+           tdep_utils.get_overdetermination_report(log))
+    assert(report["r_squared"] == tdep_utils.get_r_squared(log))
+    assert(report["interactions"] ==
+           {fc: tuple(map(int, v)) for fc, v in
+            tdep_utils.get_interactions(log).items()})
+    assert(np.array_equal(report["elastic_constants"],
+                          tdep_utils.get_elastic_constants(log)))
+    assert(report["thermal_conductivity"] == [[300.0, 236.5, 236.5]])
+
+    # the local machine stands in for a remote one
+    missing = str(tmp_path / "missing")
+    reports = RemoteReports(local, python="python3",
+                            script_dir=str(tmp_path)).collect(
+                                [str(tmp_path), missing])
+    remote_report = reports[str(tmp_path)]
+    assert(remote_report["r_squared"] == report["r_squared"])
+    assert(remote_report["overdetermination"] == {2: [12, 100.0],
+                                                  3: [40, 30.0]})
+    assert(remote_report["elastic_constants"] == report["elastic_constants"])
+    assert(reports[missing] == {})
+
+
+def test_compressed_logs(tmp_path):
+    assert(set(OPENERS) == set(SUFFIXES.values()))
+
+    write_log(str(tmp_path / "out.log.gz"), FC_LOG.splitlines(True))
+    report = collect_report(str(tmp_path))
+    assert(report["r_squared"] == {2: 0.99876, 3: 0.87654})
+
+
+def test_collect_reports(tmp_path):
+    for n in range(6):
+        path = tmp_path / ("forceconstants_%d" % n)
+        path.mkdir()
+        if n != 3:
+            (path / "out.log").write_text(FC_LOG)
+    (tmp_path / "forceconstants_5" / "out.log").write_text(
+        FC_LOG.replace("0.87654", "broken"))
+    # multi-temperature table: a record per temperature
+    (tmp_path / "forceconstants_0" / "outfile.thermal_conductivity"
+     ).write_text("# T kxx\n100.0 500.0\n200.0 250.0\n")
+    # one-column row: only this directory fails
+    (tmp_path / "forceconstants_1" / "outfile.thermal_conductivity"
+     ).write_text("300.0\n")
+
+    reports, failures = tdep_utils.collect_reports(
+        str(tmp_path / "forceconstants_*"), max_workers=2)
+
+    assert(len(reports) == 4)
+    assert(np.all(reports["overd_2"] == 100.0))
+    assert(np.all(reports["r_squared_3"] == 0.87654))
+    assert(list(reports["kappa"][:2]) == [500.0, 250.0])
+    assert(list(reports["temperature"][:2]) == [100.0, 200.0])
+    assert(np.all(np.isnan(reports["kappa"][2:])))
+    assert([p.split("_")[-1] for p, _ in failures] == ["1", "3", "5"])
@@ -0,0 +1,125 @@
+import itertools
+import numpy as np
+from teff_py.tdep_utils import (get_rcmax, read_ssposcar, get_shell_radii,
+                                get_max_mic_distance,
+                                find_max_rc2, find_rc3_list,
+                                read_forces, read_meta, read_forceconstant)
+
+
+def write_fcc_ssposcar(fname, n=3, alat=4.05):
+    "Write a cubic `n`x`n`x`n` fcc supercell in `infile.ssposcar` format."
+    basis = [(0, 0, 0), (0, .5, .5), (.5, 0, .5), (.5, .5, 0)]
+    coords = [((i + b[0]) / n, (j + b[1]) / n, (k + b[2]) / n)
+              for i, j, k in itertools.product(range(n), repeat=3)
+              for b in basis]
+    with open(fname, "w") as f:
+        f.write("fcc Al supercell\n%.8f\n" % alat)
+        for row in np.eye(3) * n:
+            f.write("%.8f %.8f %.8f\n" % tuple(row))
+        f.write("Al\n%d\nDirect coordinates\n" % len(coords))
+        for c in coords:
+            f.write("%.10f %.10f %.10f Al\n" % c)
+
+
+def brute_force_radii(cell, positions, cutoff, thr=1e-3):
+    images = np.array(list(itertools.product(range(-2, 3), repeat=3))) @ cell
+    diff = positions[None, :, None, :] + images[None, None, :, :] - \
+        positions[:, None, None, :]
+    dist = np.sqrt(np.sum(np.square(diff), axis=-1)).ravel()
+    return np.unique((dist[dist <= cutoff] + thr).round(decimals=5))
+
+
+def test_shell_radii(tmp_path):
+    fname = str(tmp_path / "infile.ssposcar")
+    write_fcc_ssposcar(fname)
+
+    cell, positions = read_ssposcar(fname)
+    assert(positions.shape == (108, 3))
+
+    rcmax = get_rcmax(fname)
+    radii = get_shell_radii(fname)
+    assert(np.allclose(radii, brute_force_radii(cell, positions, rcmax)))
+    # nearest neighbours of fcc sit at alat/sqrt(2)
+    assert(abs(radii[1] - 4.05 / np.sqrt(2) - 1e-3) < 1e-4)
+
+
+def mic_distances(cell, positions, thr=1e-3):
+    "Sorted unique minimum-image distances, as formerly read with ASE."
+    images = np.array(list(itertools.product(range(-1, 2), repeat=3))) @ cell
+    diff = positions[None, :, None, :] + images[None, None, :, :] - \
+        positions[:, None, None, :]
+    dist = np.sqrt(np.sum(np.square(diff), axis=-1)).min(axis=-1)
+    return np.unique((dist + thr).round(decimals=5))
+
+
+def test_max_rc2_regression(tmp_path):
+    fname = str(tmp_path / "infile.ssposcar")
+    write_fcc_ssposcar(fname, n=4)
+    cell, positions = read_ssposcar(fname)
+
+    # the former rc2 search over all minimum-image distances
+    distances = mic_distances(cell, positions)
+    half_distance = distances[-1] * 0.5 + 1e-3
+    i_old = 1
+    while distances[i_old] < half_distance:
+        i_old += 1
+
+    max_distance = get_max_mic_distance(fname)
+    assert(max_distance == distances[-1])
+    # half the cube diagonal of the 4 x 4.05 supercell
+    assert(abs(max_distance - 8.1 * np.sqrt(3) - 1e-3) < 1e-4)
+
+    radii = get_shell_radii(fname)
+    i_rc2 = find_max_rc2(radii, rc_limit=0.5 * max_distance + 1e-3)
+    assert(radii[i_rc2] == distances[i_old])
+
+
+def test_rc_windows():
+    radii = np.array([0.001, 1.0, 1.1, 1.5, 2.0, 2.05, 2.6, 3.0, 4.0, 6.0])
+
+    i_rc2 = find_max_rc2(radii)
+    assert(i_rc2 == 8)          # first shell above 6.0 / 2
+    assert(find_max_rc2(radii, rc_limit=100.0) == len(radii) - 1)
+
+    assert(find_rc3_list(radii, i_rc2, dist_thr=0.5) == [3, 5, 7])
+    assert(find_rc3_list(radii, 1) == [0])
+
+
+def test_sidecar_cache(tmp_path):
+    fname = tmp_path / "infile.forces"
+    forces = np.arange(2 * 4 * 3, dtype=float).reshape(2, 4, 3) / 7
+    np.savetxt(fname, forces.reshape(-1, 3))
+
+    first = read_forces(fname, natoms=4)
+    assert(np.allclose(first, forces))
+    assert((tmp_path / ".infile.forces.npy").exists())
+
+    second = read_forces(fname, natoms=4)
+    assert(isinstance(second.base, np.memmap))
+    assert(np.array_equal(first, second))
+
+    # a changed source invalidates the sidecar
+    np.savetxt(fname, forces.reshape(-1, 3)[:4])
+    assert(read_forces(fname).shape == (4, 3))
+
+    (tmp_path / "infile.meta").write_text("4 # atoms\n2 # confs\n1.0\n300\n")
+    assert(read_meta(tmp_path / "infile.meta") ==
+           {"natoms": 4, "nconfs": 2, "timestep": 1.0, "temperature": 300.0})
+
+
+def test_read_forceconstant(tmp_path):
+    fname = tmp_path / "outfile.forceconstant"
+    with open(fname, "w") as f:
+        f.write("  1 How many atoms per unit cell\n")
+        f.write("  5.0 Realspace cutoff (A)\n")
+        f.write("  2 How many neighbours does atom 1 have\n")
+        for j, lv in [(1, "0.0 0.0 0.0"), (1, "0.0 2.0 2.0")]:
+            f.write("  %d In the unit cell, what is the index\n" % j)
+            f.write("  %s In lattice vectors, what is the position\n" % lv)
+            f.write("  1.0 0.0 0.0\n  0.0 1.0 0.0\n  0.0 0.0 %.1f\n" % j)
+
+    fcs = read_forceconstant(fname)
+    assert(len(fcs) == 2)
+    assert(np.array_equal(fcs["lattice_vector"][1], [0.0, 2.0, 2.0]))
+    assert(np.array_equal(fcs["fc"][0], np.eye(3)))
+    assert(np.array_equal(read_forceconstant(fname), fcs))
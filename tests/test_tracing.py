@@ -0,0 +1,55 @@
+import json
+import pytest
+from plumbum import local
+from teff_py.actions import Action, State
+from teff_py.tracing import Tracer
+
+
+def test_trace_export(tmp_path):
+    class Root(Action):
+        command = local["ls"]
+
+        def make_path(self):
+            return local.path(tmp_path) / self.make_prefix()
+
+    class Child(Action):
+        command = local["ls"]
+
+    with Tracer() as tracer:
+        root = Root(["-a"])
+        root.prepare()
+        root.run()
+        child = Child(["-a"], parent=root)
+        child.prepare()
+        child.run()
+    assert(child.state == State.SUCCEEDED)
+
+    tracer.export(tmp_path / "wf.trace.json")
+    with open(tmp_path / "wf.trace.json") as f:
+        events = json.load(f)["traceEvents"]
+
+    spans = [(e["args"]["action"], e["name"]) for e in events
+             if e["ph"] == "X"]
+    assert(spans == [("root", "prepare"), ("root", "run"), ("root", "post"),
+                     ("child", "prepare"), ("child", "run"), ("child", "post")])
+    assert([e["ph"] for e in events if e.get("cat") == "link"] == ["s", "f"])
+    assert(all(e["dur"] >= 0 for e in events if e["ph"] == "X"))
+
+
+def test_post_span_closed_on_error(tmp_path):
+    class Broken(Action):
+        command = local["ls"]
+
+        def make_path(self):
+            return local.path(tmp_path) / self.make_prefix()
+
+    with Tracer() as tracer:
+        action = Broken([])
+        action.prepare()
+        action.log_compression = "unknown"      # log writing fails
+        with pytest.raises(KeyError):
+            action.run()
+
+    assert(not tracer._open)
+    assert([e["name"] for e in tracer.events if e["ph"] == "X"] ==
+           ["prepare", "run", "post"])